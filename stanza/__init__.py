@@ -1,5 +1,6 @@
 from stanza.pipeline.core import Pipeline
 from stanza.pipeline.multilingual import MultilingualPipeline
+from stanza.pipeline.pool import PipelinePool
 from stanza.models.common.doc import Document
 from stanza.resources.common import download
 from stanza.resources.installation import install_corenlp, download_corenlp_models
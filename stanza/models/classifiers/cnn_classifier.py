@@ -12,7 +12,7 @@ import stanza.models.classifiers.classifier_args as classifier_args
 import stanza.models.classifiers.data as data
 from stanza.models.common.vocab import PAD_ID, UNK_ID
 from stanza.models.common.data import get_long_tensor, sort_all
-from stanza.models.common.utils import split_into_batches, sort_with_indices, unsort
+from stanza.models.common.utils import inference_mode, split_into_batches, sort_with_indices, unsort
 # TODO: move CharVocab to common
 from stanza.models.pos.vocab import CharVocab
 
@@ -325,7 +325,7 @@ class CNNClassifier(nn.Module):
         #   depending on what other sentences are in its batch
         # we assume these effects are pretty minimal
         batch_indices = torch.tensor(batch_indices, requires_grad=False, device=device)
-        input_vectors = self.embedding(batch_indices)
+        input_vectors = self.embedding(batch_indices).float()
         # we use the random unk so that we are not necessarily
         # learning to match 0s for unk
         for phrase_num, sentence_unknowns in enumerate(batch_unknowns):
@@ -434,6 +434,7 @@ def load(filename, pretrain, charmodel_forward, charmodel_backward):
     return model
 
 
+@inference_mode()
 def label_text(model, text, batch_size=None, reverse_label_map=None, device=None):
     """
     Given a list of sentences, return the model's results on that text.
@@ -1,12 +1,37 @@
+from collections import namedtuple, OrderedDict
+import logging
+import os
+import threading
+
+import numpy as np
 import torch
 import torch.nn as nn
-from torch.nn.utils.rnn import pack_sequence, pad_packed_sequence, pack_padded_sequence, PackedSequence
+from torch.nn.utils.rnn import pack_sequence, pad_packed_sequence, pack_padded_sequence, pad_sequence, PackedSequence
 
-from stanza.models.common.packed_lstm import PackedLSTM
-from stanza.models.common.utils import tensor_unsort, unsort
+from stanza.models.common.data import get_long_tensor
+from stanza.models.common.packed_lstm import PackedLSTM, expand_initial_state, run_padded_lstm
+from stanza.models.common.utils import tensor_unsort, unsort, unsort_rows
 from stanza.models.common.dropout import SequenceUnitDropout
 from stanza.models.common.vocab import UNK_ID, CharVocab
 
+logger = logging.getLogger('stanza')
+
+# the charlm marks the start of a sentence with \n and the end of each word with a space
+CHARLM_START = "\n"
+CHARLM_END = " "
+
+# number of sentences a pipeline keeps the charlm outputs of
+DEFAULT_OUTPUT_CACHE_SIZE = 2000
+
+def words_to_sentences(word_reps, sentlens):
+    """
+    Turn one row per word, sentence after sentence, into a batch x max(sentlens) x dim tensor padded with zeros
+    """
+    positions = torch.arange(sentlens.max()).unsqueeze(0) < sentlens.unsqueeze(1)
+    padded = word_reps.new_zeros(positions.size(0) * positions.size(1), word_reps.size(1))
+    padded = padded.index_put((torch.nonzero(positions.view(-1)).squeeze(1).to(word_reps.device),), word_reps)
+    return padded.view(positions.size(0), positions.size(1), word_reps.size(1))
+
 class CharacterModel(nn.Module):
     def __init__(self, args, vocab, pad=False, bidirectional=False, attention=True):
         super().__init__()
@@ -56,6 +81,21 @@ class CharacterModel(nn.Module):
 
         return res
 
+    def predict_forward(self, chars, word_orig_idx, sentlens, wordlens):
+        """
+        The forward at inference time, with the word order and the lengths as tensors
+
+        Returns the representations of the words as a padded batch x max(sentlens) x dim tensor
+        """
+        embs = self.char_emb(chars)
+        hx = expand_initial_state(self.charlstm_h_init, self.charlstm_c_init, chars.size(0))
+        output, (h, c) = run_padded_lstm(self.charlstm, embs, wordlens, hx)
+        if self.attn:
+            res = (output * torch.sigmoid(self.char_attn(output))).sum(1)
+        else:
+            res = h[-2:].transpose(0, 1).contiguous().view(chars.size(0), -1)
+        return words_to_sentences(unsort_rows(res, word_orig_idx), sentlens)
+
 class CharacterLanguageModel(nn.Module):
 
     def __init__(self, args, vocab, pad=False, is_forward_lm=True):
@@ -65,6 +105,8 @@ class CharacterLanguageModel(nn.Module):
         self.is_forward_lm = is_forward_lm
         self.pad = pad
         self.finetune = True # always finetune unless otherwise specified
+        # a CharlmOutputCache, set when the charlm is shared by the processors of a pipeline
+        self.output_cache = None
 
         # char embeddings
         self.char_emb = nn.Embedding(len(self.vocab['char']), self.args['char_emb_dim'], padding_idx=None) # we use space as padding, so padding_idx is not necessary
@@ -81,6 +123,14 @@ class CharacterLanguageModel(nn.Module):
         self.char_dropout = SequenceUnitDropout(args.get('char_unit_dropout', 0), UNK_ID)
 
     def forward(self, chars, charlens, hidden=None):
+        output, hidden = self.encode(chars, charlens, hidden)
+        decoded = self.decoder(output)
+        return output, hidden, decoded
+
+    def encode(self, chars, charlens, hidden=None):
+        """
+        Run the LSTM over the chars without decoding the next character, which only training needs
+        """
         chars = self.char_dropout(chars)
         embs = self.dropout(self.char_emb(chars))
         batch_size = embs.size(0)
@@ -90,19 +140,130 @@ class CharacterLanguageModel(nn.Module):
                       self.charlstm_c_init.expand(self.args['char_num_layers'], batch_size, self.args['char_hidden_dim']).contiguous())
         output, hidden = self.charlstm(embs, charlens, hx=hidden)
         output = self.dropout(pad_packed_sequence(output, batch_first=True)[0])
-        decoded = self.decoder(output)
-        return output, hidden, decoded
+        return output, hidden
 
     def get_representation(self, chars, charoffsets, charlens, char_orig_idx):
+        if self.use_output_cache():
+            char_lists = [x[:length] for x, length in zip(chars.tolist(), charlens)]
+            res = self.build_char_representation(char_lists, charoffsets)
+        else:
+            with torch.no_grad():
+                output, _ = self.encode(chars, charlens)
+                res = [output[i, offsets] for i, offsets in enumerate(charoffsets)]
         with torch.no_grad():
-            output, _, _ = self.forward(chars, charlens)
-            res = [output[i, offsets] for i, offsets in enumerate(charoffsets)]
             res = unsort(res, char_orig_idx)
             res = pack_sequence(res)
             if self.pad:
                 res = pad_packed_sequence(res, batch_first=True)[0]
         return res
 
+    def predict_representation(self, chars, charoffsets, charlens, char_orig_idx, sentlens):
+        """
+        get_representation at inference time, with the offsets, lengths and order as tensors
+
+        charoffsets is padded with 0 to max(sentlens) offsets per sentence.
+        Returns a padded batch x max(sentlens) x dim tensor in the order
+        of the sentences, which is not padded with zeros.
+        """
+        if self.use_output_cache():
+            # the cache looks up python lists of the chars of each sentence
+            wordcounts = sentlens[char_orig_idx].tolist()
+            char_lists = [x[:length] for x, length in zip(chars.tolist(), charlens.tolist())]
+            offsets = [x[:count] for x, count in zip(charoffsets.tolist(), wordcounts)]
+            res = pad_sequence(self.build_char_representation(char_lists, offsets), batch_first=True)
+        else:
+            output, _ = self.encode(chars, charlens)
+            res = output.gather(1, charoffsets.unsqueeze(2).expand(-1, -1, output.size(2)).to(output.device))
+        return unsort_rows(res, char_orig_idx)
+
+    def use_output_cache(self):
+        # outputs made in inference mode can't be used where autograd is on,
+        # so the cache is only used when autograd is off.  A traced graph
+        # has to run the charlm itself
+        return self.output_cache is not None and not torch.is_grad_enabled() and not torch.jit.is_tracing()
+
+    def pad_id(self):
+        return self.vocab['char'].unit2id(CHARLM_END)
+
+    def build_char_representation(self, chars, offsets):
+        """
+        Run the charlm over lists of char ids and return its outputs at the given offsets
+
+        chars: a list of lists of char ids, in any order
+        offsets: for each list of chars, the positions of the outputs to return
+
+        Returns a list of len(offsets[i]) x hidden_dim tensors.  When the
+        output cache is in use, sequences which were already run, possibly
+        with less padding at the end, are not run again.
+        """
+        cache = self.output_cache if self.use_output_cache() else None
+        pad_id = self.pad_id()
+
+        results = [None] * len(chars)
+        pending = []
+        for idx, (seq, seq_offsets) in enumerate(zip(chars, offsets)):
+            entry, length = cache.lookup(seq, pad_id) if cache is not None else (None, 0)
+            if entry is not None:
+                seq_offsets = np.asarray(seq_offsets, dtype=np.int64)
+                known = seq_offsets < length
+                if (entry.rows[seq_offsets[known]] < 0).any():
+                    # an output which the cache did not keep
+                    entry, length = None, 0
+                elif length == len(seq):
+                    results[idx] = entry.outputs[torch.from_numpy(entry.rows[seq_offsets])]
+                    continue
+            pending.append((idx, entry, length))
+
+        if pending:
+            with torch.no_grad():
+                self._run_pending(chars, offsets, pending, cache, results)
+        return results
+
+    def _run_pending(self, chars, offsets, pending, cache, results):
+        """
+        Run the charlm over the parts of the sequences which are not cached
+        """
+        pad_id = self.pad_id()
+        # pack_padded_sequence wants the longest sequence first
+        pending.sort(key=lambda x: len(chars[x[0]]) - x[2], reverse=True)
+        inputs = [chars[idx][length:] for idx, _, length in pending]
+        input_lens = [len(x) for x in inputs]
+        device = self.charlstm_h_init.device
+        input_chars = get_long_tensor(inputs, len(inputs), pad_id=pad_id).to(device=device)
+
+        # a continued sequence starts from the final state of its cached prefix
+        hidden = (torch.cat([entry.hidden[0] if entry is not None else self.charlstm_h_init
+                             for _, entry, _ in pending], dim=1).contiguous(),
+                  torch.cat([entry.hidden[1] if entry is not None else self.charlstm_c_init
+                             for _, entry, _ in pending], dim=1).contiguous())
+        output, (h_n, c_n) = self.encode(input_chars, input_lens, hidden)
+
+        for batch_idx, (idx, entry, length) in enumerate(pending):
+            seq = chars[idx]
+            seq_output = output[batch_idx, :input_lens[batch_idx]]
+            seq_offsets = np.asarray(offsets[idx], dtype=np.int64)
+            if entry is None:
+                results[idx] = seq_output[torch.from_numpy(seq_offsets)]
+            else:
+                known = seq_offsets < length
+                rows = np.where(known, entry.rows[np.minimum(seq_offsets, length - 1)], len(entry.outputs) + seq_offsets - length)
+                results[idx] = torch.cat([entry.outputs, seq_output])[torch.from_numpy(rows)]
+
+            if cache is not None:
+                # only the outputs at the ends of words are kept
+                new_positions = np.flatnonzero(np.asarray(seq[length:]) == pad_id)
+                new_rows = np.full(len(seq) - length, -1, dtype=np.int64)
+                new_outputs = seq_output[torch.from_numpy(new_positions)]
+                if entry is None:
+                    new_rows[new_positions] = np.arange(len(new_positions))
+                    rows = new_rows
+                    outputs = new_outputs
+                else:
+                    new_rows[new_positions] = np.arange(len(new_positions)) + len(entry.outputs)
+                    rows = np.concatenate([entry.rows, new_rows])
+                    outputs = torch.cat([entry.outputs, new_outputs])
+                cache.add(seq, CharlmOutputs(outputs, rows, (h_n[:, batch_idx:batch_idx+1, :], c_n[:, batch_idx:batch_idx+1, :])))
+
     def hidden_dim(self):
         return self.args['char_hidden_dim']
 
@@ -139,3 +300,103 @@ class CharacterLanguageModel(nn.Module):
         model.eval()
         model.finetune = finetune # set finetune status
         return model
+
+
+# outputs: the outputs of a charlm at the ends of words, n x hidden_dim
+# rows: for each position in the sequence, its row in outputs, or -1 if it was not kept
+# hidden: the final (h, c) of the charlm
+CharlmOutputs = namedtuple('CharlmOutputs', ['outputs', 'rows', 'hidden'])
+
+class CharlmOutputCache:
+    """
+    A thread-safe LRU cache of charlm outputs, keyed by the sequence of char ids
+
+    NER, sentiment and constituency all run the same charlm over the
+    same sentences.  The sentiment classifier pads the end of each
+    sentence, so a sequence which is a cached sequence followed by more
+    padding reuses the cached part and only runs the charlm over the
+    padding.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, chars, pad_id):
+        """
+        Return (entry, length) for the longest cached prefix of chars which only leaves off padding
+
+        Returns (None, 0) if there is no such prefix
+        """
+        length = len(chars)
+        with self._lock:
+            while length > 0:
+                key = tuple(chars[:length])
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry, length
+                # a prefix must still end with the end of a word
+                if length < 2 or chars[length-1] != pad_id or chars[length-2] != pad_id:
+                    break
+                length -= 1
+        return None, 0
+
+    def add(self, chars, entry):
+        key = tuple(chars)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __deepcopy__(self, memo):
+        # a copy of a model, such as for export, starts with an empty cache
+        return CharlmOutputCache(self.max_size)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SharedCharlms:
+    """
+    The charlms used by the processors of one pipeline
+
+    NER, sentiment and constituency models often use the same charlm
+    files.  Each file is only loaded once, and if cache_size is more
+    than 0, each model keeps an output cache of up to cache_size
+    sentences, so the processors reuse each other's charlm outputs.
+    """
+    def __init__(self, cache_size=0):
+        self.cache_size = cache_size
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, filename):
+        key = os.path.realpath(filename)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = CharacterLanguageModel.load(filename, finetune=False)
+                if self.cache_size > 0:
+                    model.output_cache = CharlmOutputCache(self.cache_size)
+                self._models[key] = model
+            else:
+                logger.debug("Reusing already loaded charlm for %s", filename)
+        return model
+
+    def clear_caches(self):
+        """
+        Drop the cached outputs, such as once a document is finished
+        """
+        with self._lock:
+            models = list(self._models.values())
+        for model in models:
+            if model.output_cache is not None:
+                model.output_cache.clear()
+
+    def __len__(self):
+        return len(self._models)
@@ -3,46 +3,70 @@
 import numpy as np
 
 def tarjan(tree):
-    """"""
+    """
+    Find the cycles in a tree given as an array of heads
 
-    indices = -np.ones_like(tree)
-    lowlinks = -np.ones_like(tree)
-    onstack = np.zeros_like(tree, dtype=bool)
-    stack = list()
-    _index = [0]
+    This is Tarjan's strongly connected components algorithm, written
+    iteratively so that long sentences cannot hit the recursion limit.
+    The nodes are visited in the same order as the recursive version,
+    so the cycles are returned in the same order as well.
+    """
+    n = len(tree)
+    indices = [-1] * n
+    lowlinks = [-1] * n
+    onstack = [False] * n
+    stack = []
     cycles = []
-    #-------------------------------------------------------------
-    def strong_connect(i):
-        _index[0] += 1
-        index = _index[-1]
-        indices[i] = lowlinks[i] = index - 1
-        stack.append(i)
-        onstack[i] = True
-        dependents = np.where(np.equal(tree, i))[0]
-        for j in dependents:
-            if indices[j] == -1:
-                strong_connect(j)
-                lowlinks[i] = min(lowlinks[i], lowlinks[j])
-            elif onstack[j]:
-                lowlinks[i] = min(lowlinks[i], indices[j])
-
-        # There's a cycle!
-        if lowlinks[i] == indices[i]:
-            cycle = np.zeros_like(indices, dtype=bool)
-            while stack[-1] != i:
-                j = stack.pop()
-                onstack[j] = False
-                cycle[j] = True
-            stack.pop()
-            onstack[i] = False
-            cycle[i] = True
-            if cycle.sum() > 1:
-                cycles.append(cycle)
-        return
-    #-------------------------------------------------------------
-    for i in range(len(tree)):
-        if indices[i] == -1:
-            strong_connect(i)
+
+    # dependents of each node in increasing order, computed once instead of an np.where per node
+    order = np.argsort(tree, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(np.bincount(tree, minlength=n))]).tolist()
+    order = order.tolist()
+    dependents = [order[starts[i]:starts[i+1]] for i in range(n)]
+
+    index = 0
+    for root in range(n):
+        if indices[root] != -1:
+            continue
+        indices[root] = lowlinks[root] = index
+        index += 1
+        stack.append(root)
+        onstack[root] = True
+        # each entry is a node and the position of the next dependent to visit
+        work = [[root, 0]]
+        while work:
+            frame = work[-1]
+            i = frame[0]
+            if frame[1] < len(dependents[i]):
+                j = dependents[i][frame[1]]
+                frame[1] += 1
+                if indices[j] == -1:
+                    indices[j] = lowlinks[j] = index
+                    index += 1
+                    stack.append(j)
+                    onstack[j] = True
+                    work.append([j, 0])
+                elif onstack[j]:
+                    lowlinks[i] = min(lowlinks[i], indices[j])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlinks[parent] = min(lowlinks[parent], lowlinks[i])
+
+            # There's a cycle!
+            if lowlinks[i] == indices[i]:
+                cycle = np.zeros(n, dtype=bool)
+                while stack[-1] != i:
+                    j = stack.pop()
+                    onstack[j] = False
+                    cycle[j] = True
+                stack.pop()
+                onstack[i] = False
+                cycle[i] = True
+                if cycle.sum() > 1:
+                    cycles.append(cycle)
     return cycles
 
 def chuliu_edmonds(scores):
@@ -161,3 +185,49 @@ def chuliu_edmonds_one_root(scores):
             f.write('{}: {}, {}, {}\n'.format(_tree, _scores, tree_probs, tree_score))
         raise
     return best_tree
+
+#===============================================================
+def chuliu_edmonds_one_root_batch(scores, lengths):
+    """
+    Decode a whole padded batch of score matrices at once
+
+    scores is batch x max_len x max_len, with scores[b, dep, head],
+    and lengths gives the size of each matrix including the root.
+
+    Most predicted trees are already valid: the greedy argmax has no
+    cycles and a single word attached to the root.  That case is checked
+    for the whole batch at once, and only the remaining sentences are sent
+    through chuliu_edmonds_one_root.  The results are identical to calling
+    chuliu_edmonds_one_root on each sentence.
+    """
+    scores = np.array(scores, dtype=np.float64)
+    batch_size, max_len, _ = scores.shape
+    lengths = np.asarray(lengths)
+
+    positions = np.arange(max_len)
+    padding = positions[None, :] >= lengths[:, None]
+    greedy = scores.copy()
+    greedy[:, positions, positions] = -np.inf
+    greedy[:, 0, :] = -np.inf
+    greedy[:, 0, 0] = 0
+    greedy = np.where(padding[:, None, :], -np.inf, greedy)
+    trees = np.argmax(greedy, axis=2)
+    # padding nodes attach to the root so that they cannot form cycles
+    trees[padding] = 0
+
+    # the tree has no cycles iff every node eventually reaches the root.
+    # each step doubles the length of the path followed, so
+    # log2(max_len) steps are enough to walk the longest possible path
+    ancestors = trees
+    for _ in range(max(1, int(np.ceil(np.log2(max_len))) + 1)):
+        ancestors = np.take_along_axis(ancestors, ancestors, axis=1)
+    acyclic = (ancestors == 0).all(axis=1)
+    one_root = (trees[:, 1:] == 0).sum(axis=1) - padding[:, 1:].sum(axis=1) == 1
+
+    results = []
+    for b, length in enumerate(lengths):
+        if acyclic[b] and one_root[b]:
+            results.append(trees[b, :length])
+        else:
+            results.append(chuliu_edmonds_one_root(scores[b, :length, :length]))
+    return results
@@ -0,0 +1,558 @@
+"""
+An opt-in columnar Document, which keeps the annotations of a large batch in NumPy arrays
+
+Document creates a Sentence, Token and Word object with its own
+__dict__ for every unit.  ColumnarDocument keeps one array per field
+instead.  Strings such as the upos, xpos, feats and deprel are int32
+ids into a table of the distinct strings, and the ids, heads and
+character offsets are int32s, with -1 for None.  Sentences, tokens and
+words are views which are created on access and read and write the
+columns, so they have the same attributes as their Document
+counterparts, and get and set read and write whole columns.
+
+A ColumnarDocument has no change tracking, entities, sentiment or
+constituency trees, and the processors of a Pipeline still take a
+Document, so convert with from_document and to_document around them.
+"""
+
+from array import array
+from collections.abc import Sequence
+import json
+
+import numpy as np
+
+from stanza.models.common.doc import Document, Word, multi_word_token_misc
+from stanza.models.common.doc import ID, TEXT, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC, NER, START_CHAR, END_CHAR, TOKENS, WORDS
+
+# Word.pos is an alias of Word.upos
+FIELD_ALIASES = {'pos': UPOS}
+
+WORD_FIELDS = (ID, TEXT, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC, START_CHAR, END_CHAR)
+TOKEN_FIELDS = (ID, TEXT, NER, MISC, START_CHAR, END_CHAR)
+# as with Word and Token, the ids and character offsets are fixed when the document is built
+READONLY_FIELDS = (ID, START_CHAR, END_CHAR)
+
+class StringColumn:
+    """
+    A column of strings, kept as int32 ids into a table of the distinct strings, with -1 for None
+    """
+    __slots__ = ('ids', 'values', 'index')
+
+    def __init__(self):
+        # an array while the document is being built, then an np.ndarray
+        self.ids = array('i')
+        self.values = []
+        self.index = {}
+
+    def lookup(self, value):
+        """ The id of value, which is added to the table if it is new """
+        if value is None:
+            return -1
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def append(self, value):
+        self.ids.append(self.lookup(value))
+
+    def finish(self):
+        self.ids = np.array(self.ids, dtype=np.int32)
+
+    def __getitem__(self, idx):
+        value_id = self.ids[idx]
+        return None if value_id < 0 else self.values[value_id]
+
+    def __setitem__(self, idx, value):
+        self.ids[idx] = self.lookup(value)
+
+    def read(self):
+        """ All of the values, as a list """
+        # the None at the end of the table is what an id of -1 picks out
+        table = np.empty(len(self.values) + 1, dtype=object)
+        table[:-1] = self.values
+        return table[self.ids].tolist()
+
+    def write(self, values):
+        """ Replace all of the values """
+        self.ids = np.fromiter((self.lookup(value) for value in values), dtype=np.int32, count=len(values))
+
+class IntColumn:
+    """
+    A column of ints, kept as int32s, with -1 for None
+    """
+    __slots__ = ('values',)
+
+    def __init__(self):
+        # an array while the document is being built, then an np.ndarray
+        self.values = array('i')
+
+    def append(self, value):
+        self.values.append(-1 if value is None else value)
+
+    def finish(self):
+        self.values = np.array(self.values, dtype=np.int32)
+
+    def __getitem__(self, idx):
+        value = int(self.values[idx])
+        return None if value < 0 else value
+
+    def __setitem__(self, idx, value):
+        self.values[idx] = -1 if value is None else value
+
+    def read(self):
+        """ All of the values, as a list """
+        values = self.values.astype(object)
+        values[self.values < 0] = None
+        return values.tolist()
+
+    def write(self, values):
+        """ Replace all of the values """
+        self.values = np.array([-1 if value is None else value for value in values], dtype=np.int32)
+
+class TokenIdColumn:
+    """
+    The ids of the tokens, which are tuples of one id, or of the first and last id of a multi-word token
+    """
+    __slots__ = ('first', 'last')
+
+    def __init__(self):
+        self.first = IntColumn()
+        self.last = IntColumn()
+
+    def append(self, value):
+        self.first.append(value[0])
+        self.last.append(value[-1] if len(value) > 1 else None)
+
+    def finish(self):
+        self.first.finish()
+        self.last.finish()
+
+    def __getitem__(self, idx):
+        last = self.last[idx]
+        return (self.first[idx],) if last is None else (self.first[idx], last)
+
+    def read(self):
+        """ All of the values, as a list """
+        return [(first,) if last is None else (first, last) for first, last in zip(self.first.read(), self.last.read())]
+
+def split_misc(misc, keys):
+    """
+    The values of keys in a misc string, and the misc string without them, as with init_from_misc
+    """
+    values = {}
+    remaining = []
+    for item in misc.split('|'):
+        key_value = item.split('=', 1)
+        if len(key_value) == 2 and key_value[0] in keys:
+            key, value = key_value
+            values[key] = int(value) if key in (START_CHAR, END_CHAR) else value
+        else:
+            remaining.append(item)
+    return values, "|".join(remaining)
+
+def is_null(value):
+    return (value is None) or (value == '_')
+
+class UnitViews(Sequence):
+    """
+    The sentences, tokens or words from start to end of a ColumnarDocument, as views created on access
+    """
+    __slots__ = ('_doc', '_view_class', '_start', '_end')
+
+    def __init__(self, doc, view_class, start, end):
+        self._doc = doc
+        self._view_class = view_class
+        self._start = start
+        self._end = end
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[x] for x in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("%s index out of range" % self._view_class.__name__)
+        return self._view_class(self._doc, self._start + idx)
+
+    def __iter__(self):
+        for idx in range(self._start, self._end):
+            yield self._view_class(self._doc, idx)
+
+class UnitView:
+    """
+    A sentence, token or word of a ColumnarDocument, which is the document and an index
+    """
+    __slots__ = ('_doc', '_index')
+
+    def __init__(self, doc, index):
+        self._doc = doc
+        self._index = index
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._doc is other._doc and self._index == other._index
+
+    def __hash__(self):
+        return hash((type(self), id(self._doc), self._index))
+
+    def __repr__(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+def column_property(units, field, readonly=False):
+    """
+    A property of a token or word view which reads and writes field of its row in the columns of units
+    """
+    def getter(self):
+        return self._doc._columns[units][field][self._index]
+
+    def setter(self, value):
+        if readonly:
+            raise ValueError(f'Property "{field}" of "{self.__class__.__name__}" is read-only.')
+        self._doc._set_value(units, field, self._index, value)
+
+    return property(getter, setter)
+
+class ColumnarWord(UnitView):
+    """ A view of one word of a ColumnarDocument, with the attributes of a Word """
+    __slots__ = ()
+
+    id = column_property(WORDS, ID, readonly=True)
+    text = column_property(WORDS, TEXT)
+    lemma = column_property(WORDS, LEMMA)
+    upos = column_property(WORDS, UPOS)
+    pos = upos
+    xpos = column_property(WORDS, XPOS)
+    feats = column_property(WORDS, FEATS)
+    head = column_property(WORDS, HEAD)
+    deprel = column_property(WORDS, DEPREL)
+    deps = column_property(WORDS, DEPS)
+    misc = column_property(WORDS, MISC)
+    start_char = column_property(WORDS, START_CHAR, readonly=True)
+    end_char = column_property(WORDS, END_CHAR, readonly=True)
+
+    @property
+    def parent(self):
+        """ Access the token this word is part of. """
+        return ColumnarToken(self._doc, int(self._doc._word_token[self._index]))
+
+    @property
+    def sent(self):
+        """ Access the sentence this word is part of. """
+        return ColumnarSentence(self._doc, int(np.searchsorted(self._doc._sentence_words, self._index, side='right')) - 1)
+
+    def to_dict(self, fields=WORD_FIELDS):
+        """ Dumps the word into a dictionary. """
+        return Word.to_dict(self, fields)
+
+    def pretty_print(self):
+        """ Print the word in one line. """
+        return Word.pretty_print(self)
+
+class ColumnarToken(UnitView):
+    """ A view of one token of a ColumnarDocument, with the attributes of a Token """
+    __slots__ = ()
+
+    id = column_property(TOKENS, ID, readonly=True)
+    text = column_property(TOKENS, TEXT)
+    misc = column_property(TOKENS, MISC)
+    ner = column_property(TOKENS, NER)
+    start_char = column_property(TOKENS, START_CHAR, readonly=True)
+    end_char = column_property(TOKENS, END_CHAR, readonly=True)
+
+    @property
+    def words(self):
+        """ Access the words of this token. """
+        token_words = self._doc._token_words
+        return UnitViews(self._doc, ColumnarWord, int(token_words[self._index]), int(token_words[self._index + 1]))
+
+    @property
+    def sent(self):
+        """ Access the sentence this token is part of. """
+        return ColumnarSentence(self._doc, int(np.searchsorted(self._doc._sentence_tokens, self._index, side='right')) - 1)
+
+    def to_dict(self, fields=TOKEN_FIELDS):
+        """ Dumps the token into a list of dictionary for this token with its extended words. """
+        ret = []
+        token_id = self.id
+        if len(token_id) > 1:
+            ret.append({field: getattr(self, field) for field in fields if getattr(self, field) is not None})
+        ner = self.ner if len(token_id) == 1 and NER in fields else None
+        for word in self.words:
+            word_dict = word.to_dict()
+            if ner is not None:
+                word_dict[NER] = ner
+            ret.append(word_dict)
+        return ret
+
+    def pretty_print(self):
+        """ Print this token with its extended words in one line. """
+        return f"<{self.__class__.__name__} id={'-'.join([str(x) for x in self.id])};words=[{', '.join([word.pretty_print() for word in self.words])}]>"
+
+class ColumnarSentence(UnitView):
+    """ A view of one sentence of a ColumnarDocument """
+    __slots__ = ()
+
+    @property
+    def doc(self):
+        """ Access the document this sentence is part of. """
+        return self._doc
+
+    @property
+    def id(self):
+        """ Access the index of this sentence in its document. """
+        return self._index
+
+    @property
+    def tokens(self):
+        """ Access the tokens of this sentence. """
+        sentence_tokens = self._doc._sentence_tokens
+        return UnitViews(self._doc, ColumnarToken, int(sentence_tokens[self._index]), int(sentence_tokens[self._index + 1]))
+
+    @property
+    def words(self):
+        """ Access the words of this sentence. """
+        sentence_words = self._doc._sentence_words
+        return UnitViews(self._doc, ColumnarWord, int(sentence_words[self._index]), int(sentence_words[self._index + 1]))
+
+    @property
+    def text(self):
+        """ Access the raw text of this sentence, if the document has its raw text and character offsets. """
+        tokens = self.tokens
+        if self._doc.text is None or len(tokens) == 0:
+            return None
+        start_char, end_char = tokens[0].start_char, tokens[-1].end_char
+        if start_char is None or end_char is None:
+            return None
+        return self._doc.text[start_char:end_char]
+
+    @property
+    def dependencies(self):
+        """ Access the (head, deprel, word) dependencies of this sentence, which are empty if it is not parsed. """
+        words = self.words
+        if any(word.head is None or word.deprel is None for word in words):
+            return []
+        if len(words) < len(self.tokens) or len(words) == 0 or words[-1].id != len(words):
+            return []
+        root = Word({ID: 0, TEXT: "ROOT"})
+        return [(root if word.head == 0 else words[word.head - 1], word.deprel, word) for word in words]
+
+    def dependencies_string(self):
+        """ Dump the dependencies for this sentence into string. """
+        return "\n".join(str((word.text, head.id, deprel)) for head, deprel, word in self.dependencies)
+
+    def to_dict(self):
+        """ Dumps the sentence into a list of dictionary for each token in the sentence. """
+        ret = []
+        for token in self.tokens:
+            ret += token.to_dict()
+        return ret
+
+class ColumnarDocument:
+    """
+    A document which keeps the fields of its tokens and words in one NumPy array per field
+
+    Built from the same list of sentences of CoNLL-U dicts as a
+    Document, or from a Document with from_document.  The raw arrays
+    are available from column, for example the int32 upos ids of
+    every word are column('upos').ids, and the upos they stand for are
+    column('upos').values.
+    """
+
+    def __init__(self, sentences, text=None):
+        """ Construct a document given a list of sentences in the form of lists of CoNLL-U dicts.
+
+        Args:
+            sentences: a list of sentences, which being a list of token entry, in the form of a CoNLL-U dict.
+            text: the raw text of the document.
+        """
+        self.text = text
+        self.lang = None
+
+        self._columns = {
+            WORDS: {ID: IntColumn(), TEXT: StringColumn(), LEMMA: StringColumn(), UPOS: StringColumn(), XPOS: StringColumn(),
+                    FEATS: StringColumn(), HEAD: IntColumn(), DEPREL: StringColumn(), DEPS: StringColumn(), MISC: StringColumn(),
+                    START_CHAR: IntColumn(), END_CHAR: IntColumn()},
+            TOKENS: {ID: TokenIdColumn(), TEXT: StringColumn(), NER: StringColumn(), MISC: StringColumn(),
+                     START_CHAR: IntColumn(), END_CHAR: IntColumn()},
+        }
+        # the token of each word, and the first token and word of each sentence and the first word of each token.
+        # the offsets have one more entry than there are units, for the end of the last one
+        word_token = array('i')
+        sentence_tokens = array('i', [0])
+        sentence_words = array('i', [0])
+        token_words = array('i', [0])
+        for entries in sentences:
+            self._add_sentence(entries, word_token, token_words)
+            sentence_tokens.append(len(token_words) - 1)
+            sentence_words.append(len(word_token))
+
+        self._word_token = np.array(word_token, dtype=np.int32)
+        self._sentence_tokens = np.array(sentence_tokens, dtype=np.int32)
+        self._sentence_words = np.array(sentence_words, dtype=np.int32)
+        self._token_words = np.array(token_words, dtype=np.int32)
+        for columns in self._columns.values():
+            for column in columns.values():
+                column.finish()
+
+    def _add_sentence(self, entries, word_token, token_words):
+        """
+        Add the tokens and words of one sentence, in the same way that a Sentence does
+        """
+        word_columns = self._columns[WORDS]
+        token_columns = self._columns[TOKENS]
+        mwt_end = -1
+        for i, entry in enumerate(entries):
+            entry_id = entry.get(ID, (i+1, ))
+            if isinstance(entry_id, int):
+                entry_id = (entry_id, )
+            misc = entry.get(MISC, None)
+            is_mwt = len(entry_id) > 1 or (misc is not None and multi_word_token_misc.match(misc))
+            if is_mwt and len(entry_id) > 1:
+                mwt_end = entry_id[1]
+
+            if is_mwt or entry_id[0] > mwt_end:
+                assert entry_id and entry.get(TEXT), 'id and text should be included for the token'
+                values = {}
+                if misc is not None:
+                    values, misc = split_misc(misc, (NER, START_CHAR, END_CHAR))
+                token_columns[ID].append(entry_id)
+                token_columns[TEXT].append(entry[TEXT])
+                token_columns[MISC].append(misc)
+                for field in (NER, START_CHAR, END_CHAR):
+                    token_columns[field].append(values.get(field, entry.get(field, None)))
+                token_words.append(token_words[-1])
+            if is_mwt:
+                continue
+
+            assert entry.get(TEXT) is not None, 'id and text should be included for the word. {}'.format(entry)
+            values = {}
+            misc = entry.get(MISC, None)
+            if misc is not None:
+                values, misc = split_misc(misc, (START_CHAR, END_CHAR))
+            word_columns[ID].append(entry_id[0])
+            word_columns[MISC].append(misc)
+            for field in (TEXT, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, START_CHAR, END_CHAR):
+                word_columns[field].append(values.get(field, entry.get(field, None)))
+            word_token.append(len(token_words) - 2)
+            token_words[-1] += 1
+
+    @classmethod
+    def from_document(cls, doc):
+        """ Build a ColumnarDocument with the tokens and words of a Document """
+        return cls((sentence.to_dict() for sentence in doc.sentences), doc.text)
+
+    def to_document(self):
+        """ Build a Document with the tokens and words of this document """
+        doc = Document(self.to_dict(), self.text)
+        doc.lang = self.lang
+        return doc
+
+    @property
+    def sentences(self):
+        """ Access the sentences of this document. """
+        return UnitViews(self, ColumnarSentence, 0, len(self._sentence_tokens) - 1)
+
+    @property
+    def num_tokens(self):
+        """ Access the number of tokens for this document. """
+        return len(self._token_words) - 1
+
+    @property
+    def num_words(self):
+        """ Access the number of words for this document. """
+        return len(self._word_token)
+
+    def iter_words(self):
+        """ An iterator that returns all of the words in this Document. """
+        return iter(UnitViews(self, ColumnarWord, 0, self.num_words))
+
+    def iter_tokens(self):
+        """ An iterator that returns all of the tokens in this Document. """
+        return iter(UnitViews(self, ColumnarToken, 0, self.num_tokens))
+
+    def column(self, field, from_token=False):
+        """ The column of field for the words, or the tokens if from_token """
+        units = TOKENS if from_token else WORDS
+        field = FIELD_ALIASES.get(field, field)
+        if field not in self._columns[units]:
+            raise ValueError("ColumnarDocument has no %s field %s.  Known fields: %s" % (units[:-1], field, ", ".join(self._columns[units])))
+        return self._columns[units][field]
+
+    def get(self, fields, as_sentences=False, from_token=False):
+        """ Get fields from a list of field names, as with Document.get, reading whole columns at once.
+
+        Args:
+            fields: name of the fields as a list or a single string
+            as_sentences: if True, return the fields as a list of sentences; otherwise as a whole list
+            from_token: if True, get the fields from the tokens; otherwise from the words
+
+        Returns:
+            All requested fields.
+        """
+        if isinstance(fields, str):
+            fields = [fields]
+        assert isinstance(fields, list), "Must provide field names as a list."
+        assert len(fields) >= 1, "Must have at least one field."
+
+        columns = [self.column(field, from_token).read() for field in fields]
+        results = columns[0] if len(fields) == 1 else [list(x) for x in zip(*columns)]
+        if as_sentences:
+            offsets = (self._sentence_tokens if from_token else self._sentence_words).tolist()
+            results = [results[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        return results
+
+    def set(self, fields, contents, to_token=False):
+        """Set fields based on contents, as with Document.set, writing whole columns at once.
+
+        Args:
+            fields: name of the fields as a list or a single string
+            contents: field values to set; total length should be equal to number of words/tokens
+            to_token: if True, set field values to tokens; otherwise to words
+        """
+        if isinstance(fields, str):
+            fields = [fields]
+        assert isinstance(fields, (tuple, list)), "Must provide field names as a list."
+        assert isinstance(contents, (tuple, list)), "Must provide contents as a list (one item per line)."
+        assert len(fields) >= 1, "Must have at least one field."
+        assert (to_token and self.num_tokens == len(contents)) or self.num_words == len(contents), \
+            "Contents must have the same length as the original file."
+
+        units = TOKENS if to_token else WORDS
+        for idx, field in enumerate(fields):
+            values = contents if len(fields) == 1 else [content[idx] for content in contents]
+            field = FIELD_ALIASES.get(field, field)
+            self.column(field, to_token).write(self._clean_values(units, field, values))
+
+    def _set_value(self, units, field, index, value):
+        self.column(field, units == TOKENS)[index] = self._clean_values(units, field, [value], index)[0]
+
+    def _clean_values(self, units, field, values, index=None):
+        """
+        Check that field can be set, and turn the values into what a Word or Token setter would store
+
+        index is the row of a single value, or None for a whole column
+        """
+        if field in READONLY_FIELDS:
+            raise ValueError("Field %s of the %s of a ColumnarDocument is read-only." % (field, units))
+        if field == TEXT:
+            return values
+        if field == HEAD:
+            return [None if is_null(value) else int(value) for value in values]
+        if field == LEMMA:
+            # as with Word.lemma, a lemma of _ is kept for a word which is _
+            text = self.column(TEXT)
+            texts = text.read() if index is None else [text[index]]
+            return [None if is_null(value) and text != '_' else value for value, text in zip(values, texts)]
+        return [None if is_null(value) else value for value in values]
+
+    def to_dict(self):
+        """ Dumps the whole document into a list of list of dictionary for each token in each sentence in the doc. """
+        return [sentence.to_dict() for sentence in self.sentences]
+
+    def __repr__(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
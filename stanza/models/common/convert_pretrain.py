@@ -9,22 +9,40 @@ As a concrete example, you can convert a newly downloaded Faroese WV file as fol
 or save part of an Icelandic WV file:
   python3 stanza/models/common/convert_pretrain.py ~/stanza/saved_models/pos/is_icepahc.pretrain.pt ~/extern_data/wordvec/fasttext/icelandic.cc.is.300.vec 150000
 Note that if the pretrain already exists, nothing will be changed.  It will not overwrite an existing .pt file.
+
+If the output file ends with .npy, the pretrain is saved in the memory mapped format instead,
+with the vocab in a .vocab.json file next to it.  The input can then also be an existing .pt pretrain:
+  python3 stanza/models/common/convert_pretrain.py ~/stanza_resources/en/pretrain/ewt.npy ~/stanza_resources/en/pretrain/ewt.pt
+Use --dtype float16 to halve the size of the .npy file.
 """
 
+import argparse
 import os
-import sys
 
 from stanza.models.common import pretrain
 
-def main():
-    filename = sys.argv[1]
-    vec_filename = sys.argv[2]
-    if len(sys.argv) < 3:
-        max_vocab = -1
-    else:
-        max_vocab = int(sys.argv[3])
+def parse_args(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', help='Pretrain file to write.  Use .npy for the memory mapped format')
+    parser.add_argument('vec_filename', help='Text or .xz file of word vectors, or a .pt pretrain if converting to .npy')
+    parser.add_argument('max_vocab', type=int, nargs='?', default=-1, help='Number of vectors to keep from a text file.  -1 keeps all of them')
+    parser.add_argument('--dtype', default=None, choices=['float32', 'float16'], help='Type of the matrix in a .npy pretrain')
+    return parser.parse_args(args=args)
 
-    pt = pretrain.Pretrain(filename, vec_filename, max_vocab)
+def main(args=None):
+    args = parse_args(args)
+
+    if pretrain.is_mmap_pretrain(args.filename) and args.vec_filename.endswith(".pt"):
+        if os.path.exists(args.filename):
+            pt = pretrain.Pretrain(args.filename)
+        else:
+            pt = pretrain.Pretrain(args.vec_filename, save_to_file=False)
+            pt.save(args.filename, dtype=args.dtype)
+    elif args.dtype is not None and not os.path.exists(args.filename):
+        pt = pretrain.Pretrain(args.filename, args.vec_filename, args.max_vocab, save_to_file=False)
+        pt.save(args.filename, dtype=args.dtype)
+    else:
+        pt = pretrain.Pretrain(args.filename, args.vec_filename, args.max_vocab)
     print("Pretrain is of size {}".format(len(pt.vocab)))
 
 if __name__ == '__main__':
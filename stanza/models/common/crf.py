@@ -23,12 +23,15 @@ class CRFLoss(nn.Module):
         """
         inputs: batch_size x seq_len x num_tags
         masks: batch_size x seq_len
-        tag_indices: batch_size x seq_len
+        tag_indices: batch_size x seq_len, or None at prediction time
         
         @return:
-            loss: CRF negative log likelihood on all instances.
+            loss: CRF negative log likelihood on all instances, or None if there are no tag_indices
             transitions: the transition matrix
         """
+        if tag_indices is None:
+            # only decoding, which only needs the transitions
+            return None, self._transitions
         # TODO: handle <start> and <end> tags
         input_bs, input_sl, input_nc = inputs.size()
         unary_scores = self.crf_unary_score(inputs, masks, tag_indices, input_bs, input_sl, input_nc)
@@ -122,6 +125,40 @@ def viterbi_decode(scores, transition_params):
     viterbi_score = np.max(trellis[-1])
     return viterbi, viterbi_score
 
+def batch_viterbi_decode(scores, transition_params, lengths):
+    """
+    Decode the tag sequences of a padded batch with viterbi algorithm.
+    Gives the same results as calling viterbi_decode on each sentence.
+    scores: batch_size x seq_len x num_tags (numpy array)
+    transition_params: num_tags x num_tags (numpy array)
+    lengths: the length of each sentence in the batch
+    @return:
+        viterbi: a list of lists of tag ids with highest score
+        viterbi_score: numpy array of the highest score of each sentence
+    """
+    batch_size, seq_len, num_tags = scores.shape
+    lengths = np.asarray(lengths)
+    trellis = scores[:, 0]
+    backpointers = np.zeros((seq_len, batch_size, num_tags), dtype=np.int32)
+    # sentences which are already finished keep their trellis
+    # and point back to the same tag at every step
+    identity = np.arange(num_tags, dtype=np.int32)
+
+    for t in range(1, seq_len):
+        v = np.expand_dims(trellis, 2) + transition_params
+        active = np.expand_dims(lengths > t, 1)
+        trellis = np.where(active, scores[:, t] + np.max(v, 1), trellis)
+        backpointers[t] = np.where(active, np.argmax(v, 1), identity)
+
+    batch_idx = np.arange(batch_size)
+    tags = np.zeros((batch_size, seq_len), dtype=np.int64)
+    tags[:, -1] = np.argmax(trellis, 1)
+    for t in range(seq_len - 1, 0, -1):
+        tags[:, t-1] = backpointers[t, batch_idx, tags[:, t]]
+    viterbi = [list(tags[i, :lengths[i]]) for i in range(batch_size)]
+    viterbi_score = np.max(trellis, 1)
+    return viterbi, viterbi_score
+
 def log_sum_exp(value, dim=None, keepdim=False):
     """Numerically stable implementation of the operation
     value.exp().sum(dim, keepdim).log()
@@ -46,6 +46,81 @@ def sort_all(batch, lens):
     sorted_all = [list(t) for t in zip(*sorted(zip(*unsorted_all), reverse=True))]
     return sorted_all[2:], sorted_all[1]
 
+def data_to_batches(data, batch_size, eval_mode, sort_during_eval, min_length_to_batch_separately=None,
+                    padded=False, max_batch_sentences=None, key=None):
+    """
+    Given a list of lists, where the first element of each sublist
+    represents the sentence, group the sentences into batches.
+
+    During training mode (not eval_mode) the sentences are sorted by
+    length with a bit of random shuffling.  During eval mode, the
+    sentences are sorted by length if sort_during_eval is true.
+
+    batch_size is the budget of words in a batch, or None for no
+    budget.  By default the budget counts the words of all the
+    sentences in the batch.  With padded=True it counts the size of
+    the padded batch instead, max length * number of sentences, so one
+    very long sentence does not drag a batch of short sentences up to
+    its length.  Sentences longer than min_length_to_batch_separately
+    always get a batch of their own.  max_batch_sentences, if set,
+    limits the number of sentences in a batch.
+
+    key gives the length of one item, by default the length of its
+    first element.
+
+    Shared by the DataLoaders of the various models.
+
+    Returns (batches, original_order), where original_order is None
+    when in train mode or when unsorted and represents the original
+    location of each sentence in the sort
+    """
+    if key is None:
+        key = lambda x: len(x[0])
+
+    if not eval_mode:
+        # sort sentences (roughly) by length for better memory utilization
+        data = sorted(data, key=key, reverse=random.random() > .5)
+        data_orig_idx = None
+    elif sort_during_eval:
+        (data, ), data_orig_idx = sort_all([data], [key(x) for x in data])
+    else:
+        data_orig_idx = None
+
+    res = []
+    current = []
+    currentlen = 0
+    currentmax = 0
+    for x in data:
+        length = key(x)
+        if min_length_to_batch_separately is not None and length > min_length_to_batch_separately:
+            if current:
+                res.append(current)
+                current = []
+                currentlen = 0
+                currentmax = 0
+            res.append([x])
+            continue
+
+        if current:
+            if padded:
+                cost = max(currentmax, length) * (len(current) + 1)
+            else:
+                cost = currentlen + length
+            if ((batch_size is not None and cost > batch_size) or
+                (max_batch_sentences is not None and len(current) >= max_batch_sentences)):
+                res.append(current)
+                current = []
+                currentlen = 0
+                currentmax = 0
+        current.append(x)
+        currentlen += length
+        currentmax = max(currentmax, length)
+
+    if current:
+        res.append(current)
+
+    return res, data_orig_idx
+
 def get_augment_ratio(train_data, should_augment_predicate, can_augment_predicate, desired_ratio=0.1, max_ratio=0.5):
     """
     Returns X so that if you randomly select X * N sentences, you get 10%
@@ -5,6 +5,7 @@ Basic data structures
 import io
 import re
 import json
+import operator
 import pickle
 
 from stanza.models.ner.utils import decode_from_bioes
@@ -27,6 +28,11 @@ START_CHAR = 'start_char'
 END_CHAR = 'end_char'
 TYPE = 'type'
 SENTIMENT = 'sentiment'
+CONSTITUENCY = 'constituency'
+CONSTITUENCY_KBEST = 'constituency_kbest'
+# changes to the tokens or words of a sentence, including their text, are recorded with these
+TOKENS = 'tokens'
+WORDS = 'words'
 
 def _readonly_setter(self, name):
     full_classname = self.__class__.__module__
@@ -76,6 +82,7 @@ class Document(StanzaObject):
         self._text = None
         self._num_tokens = 0
         self._num_words = 0
+        self._annotated_by = {}
 
         self.text = text
         self._process_sentences(sentences, comments)
@@ -98,8 +105,25 @@ class Document(StanzaObject):
 
     @text.setter
     def text(self, value):
-        """ Set the raw text for this document. """
+        """ Set the raw text for this document.  New text means the document has to be annotated from scratch. """
         self._text = value
+        self._annotated_by = {}
+
+    @property
+    def annotated_by(self):
+        """ Access the processors which have annotated this document, as a dict from processor name to instance_id.
+
+        When a Pipeline is given a document which one of its processors has already annotated,
+        that processor only annotates the sentences whose inputs changed since then.
+        A different processor, such as one with another model, annotates the whole document.
+        Clear this dict to have every processor annotate the whole document again.
+        """
+        return self._annotated_by
+
+    def clear_changes(self):
+        """ Forget the changes made to the sentences of this document, as after annotating it. """
+        for sentence in self.sentences:
+            sentence.clear_changes()
 
     @property
     def sentences(self):
@@ -193,19 +217,19 @@ class Document(StanzaObject):
         assert isinstance(fields, list), "Must provide field names as a list."
         assert len(fields) >= 1, "Must have at least one field."
 
+        # one attrgetter for all of the fields is much faster than a getattr per field per unit
+        getter = operator.attrgetter(*fields)
         results = []
         for sentence in self.sentences:
-            cursent = []
             # decide word or token
             if from_token:
                 units = sentence.tokens
             else:
                 units = sentence.words
-            for unit in units:
-                if len(fields) == 1:
-                    cursent += [getattr(unit, fields[0])]
-                else:
-                    cursent += [[getattr(unit, field) for field in fields]]
+            if len(fields) == 1:
+                cursent = [getter(unit) for unit in units]
+            else:
+                cursent = [list(getter(unit)) for unit in units]
 
             # decide whether append the results as a sentence or a whole list
             if as_sentences:
@@ -246,20 +270,18 @@ class Document(StanzaObject):
             assert (to_token and self.num_tokens == len(contents)) or self.num_words == len(contents), \
                 "Contents must have the same length as the original file."
 
-            cidx = 0
-            for sentence in self.sentences:
-                # decide word or token
-                if to_token:
-                    units = sentence.tokens
-                else:
-                    units = sentence.words
-                for unit in units:
-                    if len(fields) == 1:
-                        setattr(unit, fields[0], contents[cidx])
-                    else:
-                        for field, content in zip(fields, contents[cidx]):
-                            setattr(unit, field, content)
-                    cidx += 1
+            if to_token:
+                units = self.iter_tokens()
+            else:
+                units = self.iter_words()
+            if len(fields) == 1:
+                field = fields[0]
+                for unit, content in zip(units, contents):
+                    setattr(unit, field, content)
+            else:
+                for unit, content in zip(units, contents):
+                    for field, piece in zip(fields, content):
+                        setattr(unit, field, piece)
 
     def set_mwt_expansions(self, expansions):
         """ Extend the multi-word tokens annotated by tokenizer. A list of list of expansions
@@ -378,6 +400,10 @@ class Sentence(StanzaObject):
         self._text = None
         self._ents = []
         self._doc = doc
+        self._constituency = None
+        self._constituency_kbest = None
+        # fields changed since the sentence was last annotated.  A new sentence has new tokens and words
+        self._changed_fields = set()
         # comments are a list of comment lines occurring before the
         # sentence in a CoNLL-U file.  Can be empty
         self._comments = []
@@ -464,6 +490,7 @@ class Sentence(StanzaObject):
     def tokens(self, value):
         """ Set the list of tokens for this sentence. """
         self._tokens = value
+        self._changed_fields.add(TOKENS)
 
     @property
     def words(self):
@@ -474,6 +501,20 @@ class Sentence(StanzaObject):
     def words(self, value):
         """ Set the list of words for this sentence. """
         self._words = value
+        self._changed_fields.add(WORDS)
+
+    @property
+    def changed_fields(self):
+        """ Access the set of fields changed since this sentence was last annotated, such as TOKENS or UPOS. """
+        return self._changed_fields
+
+    def mark_changed(self, field):
+        """ Record that a field of this sentence or of its tokens or words changed. """
+        self._changed_fields.add(field)
+
+    def clear_changes(self):
+        """ Forget the changes made to this sentence. """
+        self._changed_fields = set()
 
     @property
     def ents(self):
@@ -519,6 +560,31 @@ class Sentence(StanzaObject):
         """ Set the sentiment value """
         self._sentiment = value
 
+    @property
+    def constituency(self):
+        """ Returns the constituency tree for this sentence, or None if the parser did not find one """
+        return self._constituency
+
+    @constituency.setter
+    def constituency(self, value):
+        """ Set the constituency tree """
+        self._constituency = value
+
+    @property
+    def constituency_kbest(self):
+        """ Returns the k best constituency trees for this sentence as a list of (tree, score), best first
+
+        The score is the log probability of the transitions which built
+        the tree.  Only set when the constituency parser is run with
+        k_best more than 1, and empty if the parser did not find a tree.
+        """
+        return self._constituency_kbest
+
+    @constituency_kbest.setter
+    def constituency_kbest(self, value):
+        """ Set the k best constituency trees """
+        self._constituency_kbest = value
+
     @property
     def comments(self):
         """ Returns CoNLL-style comments for this sentence """
@@ -663,6 +729,8 @@ class Token(StanzaObject):
     @text.setter
     def text(self, value):
         """ Set the token's text value. Example: 'The' """
+        if value != self._text:
+            self._mark_changed(TOKENS)
         self._text = value
 
     @property
@@ -686,6 +754,7 @@ class Token(StanzaObject):
         self._words = value
         for w in self._words:
             w.parent = self
+        self._mark_changed(WORDS)
 
     @property
     def start_char(self):
@@ -705,7 +774,10 @@ class Token(StanzaObject):
     @ner.setter
     def ner(self, value):
         """ Set the token's NER tag. Example: 'B-ORG'"""
-        self._ner = value if self._is_null(value) == False else None
+        value = value if self._is_null(value) == False else None
+        if value != self._ner:
+            self._mark_changed(NER)
+        self._ner = value
 
     @property
     def sent(self):
@@ -745,6 +817,10 @@ class Token(StanzaObject):
     def _is_null(self, value):
         return (value is None) or (value == '_')
 
+    def _mark_changed(self, field):
+        if self._sent is not None:
+            self._sent.mark_changed(field)
+
 class Word(StanzaObject):
     """ A word class that stores attributes of a word.
     """
@@ -794,6 +870,8 @@ class Word(StanzaObject):
     @text.setter
     def text(self, value):
         """ Set the word's text value. Example: 'The'"""
+        if value != self._text:
+            self._mark_changed(WORDS)
         self._text = value
 
     @property
@@ -804,7 +882,10 @@ class Word(StanzaObject):
     @lemma.setter
     def lemma(self, value):
         """ Set the word's lemma value. """
-        self._lemma = value if self._is_null(value) == False or self._text == '_' else None
+        value = value if self._is_null(value) == False or self._text == '_' else None
+        if value != self._lemma:
+            self._mark_changed(LEMMA)
+        self._lemma = value
 
     @property
     def upos(self):
@@ -814,7 +895,10 @@ class Word(StanzaObject):
     @upos.setter
     def upos(self, value):
         """ Set the word's universal part-of-speech value. Example: 'NOUN'"""
-        self._upos = value if self._is_null(value) == False else None
+        value = value if self._is_null(value) == False else None
+        if value != self._upos:
+            self._mark_changed(UPOS)
+        self._upos = value
 
     @property
     def xpos(self):
@@ -824,7 +908,10 @@ class Word(StanzaObject):
     @xpos.setter
     def xpos(self, value):
         """ Set the word's treebank-specific part-of-speech value. Example: 'NNP'"""
-        self._xpos = value if self._is_null(value) == False else None
+        value = value if self._is_null(value) == False else None
+        if value != self._xpos:
+            self._mark_changed(XPOS)
+        self._xpos = value
 
     @property
     def feats(self):
@@ -834,7 +921,10 @@ class Word(StanzaObject):
     @feats.setter
     def feats(self, value):
         """ Set this word's morphological features. Example: 'Gender=Fem'"""
-        self._feats = value if self._is_null(value) == False else None
+        value = value if self._is_null(value) == False else None
+        if value != self._feats:
+            self._mark_changed(FEATS)
+        self._feats = value
 
     @property
     def head(self):
@@ -844,7 +934,10 @@ class Word(StanzaObject):
     @head.setter
     def head(self, value):
         """ Set the word's governor id value. """
-        self._head = int(value) if self._is_null(value) == False else None
+        value = int(value) if self._is_null(value) == False else None
+        if value != self._head:
+            self._mark_changed(HEAD)
+        self._head = value
 
     @property
     def deprel(self):
@@ -854,7 +947,10 @@ class Word(StanzaObject):
     @deprel.setter
     def deprel(self, value):
         """ Set the word's dependency relation value. Example: 'nmod'"""
-        self._deprel = value if self._is_null(value) == False else None
+        value = value if self._is_null(value) == False else None
+        if value != self._deprel:
+            self._mark_changed(DEPREL)
+        self._deprel = value
 
     @property
     def deps(self):
@@ -908,7 +1004,7 @@ class Word(StanzaObject):
     @pos.setter
     def pos(self, value):
         """ Set the word's universal part-of-speech value. Example: 'NOUN'"""
-        self._upos = value if self._is_null(value) == False else None
+        self.upos = value
 
     @property
     def sent(self):
@@ -941,6 +1037,10 @@ class Word(StanzaObject):
     def _is_null(self, value):
         return (value is None) or (value == '_')
 
+    def _mark_changed(self, field):
+        if self._sent is not None:
+            self._sent.mark_changed(field)
+
 
 class Span(StanzaObject):
     """ A span class that stores attributes of a textual span. A span can be typed.
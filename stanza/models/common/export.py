@@ -0,0 +1,406 @@
+"""
+Export the inference graphs of the tagger, parser, NER and tokenizer to TorchScript or ONNX
+
+The eager forwards take python lists of lengths and sort orders, which a
+traced graph would bake in as constants, so each model has a
+predict_forward, which takes those as tensors and runs the LSTMs on
+padded batches, and which its forward uses at prediction time.  The
+graphs here trace that, so one trace works for any batch.  Only the
+network is exported: batching, the viterbi decoding of NER and the MST
+decoding of the parser stay in stanza.
+
+An exported graph is written with a json file of the same name plus
+.json, which has the input and output names and the vocab of the
+model, so a graph can also be used from other runtimes.  load_exported
+returns a module with the same call signature as the eager model, so a
+trainer can use it in place of its model.  Exported graphs only run on
+cpu.
+"""
+
+from abc import ABC, abstractmethod
+import copy
+import json
+import logging
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from stanza.models.common.packed_lstm import LSTMwRecDropout
+from stanza.models.depparse.model import Parser
+from stanza.models.ner.model import NERTagger
+from stanza.models.pos.model import Tagger
+from stanza.models.tokenization.model import Tokenizer
+
+logger = logging.getLogger('stanza')
+
+TORCHSCRIPT = 'torchscript'
+ONNX = 'onnx'
+EXPORT_FORMATS = (TORCHSCRIPT, ONNX)
+
+ONNX_OPSET = 14
+
+def check_export_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format %s.  Known formats: %s" % (export_format, ", ".join(EXPORT_FORMATS)))
+
+def check_onnx():
+    try:
+        import onnx
+    except ImportError:
+        raise ImportError(
+            "Exporting to ONNX requires the onnx library. "
+            "Try to install it with `pip install onnx`."
+        )
+    return True
+
+def check_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImportError(
+            "Running exported ONNX models requires the onnxruntime library. "
+            "Try to install it with `pip install onnxruntime`."
+        )
+    return True
+
+def metadata_path(path):
+    return path + ".json"
+
+def native_lstms(model):
+    """
+    Replace the LSTMs with recurrent dropout in model with the same nn.LSTM, in place
+
+    At inference time recurrent dropout does nothing, and an LSTMCell
+    has the same weights as one layer in one direction of an nn.LSTM.
+    The python loop of LSTMwRecDropout over the time steps would be
+    unrolled by tracing, whereas nn.LSTM is a single op.
+    """
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if not isinstance(child, LSTMwRecDropout):
+                continue
+            first = child.cells[0]
+            lstm = nn.LSTM(first.input_size, child.hidden_size, child.num_layers, bias=first.bias,
+                           batch_first=child.batch_first, bidirectional=child.num_directions > 1)
+            for layer in range(child.num_layers):
+                for direction in range(child.num_directions):
+                    cell = child.cells[layer * child.num_directions + direction]
+                    suffix = "_l%d%s" % (layer, "_reverse" if direction == 1 else "")
+                    getattr(lstm, "weight_ih" + suffix).data.copy_(cell.weight_ih.data)
+                    getattr(lstm, "weight_hh" + suffix).data.copy_(cell.weight_hh.data)
+                    if first.bias:
+                        getattr(lstm, "bias_ih" + suffix).data.copy_(cell.bias_ih.data)
+                        getattr(lstm, "bias_hh" + suffix).data.copy_(cell.bias_hh.data)
+            setattr(module, name, lstm)
+    return model
+
+class EinsumBilinear(nn.Module):
+    """
+    An nn.Bilinear written as an einsum, which, unlike aten::bilinear, has an ONNX op
+    """
+    def __init__(self, bilinear):
+        super().__init__()
+        self.weight = nn.Parameter(bilinear.weight.data.clone())
+        self.bias = nn.Parameter(bilinear.bias.data.clone()) if bilinear.bias is not None else None
+
+    def forward(self, input1, input2):
+        output = torch.einsum('...i,oij,...j->...o', input1, self.weight, input2)
+        if self.bias is not None:
+            output = output + self.bias
+        return output
+
+def einsum_bilinears(model):
+    """
+    Replace the nn.Bilinear layers in model with the same EinsumBilinear, in place
+    """
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, nn.Bilinear):
+                setattr(module, name, EinsumBilinear(child))
+    return model
+
+class ExportGraph(ABC, nn.Module):
+    """
+    The predict_forward of one kind of model, with the inputs it uses as positional arguments
+
+    Subclasses set MODEL_CLASS and OUTPUT_NAMES, pick their
+    input_names from the model config, and implement graph_inputs,
+    which turns the arguments of the eager forward into a dict of the
+    arguments of predict_forward, and model_outputs, which turns the
+    outputs of the graph back into the outputs of the eager forward.
+    """
+    MODEL_CLASS = None
+    OUTPUT_NAMES = ()
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = list(input_names)
+
+    @staticmethod
+    @abstractmethod
+    def graph_inputs(*args):
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def model_outputs(outputs):
+        pass
+
+    def forward(self, *inputs):
+        return self.model.predict_forward(**dict(zip(self.input_names, inputs)))
+
+class TaggerGraph(ExportGraph):
+    MODEL_CLASS = Tagger
+    OUTPUT_NAMES = ('upos', 'xpos', 'feats')
+
+    graph_inputs = staticmethod(Tagger.predict_inputs)
+
+    def __init__(self, model):
+        names = ['sentlens']
+        if model.args['word_emb_dim'] > 0:
+            names.append('word')
+        if model.args['pretrain']:
+            names.append('pretrained')
+        if model.args['char'] and model.args['char_emb_dim'] > 0:
+            names.extend(['wordchars', 'wordlens', 'word_orig_idx'])
+        super().__init__(model, names)
+
+    @staticmethod
+    def model_outputs(outputs):
+        return None, list(outputs)
+
+class ParserGraph(ExportGraph):
+    MODEL_CLASS = Parser
+    OUTPUT_NAMES = ('unlabeled_scores', 'deprel')
+
+    graph_inputs = staticmethod(Parser.predict_inputs)
+
+    def __init__(self, model):
+        names = ['sentlens']
+        if model.args['word_emb_dim'] > 0:
+            names.extend(['word', 'lemma'])
+        if model.args['tag_emb_dim'] > 0:
+            names.extend(['upos', 'xpos', 'ufeats'])
+        if model.args['pretrain']:
+            names.append('pretrained')
+        if model.args['char'] and model.args['char_emb_dim'] > 0:
+            names.extend(['wordchars', 'wordlens', 'word_orig_idx'])
+        super().__init__(model, names)
+
+    @staticmethod
+    def model_outputs(outputs):
+        return 0, [x.numpy() for x in outputs]
+
+class NERGraph(ExportGraph):
+    MODEL_CLASS = NERTagger
+    OUTPUT_NAMES = ('logits', 'transitions')
+
+    graph_inputs = staticmethod(NERTagger.predict_inputs)
+
+    def __init__(self, model):
+        names = ['sentlens']
+        if model.args['word_emb_dim'] > 0:
+            names.append('word')
+        if model.args['char'] and model.args['char_emb_dim'] > 0:
+            if model.args.get('charlm', None):
+                names.extend(['chars_forward', 'chars_backward', 'charlens', 'charoffsets_forward', 'charoffsets_backward', 'char_orig_idx'])
+            else:
+                names.extend(['wordchars', 'wordlens', 'word_orig_idx'])
+        super().__init__(model, names)
+
+    @staticmethod
+    def model_outputs(outputs):
+        logits, transitions = outputs
+        return None, logits, transitions
+
+class TokenizerGraph(ExportGraph):
+    MODEL_CLASS = Tokenizer
+    OUTPUT_NAMES = ('pred',)
+
+    def __init__(self, model):
+        super().__init__(model, ['units', 'features'])
+
+    @staticmethod
+    def graph_inputs(units, features):
+        return {'units': units, 'features': features}
+
+    @staticmethod
+    def model_outputs(outputs):
+        return outputs[0]
+
+GRAPHS = {
+    'pos': TaggerGraph,
+    'depparse': ParserGraph,
+    'ner': NERGraph,
+    'tokenize': TokenizerGraph,
+}
+
+def graph_name(model):
+    for name, graph_class in GRAPHS.items():
+        if isinstance(model, graph_class.MODEL_CLASS):
+            return name
+    raise ValueError("Cannot export a model of type %s.  Known types: %s" %
+                     (type(model).__name__, ", ".join(x.MODEL_CLASS.__name__ for x in GRAPHS.values())))
+
+def to_json(x):
+    """
+    Make x json serializable.  Dicts with keys which are not strings, which some vocabs have, become lists of pairs
+    """
+    if isinstance(x, dict):
+        if all(isinstance(key, str) for key in x):
+            return {key: to_json(value) for key, value in x.items()}
+        return [[to_json(key), to_json(value)] for key, value in x.items()]
+    if isinstance(x, (list, tuple)):
+        return [to_json(value) for value in x]
+    return x
+
+def vocab_state(vocab):
+    # round trip through json so the vocab compares equal to the one in a metadata file
+    return json.loads(json.dumps(to_json(vocab.state_dict())))
+
+def export_model(model, vocab, model_args, path, export_format=TORCHSCRIPT):
+    """
+    Trace the inference forward of model and write it to path, with its metadata next to it
+
+    model_args are the arguments of one call to the eager forward,
+    such as one of the calls from predict_calls, to trace the graph
+    with.  The eager model is not changed.
+    """
+    check_export_format(export_format)
+    if export_format == ONNX:
+        check_onnx()
+    name = graph_name(model)
+    graph_class = GRAPHS[name]
+    model = native_lstms(copy.deepcopy(model).cpu())
+    if export_format == ONNX:
+        model = einsum_bilinears(model)
+    model.eval()
+    graph = graph_class(model)
+    graph.eval()
+
+    inputs = graph_class.graph_inputs(*model_args)
+    inputs = tuple(inputs[x] for x in graph.input_names)
+    with torch.no_grad():
+        if export_format == TORCHSCRIPT:
+            traced = torch.jit.trace(graph, inputs, check_trace=False)
+            torch.jit.save(traced, path)
+        else:
+            dynamic_axes = {x: list(range(tensor.dim())) for x, tensor in zip(graph.input_names, inputs)}
+            torch.onnx.export(graph, inputs, path, input_names=graph.input_names, output_names=list(graph_class.OUTPUT_NAMES),
+                              dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET, dynamo=False)
+
+    metadata = {
+        'model': name,
+        'format': export_format,
+        'input_names': graph.input_names,
+        'output_names': list(graph_class.OUTPUT_NAMES),
+        'vocab': vocab_state(vocab),
+        'config': model.args,
+    }
+    with open(metadata_path(path), "w", encoding="utf-8") as fout:
+        json.dump(metadata, fout, indent=2, default=str)
+    logger.info("Exported %s model to %s", name, path)
+
+class ExportedModel(nn.Module):
+    """
+    Runs an exported graph with the call signature of the eager model it was exported from
+    """
+    def __init__(self, name, export_format, input_names, graph=None, session=None):
+        super().__init__()
+        self.name = name
+        self.graph_class = GRAPHS[name]
+        self.export_format = export_format
+        self.input_names = input_names
+        # a TorchScript module is also an nn.Module, so it shows up in modules()
+        self.graph = graph
+        self.session = session
+
+    def forward(self, *args):
+        inputs = self.graph_class.graph_inputs(*args)
+        if self.graph is not None:
+            outputs = self.graph(*[inputs[x] for x in self.input_names])
+            if isinstance(outputs, torch.Tensor):
+                outputs = (outputs,)
+        else:
+            # onnx prunes the inputs which the graph does not use
+            feed = {x.name: inputs[x.name].cpu().numpy() for x in self.session.get_inputs()}
+            outputs = [torch.from_numpy(np.asarray(x)) for x in self.session.run(None, feed)]
+        return self.graph_class.model_outputs(outputs)
+
+def load_exported(path, vocab=None, name=None):
+    """
+    Load a graph written by export_model
+
+    If vocab is given, it must be the vocab the graph was exported
+    with, which catches a graph used with the wrong model.  If name is
+    given, the graph must be of that kind of model, such as pos.
+    """
+    with open(metadata_path(path), encoding="utf-8") as fin:
+        metadata = json.load(fin)
+    if name is not None and metadata['model'] != name:
+        raise ValueError("%s is an exported %s model, not a %s model" % (path, metadata['model'], name))
+    if vocab is not None and vocab_state(vocab) != metadata['vocab']:
+        raise ValueError("The exported %s model in %s was exported from a model with a different vocab" % (metadata['model'], path))
+
+    if metadata['format'] == TORCHSCRIPT:
+        graph = torch.jit.load(path, map_location='cpu')
+        graph.eval()
+        model = ExportedModel(metadata['model'], TORCHSCRIPT, metadata['input_names'], graph=graph)
+    else:
+        check_onnxruntime()
+        import onnxruntime
+        session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        model = ExportedModel(metadata['model'], ONNX, metadata['input_names'], session=session)
+    model.eval()
+    return model
+
+class RecordingModel(nn.Module):
+    """
+    Passes calls through to a model and keeps their arguments
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.calls = []
+
+    def forward(self, *args):
+        self.calls.append(args)
+        return self.model(*args)
+
+def predict_calls(trainer, batches):
+    """
+    The arguments trainer.predict passes to its model for each batch
+    """
+    model = trainer.model
+    recorder = RecordingModel(model)
+    trainer.model = recorder
+    try:
+        for batch in batches:
+            trainer.predict(batch)
+    finally:
+        trainer.model = model
+    return recorder.calls
+
+def count_differences(trainer, exported, batches):
+    """
+    The number of batches where trainer.predict gives different results with the exported model
+    """
+    model = trainer.model
+    expected = [trainer.predict(batch) for batch in batches]
+    trainer.model = exported
+    try:
+        results = [trainer.predict(batch) for batch in batches]
+    finally:
+        trainer.model = model
+
+    differences = 0
+    for x, y in zip(expected, results):
+        if isinstance(x, np.ndarray):
+            same = x.shape == y.shape and np.allclose(x, y, atol=1e-4)
+        else:
+            same = x == y
+        if not same:
+            differences += 1
+    return differences
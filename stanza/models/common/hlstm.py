@@ -112,6 +112,39 @@ class HighwayLSTM(nn.Module):
             input = pad_packed_sequence(input, batch_first=self.batch_first)[0]
         return input, (torch.cat(hs, 0), torch.cat(cs, 0))
 
+    def padded_forward(self, input, seqlens, hx=None):
+        """
+        The same as forward on a padded batch sorted by length, returning padded outputs
+
+        Each layer packs and pads around its own LSTM so that the
+        graph can be exported to ONNX.  The padding is zeroed after
+        each layer, as it would be when padding the packed outputs.
+        """
+        highway_func = (lambda x: x) if self.highway_func is None else self.highway_func
+
+        hs = []
+        cs = []
+
+        positions = torch.arange(input.size(1) if self.batch_first else input.size(0))
+        if self.batch_first:
+            mask = positions.unsqueeze(0) < seqlens.unsqueeze(1)
+        else:
+            mask = positions.unsqueeze(1) < seqlens.unsqueeze(0)
+        mask = mask.unsqueeze(2).to(input.device)
+
+        for l in range(self.num_layers):
+            if l > 0:
+                input = self.drop(input)
+            layer_hx = (hx[0][l * self.num_directions:(l+1)*self.num_directions], hx[1][l * self.num_directions:(l+1)*self.num_directions]) if hx is not None else None
+            h, (ht, ct) = self.lstm[l].padded_forward(input, seqlens, layer_hx)
+
+            hs.append(ht)
+            cs.append(ct)
+
+            input = (h + torch.sigmoid(self.gate[l](input)) * highway_func(self.highway[l](input))) * mask
+
+        return input, (torch.cat(hs, 0), torch.cat(cs, 0))
+
 if __name__ == "__main__":
     T = 10
     bidir = True
@@ -24,6 +24,45 @@ class PackedLSTM(nn.Module):
             res = (pad_packed_sequence(res[0], batch_first=self.batch_first)[0], res[1])
         return res
 
+    def padded_forward(self, input, lengths, hx=None):
+        """
+        Run the LSTM over a padded batch sorted by length, returning padded outputs
+
+        The pack and the pad are kept right around the LSTM, which is
+        the only way the ONNX exporter can turn a PackedSequence into
+        an LSTM op with sequence lengths.
+        """
+        output, hx = self.lstm(pack_padded_sequence(input, lengths, batch_first=self.batch_first), hx)
+        output, _ = pad_packed_sequence(output, batch_first=self.batch_first)
+        return output, hx
+
+def expand_initial_state(h_init, c_init, batch_size):
+    """
+    Expand the learned initial states of an LSTM, which have a batch of 1, to batch_size
+    """
+    return (h_init.expand(h_init.size(0), batch_size, h_init.size(2)).contiguous(),
+            c_init.expand(c_init.size(0), batch_size, c_init.size(2)).contiguous())
+
+def run_padded_lstm(lstm, inputs, lengths, hx=None):
+    """
+    Run a PackedLSTM or HighwayLSTM over a padded, batch first batch in any order
+
+    lengths is a tensor on cpu rather than a list, so that a traced
+    model works for any batch.  The batch is sorted by length before
+    packing, as LSTMwRecDropout does not keep the sort order of a
+    PackedSequence.  Returns the padded outputs and final states in
+    the order of the inputs.
+    """
+    # the order of equal lengths does not matter, as the outputs are unsorted afterwards
+    sort_idx = torch.argsort(lengths, descending=True)
+    lengths = lengths[sort_idx]
+    unsort_idx = torch.argsort(sort_idx)
+    if hx is not None:
+        hx = tuple(x[:, sort_idx.to(x.device)] for x in hx)
+    output, (h, c) = lstm.padded_forward(inputs[sort_idx.to(inputs.device)], lengths, hx)
+    unsort_idx = unsort_idx.to(output.device)
+    return output[unsort_idx], (h[:, unsort_idx], c[:, unsort_idx])
+
 class LSTMwRecDropout(nn.Module):
     """ An LSTM implementation that supports recurrent dropout """
     def __init__(self, input_size, hidden_size, num_layers, bias=True, batch_first=False, dropout=0, bidirectional=False, pad=False, rec_dropout=0):
@@ -0,0 +1,157 @@
+"""
+A cache of model predictions for models which are often asked about the same input
+
+For example, the lemmatizer sees the same (word, upos) pairs over and
+over.  The cache has an in-memory LRU tier and, if given a filename,
+a persistent tier in a sqlite file which survives between runs.
+
+Entries are kept separately for each namespace, which should identify
+the model and any settings which change its output, so a retrained
+model never sees the predictions of an older one.  model_namespace
+builds one from the checksum of the model file.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger('stanza')
+
+# sqlite limits the number of parameters in one query
+SQLITE_BATCH = 500
+
+def file_checksum(filename):
+    """
+    The sha256 of the contents of a file
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fin:
+        for chunk in iter(lambda: fin.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def model_namespace(name, model_file, *settings):
+    """
+    A namespace for the predictions of the model in model_file, with the given settings such as beam size
+    """
+    return ":".join([name, file_checksum(model_file)] + [str(x) for x in settings])
+
+class PredictionCache:
+    """
+    A thread-safe cache from model inputs to model outputs
+
+    Keys and values must be json serializable.  Tuples in keys are
+    treated the same as lists.
+    """
+    def __init__(self, namespace, max_size=10000, filename=None):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.filename = filename
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _db(self):
+        # called with the lock held.  a sqlite connection can't be used
+        # across a fork, so each process opens its own
+        if self.filename is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS predictions "
+                                     "(namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))")
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, value):
+        # called with the lock held
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        Return a dict of the keys which are in the cache and their values
+        """
+        encoded = {json.dumps(key): key for key in keys}
+        found = {}
+        with self._lock:
+            missing = []
+            for text, key in encoded.items():
+                if text in self._memory:
+                    self._memory.move_to_end(text)
+                    found[key] = self._memory[text]
+                else:
+                    missing.append(text)
+
+            db = self._db()
+            if db is not None and missing:
+                for start in range(0, len(missing), SQLITE_BATCH):
+                    chunk = missing[start:start+SQLITE_BATCH]
+                    query = ("SELECT key, value FROM predictions WHERE namespace = ? AND key IN (%s)" %
+                             ",".join("?" * len(chunk)))
+                    for text, value in db.execute(query, [self.namespace] + chunk):
+                        value = json.loads(value)
+                        if self.max_size > 0:
+                            self._remember(text, value)
+                        found[encoded[text]] = value
+        return found
+
+    def update(self, items):
+        """
+        Add (key, value) pairs, or a dict, to the cache
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        encoded = [(json.dumps(key), value) for key, value in items]
+        with self._lock:
+            if self.max_size > 0:
+                for text, value in encoded:
+                    self._remember(text, value)
+            db = self._db()
+            if db is not None and encoded:
+                db.executemany("INSERT OR REPLACE INTO predictions (namespace, key, value) VALUES (?, ?, ?)",
+                               [(self.namespace, text, json.dumps(value)) for text, value in encoded])
+                db.commit()
+
+    def __len__(self):
+        return len(self._memory)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+def split_cached(cache, keys, skip=None):
+    """
+    Figure out which of the keys need to go through the model
+
+    Returns (known, model_skip), where known is a dict of the keys
+    already in the cache and model_skip marks the positions the model
+    does not need to see: positions which were already skipped, keys
+    in the cache, and repeats of a key seen earlier in the list.
+    cache may be None, in which case only the repeats are skipped.
+    """
+    if skip is None:
+        skip = [False] * len(keys)
+    if cache is not None:
+        known = cache.get_many(set(key for key, s in zip(keys, skip) if not s))
+    else:
+        known = {}
+    seen = set()
+    model_skip = []
+    for key, s in zip(keys, skip):
+        if s or key in known or key in seen:
+            model_skip.append(True)
+        else:
+            seen.add(key)
+            model_skip.append(False)
+    return known, model_skip
@@ -1,8 +1,11 @@
 """
 Supports for pretrained data.
 """
+import json
 import os
 import re
+import threading
+import weakref
 
 import lzma
 import logging
@@ -26,8 +29,28 @@ class PretrainedWordVocab(BaseVocab):
             unit = unit.replace(" ","\xa0")
         return unit
 
+# pretrains saved with this extension are stored as a raw .npy matrix plus a separate vocab file,
+# so that the matrix can be memory mapped instead of read into memory
+MMAP_EXTENSION = '.npy'
+MMAP_VOCAB_EXTENSION = '.vocab.json'
+
+def is_mmap_pretrain(filename):
+    return filename is not None and filename.endswith(MMAP_EXTENSION)
+
+def mmap_vocab_filename(filename):
+    """ The vocab file which goes with a .npy pretrain matrix """
+    return filename[:-len(MMAP_EXTENSION)] + MMAP_VOCAB_EXTENSION
+
 class Pretrain:
-    """ A loader and saver for pretrained embeddings. """
+    """
+    A loader and saver for pretrained embeddings.
+
+    If filename ends with .npy, the pretrain is stored as a raw matrix
+    with the vocab in a .vocab.json file next to it.  The matrix is then
+    memory mapped when loaded, so loading is fast, only the rows which
+    are actually used are read from disk, and several processes using
+    the same file share the same pages.
+    """
 
     def __init__(self, filename=None, vec_filename=None, max_vocab=-1, save_to_file=True):
         self.filename = filename
@@ -50,9 +73,12 @@ class Pretrain:
     def load(self):
         if self.filename is not None and os.path.exists(self.filename):
             try:
-                data = torch.load(self.filename, lambda storage, loc: storage)
+                if is_mmap_pretrain(self.filename):
+                    self._vocab, self._emb = self.load_mmap(self.filename)
+                else:
+                    data = torch.load(self.filename, lambda storage, loc: storage)
+                    self._vocab, self._emb = PretrainedWordVocab.load_state_dict(data['vocab']), data['emb']
                 logger.debug("Loaded pretrain from {}".format(self.filename))
-                self._vocab, self._emb = PretrainedWordVocab.load_state_dict(data['vocab']), data['emb']
                 return
             except (KeyboardInterrupt, SystemExit):
                 raise
@@ -72,11 +98,46 @@ class Pretrain:
             assert self.filename is not None, "Filename must be provided to save pretrained vector to file."
             self.save(self.filename)
 
-    def save(self, filename):
+    @staticmethod
+    def load_mmap(filename):
+        """
+        Load the vocab and a memory mapped embedding matrix from a .npy pretrain
+
+        The matrix is mapped copy-on-write, so it is writable as far as
+        numpy and torch are concerned without ever changing the file.
+        """
+        with open(mmap_vocab_filename(filename), encoding='utf-8') as fin:
+            vocab = PretrainedWordVocab.load_state_dict(json.load(fin))
+        # the dict is rebuilt here rather than stored twice in the vocab file
+        vocab._unit2id = {w:i for i, w in enumerate(vocab._id2unit)}
+        emb = np.load(filename, mmap_mode='c')
+        if emb.shape[0] != len(vocab):
+            raise RuntimeError("Pretrain matrix in {} has {} rows, but its vocab has {} entries".format(filename, emb.shape[0], len(vocab)))
+        return vocab, emb
+
+    def save_mmap(self, filename, dtype=None):
+        """
+        Save the pretrain as a raw .npy matrix plus a vocab file, suitable for load_mmap
+
+        dtype can be used to store the matrix as float16, for example, to halve the size of the file
+        """
+        emb = np.asarray(self.emb)
+        if dtype is not None:
+            emb = emb.astype(dtype, copy=False)
+        state = self.vocab.state_dict()
+        state.pop('_unit2id', None)
+        with open(mmap_vocab_filename(filename), 'w', encoding='utf-8') as fout:
+            json.dump(state, fout, ensure_ascii=False)
+        np.save(filename, emb)
+
+    def save(self, filename, dtype=None):
         # should not infinite loop since the load function sets _vocab and _emb before trying to save
-        data = {'vocab': self.vocab.state_dict(), 'emb': self.emb}
         try:
-            torch.save(data, filename, _use_new_zipfile_serialization=False, pickle_protocol=3)
+            if is_mmap_pretrain(filename):
+                self.save_mmap(filename, dtype)
+            else:
+                data = {'vocab': self.vocab.state_dict(), 'emb': self.emb}
+                torch.save(data, filename, _use_new_zipfile_serialization=False, pickle_protocol=3)
             logger.info("Saved pretrained vocab and vectors to {}".format(filename))
         except (KeyboardInterrupt, SystemExit):
             raise
@@ -156,6 +217,49 @@ class Pretrain:
         return words, emb, failed
 
 
+# Pretrains which are currently in use anywhere in this process, keyed by file identity.
+# The values are weak references, so once the last processor using a pretrain
+# is dropped, the pretrain is freed and disappears from the registry.
+_SHARED_PRETRAINS = weakref.WeakValueDictionary()
+_SHARED_PRETRAINS_LOCK = threading.Lock()
+
+def pretrain_file_key(filename):
+    """
+    Identify a pretrain file by its resolved path and its stat info
+
+    Returns None if the file does not exist.  Including the size and
+    mtime means a file rewritten in place is not confused with the old one.
+    """
+    path = os.path.realpath(filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def get_shared_pretrain(filename):
+    """
+    Return a Pretrain for filename which is shared with every other user of the same file in this process
+
+    Processors such as pos, depparse, sentiment and constituency often use
+    the same pretrain, and this way the embedding matrix is only held once.
+    The pretrain is freed when nothing refers to it any more.
+    """
+    key = pretrain_file_key(filename)
+    if key is None:
+        # nothing to share with.  let Pretrain report the missing file as usual
+        return Pretrain(filename)
+
+    with _SHARED_PRETRAINS_LOCK:
+        pt = _SHARED_PRETRAINS.get(key)
+        if pt is None:
+            pt = Pretrain(filename)
+            _SHARED_PRETRAINS[key] = pt
+        else:
+            logger.debug("Reusing already loaded pretrain for %s", filename)
+    return pt
+
+
 def find_pretrain_file(wordvec_pretrain_file, save_dir, shorthand, lang):
     """
     When training a model, look in a few different places for a .pt file
@@ -0,0 +1,46 @@
+"""
+Dynamic quantization of the models, for faster inference on cpu
+
+Nearly all of the work in stanza's models happens in LSTM and Linear
+layers.  Dynamic quantization stores the weights of those layers as
+int8 and quantizes the activations on the fly, so unlike static
+quantization there is no calibration data needed.  A quantized model
+can only be used for inference, and only on cpu.
+"""
+
+import warnings
+
+import torch
+import torch.nn as nn
+
+try:
+    from torch.ao.quantization import quantize_dynamic
+except ImportError:
+    # older versions of torch
+    from torch.quantization import quantize_dynamic
+
+DYNAMIC_INT8 = 'dynamic_int8'
+QUANTIZE_MODES = (DYNAMIC_INT8,)
+
+# the layers which are replaced with quantized versions
+QUANTIZED_LAYERS = {nn.LSTM, nn.LSTMCell, nn.Linear}
+
+def check_quantize_mode(mode):
+    if mode not in QUANTIZE_MODES:
+        raise ValueError("Unknown quantization mode %s.  Known modes: %s" % (mode, ", ".join(QUANTIZE_MODES)))
+
+def quantize_model(model, mode=DYNAMIC_INT8):
+    """
+    Replace the LSTM and Linear layers of model with quantized layers, in place
+
+    Submodules shared with other models, such as a charlm, are
+    quantized for all of them.  Layers which are already quantized are
+    left alone, so quantizing twice is harmless.  Returns the model.
+    """
+    check_quantize_mode(mode)
+    model.eval()
+    with warnings.catch_warnings():
+        # newer versions of torch warn that eager mode quantization is moving to the torchao package
+        warnings.simplefilter("ignore")
+        quantize_dynamic(model, QUANTIZED_LAYERS, dtype=torch.qint8, inplace=True)
+    return model
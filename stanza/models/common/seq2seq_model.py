@@ -11,7 +11,6 @@ import numpy as np
 import stanza.models.common.seq2seq_constant as constant
 from stanza.models.common import utils
 from stanza.models.common.seq2seq_modules import LSTMAttention
-from stanza.models.common.beam import Beam
 
 logger = logging.getLogger('stanza')
 
@@ -222,25 +221,22 @@ class Seq2SeqModel(nn.Module):
         dec_inputs = self.embedding(self.SOS_tensor)
         dec_inputs = dec_inputs.expand(batch_size, dec_inputs.size(0), dec_inputs.size(1))
 
-        done = [False for _ in range(batch_size)]
-        total_done = 0
-        max_len = 0
-        output_seqs = [[] for _ in range(batch_size)]
+        done = torch.zeros(batch_size, dtype=torch.bool, device=src.device)
+        all_preds = []
 
-        while total_done < batch_size and max_len < self.max_dec_len:
+        while len(all_preds) < self.max_dec_len:
             log_probs, (hn, cn) = self.decode(dec_inputs, hn, cn, h_in, src_mask, src=src)
             assert log_probs.size(1) == 1, "Output must have 1-step of output."
             _, preds = log_probs.squeeze(1).max(1, keepdim=True)
             dec_inputs = self.embedding(preds) # update decoder inputs
-            max_len += 1
-            for i in range(batch_size):
-                if not done[i]:
-                    token = preds.data[i][0].item()
-                    if token == constant.EOS_ID:
-                        done[i] = True
-                        total_done += 1
-                    else:
-                        output_seqs[i].append(token)
+            all_preds.append(preds)
+            done = done | preds.squeeze(1).eq(constant.EOS_ID)
+            if done.all():
+                break
+
+        # everything after the first EOS of each sequence is dropped
+        all_preds = torch.cat(all_preds, dim=1).tolist() if all_preds else [[] for _ in range(batch_size)]
+        output_seqs = [utils.prune_hyp(seq) for seq in all_preds]
         return output_seqs, edit_logits
 
     def predict(self, src, src_mask, pos=None, beam_size=5):
@@ -267,51 +263,69 @@ class Seq2SeqModel(nn.Module):
             edit_logits = None
 
         # (2) set up beam
+        # the beam states are laid out as beam_size blocks of batch_size, so row k * batch_size + b is
+        # hypothesis k of example b
         with torch.no_grad():
             h_in = h_in.data.repeat(beam_size, 1, 1) # repeat data for beam search
             src_mask = src_mask.repeat(beam_size, 1)
             # repeat decoder hidden states
             hn = hn.data.repeat(beam_size, 1)
             cn = cn.data.repeat(beam_size, 1)
-        beam = [Beam(beam_size, self.use_cuda) for _ in range(batch_size)]
-
-        def update_state(states, idx, positions, beam_size):
-            """ Select the states according to back pointers. """
-            for e in states:
-                br, d = e.size()
-                s = e.contiguous().view(beam_size, br // beam_size, d)[:,idx]
-                s.data.copy_(s.data.index_select(0, positions))
+        device = hn.device
+
+        # the first step only expands the first hypothesis, which starts from SOS
+        current = torch.full((batch_size, beam_size), constant.PAD_ID, dtype=torch.long, device=device)
+        current[:, 0] = constant.SOS_ID
+        scores = torch.zeros(batch_size, beam_size, device=device)
+        done = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        # the positions of the hypotheses, and the hypothesis in the previous step each one came from
+        all_next = []
+        all_prev = []
+        batch_offset = torch.arange(batch_size, device=device)
+        same_k = torch.arange(beam_size, device=device).unsqueeze(0).expand(batch_size, beam_size)
 
         # (3) main loop
         for i in range(self.max_dec_len):
-            dec_inputs = torch.stack([b.get_current_state() for b in beam]).t().contiguous().view(-1, 1)
-            dec_inputs = self.embedding(dec_inputs)
+            dec_inputs = self.embedding(current.t().contiguous().view(-1, 1))
             log_probs, (hn, cn) = self.decode(dec_inputs, hn, cn, h_in, src_mask, src=src)
-            log_probs = log_probs.view(beam_size, batch_size, -1).transpose(0,1)\
-                    .contiguous() # [batch, beam, V]
-
-            # advance each beam
-            done = []
-            for b in range(batch_size):
-                is_done = beam[b].advance(log_probs.data[b])
-                if is_done:
-                    done += [b]
-                # update beam state
-                update_state((hn, cn), b, beam[b].get_current_origin(), beam_size)
-
-            if len(done) == batch_size:
+            log_probs = log_probs.data.view(beam_size, batch_size, -1).transpose(0, 1).contiguous() # [batch, beam, V]
+            num_words = log_probs.size(2)
+
+            if i == 0:
+                beam_lk = log_probs[:, 0, :]
+            else:
+                beam_lk = (log_probs + scores.unsqueeze(2)).view(batch_size, -1)
+            best_scores, best_ids = beam_lk.topk(beam_size, dim=1, largest=True, sorted=True)
+            prev_k = best_ids // num_words
+            next_y = best_ids - prev_k * num_words
+
+            # finished examples keep their hypotheses.  the EOS filler is cut off by prune_hyp
+            frozen = done.unsqueeze(1)
+            scores = torch.where(frozen, scores, best_scores)
+            prev_k = torch.where(frozen, same_k, prev_k)
+            next_y = torch.where(frozen, torch.full_like(next_y, constant.EOS_ID), next_y)
+            all_prev.append(prev_k)
+            all_next.append(next_y)
+            current = next_y
+
+            # reorder the decoder states to follow the back pointers
+            positions = (prev_k.t() * batch_size + batch_offset).reshape(-1)
+            hn = hn.index_select(0, positions)
+            cn = cn.index_select(0, positions)
+
+            # an example is finished when its best hypothesis ends in EOS
+            done = done | next_y[:, 0].eq(constant.EOS_ID)
+            if done.all():
                 break
 
         # back trace and find hypothesis
-        all_hyp, all_scores = [], []
-        for b in range(batch_size):
-            scores, ks = beam[b].sort_best()
-            all_scores += [scores[0]]
-            k = ks[0]
-            hyp = beam[b].get_hyp(k)
-            hyp = utils.prune_hyp(hyp)
-            hyp = [i.item() for i in hyp]
-            all_hyp += [hyp]
+        _, ks = scores.sort(1, descending=True)
+        k = ks[:, 0]
+        hyps = []
+        for next_y, prev_k in zip(reversed(all_next), reversed(all_prev)):
+            hyps.append(next_y.gather(1, k.unsqueeze(1)).squeeze(1))
+            k = prev_k.gather(1, k.unsqueeze(1)).squeeze(1)
+        hyps = torch.stack(hyps[::-1], dim=1).tolist() if hyps else [[] for _ in range(batch_size)]
+        all_hyp = [utils.prune_hyp(hyp) for hyp in hyps]
 
         return all_hyp, edit_logits
-
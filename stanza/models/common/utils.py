@@ -266,6 +266,22 @@ def tensor_unsort(sorted_tensor, oidx):
     backidx = [x[0] for x in sorted(enumerate(oidx), key=lambda x: x[1])]
     return sorted_tensor[backidx]
 
+def unsort_rows(sorted_tensor, oidx):
+    """
+    The same as tensor_unsort, with the original idx as a tensor, which a traced model needs
+    """
+    return sorted_tensor[torch.argsort(oidx).to(sorted_tensor.device)]
+
+
+def inference_mode():
+    """
+    A context manager, also usable as a decorator, which turns off autograd for running models
+
+    torch.inference_mode is faster than torch.no_grad, but only exists in newer versions of torch
+    """
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
 
 def set_random_seed(seed, cuda):
     """
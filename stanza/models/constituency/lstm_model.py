@@ -9,17 +9,15 @@ previous transitions, the words, and the partially built constituents.
 
 from collections import namedtuple
 import logging
-from operator import itemgetter
 import random
 import torch
 import torch.nn as nn
 from torch.nn.utils.rnn import pack_padded_sequence
 
-from stanza.models.common.data import get_long_tensor
-from stanza.models.common.utils import unsort
+from stanza.models.common.char_model import CHARLM_END, CHARLM_START
 from stanza.models.common.vocab import PAD_ID, UNK_ID
 from stanza.models.constituency.base_model import BaseModel
-from stanza.models.constituency.parse_transitions import TransitionScheme
+from stanza.models.constituency.parse_transitions import TransitionScheme, legal_transition_mask, transition_categories
 from stanza.models.constituency.parse_tree import Tree
 from stanza.models.constituency.tree_stack import TreeStack
 
@@ -125,6 +123,8 @@ class LSTMModel(BaseModel, nn.Module):
         self.transition_map = { t: i for i, t in enumerate(self.transitions) }
         # precompute tensors for the transitions
         self.register_buffer('transition_tensors', torch.tensor(range(len(transitions)), requires_grad=False))
+        # which legality rules apply to each transition
+        self.transition_categories = transition_categories(self.transitions, self)
         self.transition_embedding = nn.Embedding(num_embeddings = len(transitions),
                                                  embedding_dim = self.transition_embedding_dim)
 
@@ -213,9 +213,6 @@ class LSTMModel(BaseModel, nn.Module):
         return self.root_labels
 
     def build_char_representation(self, all_word_labels, device, forward):
-        CHARLM_START = "\n"
-        CHARLM_END = " "
-
         if forward:
             charlm = self.forward_charlm
             vocab = self.forward_charlm_vocab
@@ -223,8 +220,9 @@ class LSTMModel(BaseModel, nn.Module):
             charlm = self.backward_charlm
             vocab = self.backward_charlm_vocab
 
-        all_data = []
-        for idx, word_labels in enumerate(all_word_labels):
+        all_chars = []
+        all_offsets = []
+        for word_labels in all_word_labels:
             if forward:
                 word_labels = reversed(word_labels)
             else:
@@ -238,20 +236,10 @@ class LSTMModel(BaseModel, nn.Module):
                 offsets.append(len(chars) - 1)
             if not forward:
                 offsets.reverse()
-            chars = vocab.map(chars)
-            all_data.append((chars, offsets, len(chars), len(all_data)))
-
-        all_data.sort(key=itemgetter(2), reverse=True)
-        chars, char_offsets, char_lens, orig_idx = tuple(zip(*all_data))
-        chars = get_long_tensor(chars, len(all_data), pad_id=vocab.unit2id(' ')).to(device=device)
+            all_chars.append(vocab.map(chars))
+            all_offsets.append(offsets)
 
-        # TODO: surely this should be stuffed in the charlm model itself rather than done here
-        with torch.no_grad():
-            output, _, _ = charlm.forward(chars, char_lens)
-            res = [output[i, offsets] for i, offsets in enumerate(char_offsets)]
-            res = unsort(res, orig_idx)
-
-        return res
+        return charlm.build_char_representation(all_chars, all_offsets)
 
     def initial_word_queues(self, tagged_word_lists):
         """
@@ -265,7 +253,7 @@ class LSTMModel(BaseModel, nn.Module):
         all_word_labels = []
         for sentence_idx, tagged_words in enumerate(tagged_word_lists):
             word_idx = torch.stack([self.vocab_tensors[self.vocab_map.get(word.children[0].label, UNK_ID)] for word in tagged_words])
-            word_input = self.embedding(word_idx)
+            word_input = self.embedding(word_idx).float()
 
             # this occasionally learns UNK at train time
             word_labels = [word.children[0].label for word in tagged_words]
@@ -500,20 +488,16 @@ class LSTMModel(BaseModel, nn.Module):
         Hopefully the constraints prevent that from happening
         """
         predictions = self.forward(states)
-        pred_max = torch.argmax(predictions, axis=1)
-
-        pred_trans = [self.transitions[pred_max[idx]] for idx in range(len(states))]
-        if is_legal:
-            for idx, (state, trans) in enumerate(zip(states, pred_trans)):
-                if not trans.is_legal(state, self):
-                    _, indices = predictions[idx, :].sort(descending=True)
-                    for index in indices:
-                        if self.transitions[index].is_legal(state, self):
-                            pred_trans[idx] = self.transitions[index]
-                            break
-                    else: # yeah, else on a for loop, deal with it
-                        pred_trans[idx] = None
-
+        if not is_legal:
+            pred_max = torch.argmax(predictions, axis=1).tolist()
+            return predictions, [self.transitions[idx] for idx in pred_max]
+
+        legal = legal_transition_mask(states, self, self.transition_categories).to(predictions.device)
+        legal_predictions = predictions.masked_fill(~legal, float('-inf'))
+        pred_max = torch.argmax(legal_predictions, axis=1).tolist()
+        has_legal = legal.any(axis=1).tolist()
+        pred_trans = [self.transitions[idx] if any_legal else None
+                      for idx, any_legal in zip(pred_max, has_legal)]
         return predictions, pred_trans
 
     def get_params(self, skip_modules=True):
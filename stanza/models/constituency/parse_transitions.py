@@ -11,6 +11,9 @@ from enum import Enum
 import functools
 import logging
 
+import numpy as np
+import torch
+
 from stanza.models.constituency.parse_tree import Tree
 
 logger = logging.getLogger('stanza')
@@ -538,6 +541,127 @@ class CloseConstituent(Transition):
     def __hash__(self):
         return hash(93)
 
+class TransitionCategory(Enum):
+    """
+    Transitions which always agree on whether or not they are legal in a given state
+    """
+    SHIFT      = 0
+    CLOSE      = 1
+    OPEN       = 2
+    OPEN_ROOT  = 3
+    UNARY      = 4
+    UNARY_ROOT = 5
+
+def transition_categories(transitions, model):
+    """
+    Returns an array of the TransitionCategory of each transition
+
+    Used with legal_transition_mask
+    """
+    root_labels = model.get_root_labels()
+    categories = []
+    for transition in transitions:
+        if isinstance(transition, Shift):
+            category = TransitionCategory.SHIFT
+        elif isinstance(transition, CloseConstituent):
+            category = TransitionCategory.CLOSE
+        elif isinstance(transition, OpenConstituent):
+            category = TransitionCategory.OPEN_ROOT if transition.top_label in root_labels else TransitionCategory.OPEN
+        elif isinstance(transition, CompoundUnary):
+            category = TransitionCategory.UNARY_ROOT if transition.labels[0] in root_labels else TransitionCategory.UNARY
+        else:
+            raise ValueError("Unknown transition type %s" % type(transition))
+        categories.append(category.value)
+    return np.array(categories, dtype=np.int64)
+
+def legal_transition_mask(states, model, categories):
+    """
+    Returns a bool tensor of states x transitions, True where the transition is legal
+
+    categories is the result of transition_categories for the
+    transitions, so the columns are in the same order as those
+    transitions.  The answer is the same as calling is_legal for each
+    pair, but the few facts about each state which is_legal looks at
+    are only gathered once per state, and the rules for each kind of
+    transition are applied to the whole batch at once.
+    """
+    top_down = model.is_top_down()
+    root_labels = model.get_root_labels()
+
+    features = []
+    for state in states:
+        top_transition = model.get_top_transition(state.transitions)
+        top_is_open = isinstance(top_transition, OpenConstituent)
+        empty_word_queue = state.empty_word_queue()
+        num_constituents = state.num_constituents()
+        top_constituent = model.get_top_constituent(state.constituents)
+        # the unary checks walk the tree, so only do them in the
+        # states where the in-order rules actually look at them
+        if top_down:
+            only_root_open = (state.num_opens == 1 and
+                              state.transitions.parent is not None and
+                              state.transitions.parent.parent is None and
+                              top_is_open and
+                              len(top_transition.label) == 1 and
+                              top_transition.top_label in root_labels)
+            top_unaries = False
+            under_unaries = False
+        else:
+            only_root_open = False
+            top_unaries = (num_constituents > 0 and not top_is_open and
+                           (state.num_opens > 0 or empty_word_queue) and
+                           too_many_unary_nodes(top_constituent))
+            under_unaries = (top_is_open and state.num_opens <= 1 and not empty_word_queue and
+                             too_many_unary_nodes(model.get_top_constituent(state.constituents.pop())))
+        features.append((state.num_opens, state.sentence_length, num_constituents,
+                         empty_word_queue, state.empty_transitions(), top_is_open,
+                         isinstance(top_transition, CompoundUnary), top_constituent is not None,
+                         only_root_open, top_unaries, under_unaries))
+
+    # the batches are small, so numpy is much cheaper than torch for these operations
+    features = np.array(features, dtype=np.int64).reshape(-1, 11)
+    num_opens, sentence_length, num_constituents = features[:, 0], features[:, 1], features[:, 2]
+    (empty_word_queue, empty_transitions, top_is_open, top_is_unary, has_constituent,
+     only_root_open, top_unaries, under_unaries) = features[:, 3:].T.astype(bool)
+
+    # see the is_legal methods of each Transition for an explanation of these rules
+    if top_down:
+        shift = ~empty_word_queue & (num_opens > 0) & ~only_root_open
+    else:
+        shift = ~empty_word_queue & ~((num_opens == 0) & (num_constituents > 0))
+
+    close = num_opens > 0
+    if top_down:
+        close = close & ~top_is_open & ~((num_opens <= 1) & ~empty_word_queue)
+        if model.transition_scheme() == TransitionScheme.TOP_DOWN_COMPOUND:
+            close = close & ~((num_opens == 1) & ~empty_word_queue)
+        elif not model.has_unary_transitions():
+            close = close & ~((num_opens == 2) & ~empty_word_queue)
+    else:
+        close = close & ~under_unaries
+
+    open_transition = num_opens <= sentence_length + 5
+    if top_down:
+        open_transition = open_transition & ~empty_word_queue
+        if not model.has_unary_transitions():
+            open_root = open_transition & empty_transitions
+            open_transition = open_transition & ~empty_transitions
+        else:
+            open_root = open_transition
+    else:
+        open_transition = open_transition & (num_constituents > 0) & ~top_is_open
+        open_root = open_transition & (num_opens == 0) & empty_word_queue
+        open_transition = open_transition & ~top_unaries
+
+    unary = has_constituent & ~top_is_open & ~top_is_unary
+    finishing = empty_word_queue & (num_constituents == 1)
+    unary_root = unary & finishing
+    unary = unary & ~finishing
+
+    # the columns are stacked in the order of TransitionCategory
+    legal = np.stack([shift, close, open_transition, open_root, unary, unary_root], axis=1)
+    return torch.from_numpy(legal[:, categories])
+
 def bulk_apply(model, tree_batch, transitions, fail=False, max_transitions=1000):
     remove = set()
 
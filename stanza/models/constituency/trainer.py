@@ -35,6 +35,9 @@ tqdm = utils.get_tqdm()
 
 logger = logging.getLogger('stanza.constituency.trainer')
 
+# at parse time, a state which has used this many transitions is assumed to be stuck in a loop
+MAX_TRANSITIONS = 1000
+
 class Trainer:
     """
     Stores a constituency model and its optimizer
@@ -485,7 +488,8 @@ def build_batch_from_tagged_words(batch_size, data_iterator, model):
         tree_batch = parse_transitions.initial_state_from_words(tree_batch, model)
     return tree_batch
 
-def parse_sentences(data_iterator, build_batch_fn, batch_size, model):
+@utils.inference_mode()
+def parse_sentences(data_iterator, build_batch_fn, batch_size, model, beam_size=1, k_best=1):
     """
     Given an iterator over the data and a method for building batches, returns a bunch of parse trees.
 
@@ -495,26 +499,57 @@ def parse_sentences(data_iterator, build_batch_fn, batch_size, model):
 
     The return is a list of tuples: (gold_tree, [(predicted, score) ...])
     gold_tree will be left blank if the data did not include gold trees
-    currently score is always 1.0, but the interface may be expanded to get a score from the result of the parsing
+    score is the log probability of the transitions used to build the tree
+
+    If beam_size or k_best is more than 1, a beam search is used
+    instead of the greedy parse, and the k_best highest scoring trees
+    are returned for each sentence, best first.
+
+    The results are in the same order as the data, one per sentence.
+    A sentence which could not be parsed is logged and has an empty
+    list of predictions.
     """
+    if beam_size > 1 or k_best > 1:
+        return parse_sentences_beam(data_iterator, build_batch_fn, batch_size, model, max(beam_size, k_best), k_best)
+
     treebank = []
     tree_batch = build_batch_fn(batch_size, data_iterator, model)
+    # the index of each sentence in the data and the score so far of each state in tree_batch
+    batch_indices = list(range(len(tree_batch)))
+    batch_scores = [0.0] * len(tree_batch)
+    next_index = len(tree_batch)
     horizon_iterator = iter([])
 
     while len(tree_batch) > 0:
-        _, transitions = model.predict(tree_batch, is_legal=True)
-        tree_batch = parse_transitions.bulk_apply(model, tree_batch, transitions)
+        predictions, transitions = model.predict(tree_batch, is_legal=True)
+        log_probs = torch.log_softmax(predictions, dim=1)
+        # bulk_apply drops the states it can't advance, so drop their scores as well
+        keep = [transition is not None and tree.num_transitions() < MAX_TRANSITIONS
+                for tree, transition in zip(tree_batch, transitions)]
+        # one read of the scores of the chosen transitions for the whole batch
+        chosen = torch.tensor([model.transition_map[transition] if keep_state else 0
+                               for transition, keep_state in zip(transitions, keep)], device=log_probs.device)
+        chosen_scores = log_probs.gather(1, chosen.unsqueeze(1)).squeeze(1).tolist()
+        batch_scores = [score + chosen_score
+                        for score, chosen_score, keep_state in zip(batch_scores, chosen_scores, keep)
+                        if keep_state]
+        for idx, keep_state in enumerate(keep):
+            if not keep_state:
+                treebank.append((batch_indices[idx], (tree_batch[idx].gold_tree, [])))
+        batch_indices = [index for index, keep_state in zip(batch_indices, keep) if keep_state]
+        tree_batch = parse_transitions.bulk_apply(model, tree_batch, transitions, max_transitions=MAX_TRANSITIONS)
 
         remove = set()
         for idx, tree in enumerate(tree_batch):
             if tree.finished(model):
                 predicted_tree = tree.get_tree(model)
                 gold_tree = tree.gold_tree
-                # TODO: put an actual score here?
-                treebank.append((gold_tree, [(predicted_tree, 1.0)]))
+                treebank.append((batch_indices[idx], (gold_tree, [(predicted_tree, batch_scores[idx])])))
                 remove.add(idx)
 
         tree_batch = [tree for idx, tree in enumerate(tree_batch) if idx not in remove]
+        batch_indices = [index for idx, index in enumerate(batch_indices) if idx not in remove]
+        batch_scores = [score for idx, score in enumerate(batch_scores) if idx not in remove]
 
         for _ in range(batch_size - len(tree_batch)):
             horizon_tree = next(horizon_iterator, None)
@@ -526,25 +561,143 @@ def parse_sentences(data_iterator, build_batch_fn, batch_size, model):
                 horizon_tree = next(horizon_iterator, None)
 
             tree_batch.append(horizon_tree)
+            batch_indices.append(next_index)
+            batch_scores.append(0.0)
+            next_index += 1
+
+    # sentences finish in a different order than they started
+    treebank.sort(key=lambda x: x[0])
+    return [x[1] for x in treebank]
+
+def parse_sentences_beam(data_iterator, build_batch_fn, batch_size, model, beam_size, k_best):
+    """
+    Parse the data with a beam search, keeping the k_best best trees for each sentence
 
+    Same arguments and results as parse_sentences
+    """
+    treebank = []
+    while True:
+        tree_batch = build_batch_fn(batch_size, data_iterator, model)
+        if len(tree_batch) == 0:
+            break
+        results = beam_search(model, tree_batch, beam_size, k_best)
+        for state, result in zip(tree_batch, results):
+            if len(result) == 0:
+                logger.error("Could not find a parse for the following sentence:\n{}".format(state.to_string(model)))
+            treebank.append((state.gold_tree, result))
     return treebank
 
-def parse_tagged_words(model, words, batch_size):
+def beam_search(model, states, beam_size, k_best):
+    """
+    Run a beam search over the transitions for each of the initial states
+
+    Returns a list with the k_best highest scoring (tree, score) for
+    each state, best first.  The list may be shorter, possibly empty,
+    if not enough hypotheses could be finished.
+
+    All the hypotheses of all of the sentences are advanced together,
+    so each step is one call to the model.  The hypotheses are
+    States, so the ones which come from the same parent share the
+    TreeStacks up to that point rather than copying them.
+    """
+    num_transitions = len(model.transitions)
+    # for each sentence, the (state, score) of the hypotheses still being built
+    hypotheses = [[(state, 0.0)] for state in states]
+    finished = [[] for _ in states]
+
+    while any(hypotheses):
+        for sentence_hyps in hypotheses:
+            for state, _ in sentence_hyps:
+                if state.num_transitions() >= MAX_TRANSITIONS:
+                    logger.error("Went infinite!:\nFinal state:\n{}".format(state.to_string(model)))
+            sentence_hyps[:] = [(state, score) for state, score in sentence_hyps if state.num_transitions() < MAX_TRANSITIONS]
+
+        flat_states = [state for sentence_hyps in hypotheses for state, _ in sentence_hyps]
+        if len(flat_states) == 0:
+            break
+        flat_scores = [score for sentence_hyps in hypotheses for _, score in sentence_hyps]
+        # where each hypothesis goes in a (sentences x beam) grid
+        rows = [sentence_idx * beam_size + hyp_idx
+                for sentence_idx, sentence_hyps in enumerate(hypotheses)
+                for hyp_idx in range(len(sentence_hyps))]
+
+        predictions = model(flat_states)
+        # scores are summed over hundreds of transitions, so keep them in double precision
+        log_probs = torch.log_softmax(predictions, dim=1).double()
+        legal = parse_transitions.legal_transition_mask(flat_states, model, model.transition_categories)
+        log_probs = log_probs.masked_fill(~legal.to(log_probs.device), float('-inf'))
+        candidates = log_probs + torch.tensor(flat_scores, dtype=log_probs.dtype, device=log_probs.device).unsqueeze(1)
+
+        grid = torch.full((len(hypotheses) * beam_size, num_transitions), float('-inf'),
+                          dtype=log_probs.dtype, device=log_probs.device)
+        grid[torch.tensor(rows, device=log_probs.device)] = candidates
+        grid = grid.view(len(hypotheses), beam_size * num_transitions)
+        top_scores, top_indices = grid.topk(min(beam_size, grid.size(1)), dim=1)
+        top_scores = top_scores.tolist()
+        top_indices = top_indices.tolist()
+
+        new_owners = []
+        new_states = []
+        new_transitions = []
+        new_scores = []
+        for sentence_idx, sentence_hyps in enumerate(hypotheses):
+            if not sentence_hyps:
+                continue
+            for score, index in zip(top_scores[sentence_idx], top_indices[sentence_idx]):
+                if score == float('-inf'):
+                    # no more legal transitions for this sentence
+                    break
+                hyp_idx, transition_idx = divmod(index, num_transitions)
+                new_owners.append(sentence_idx)
+                new_states.append(sentence_hyps[hyp_idx][0])
+                new_transitions.append(model.transitions[transition_idx])
+                new_scores.append(score)
+
+        hypotheses = [[] for _ in states]
+        if len(new_states) == 0:
+            break
+        new_states = parse_transitions.bulk_apply(model, new_states, new_transitions, max_transitions=None)
+        for sentence_idx, state, score in zip(new_owners, new_states, new_scores):
+            if state.finished(model):
+                finished[sentence_idx].append((state.get_tree(model), score))
+            else:
+                hypotheses[sentence_idx].append((state, score))
+
+        # scores only go down, so once the k_best finished trees all
+        # beat the best unfinished hypothesis, the sentence is done
+        for sentence_idx, sentence_hyps in enumerate(hypotheses):
+            if sentence_hyps and len(finished[sentence_idx]) >= k_best:
+                kth_score = sorted((score for _, score in finished[sentence_idx]), reverse=True)[k_best - 1]
+                if max(score for _, score in sentence_hyps) <= kth_score:
+                    hypotheses[sentence_idx] = []
+
+    return [sorted(results, key=lambda x: x[1], reverse=True)[:k_best] for results in finished]
+
+def parse_tagged_words(model, words, batch_size, beam_size=1, k_best=None):
     """
     This parses tagged words and returns a list of trees.
 
     The tagged words should be represented:
       one list per sentence
         each sentence is a list of (word, tag)
-    The return value is a list of ParseTree objects
+    The return value is a list of ParseTree objects, with None for a
+    sentence which could not be parsed
+
+    If k_best is set, the return value is instead a list with the
+    k_best best (ParseTree, score) for each sentence, found with a beam
+    search of size beam_size.  The list is empty for a sentence which
+    could not be parsed
     """
     logger.debug("Processing %d sentences", len(words))
     model.eval()
 
     sentence_iterator = iter(words)
-    treebank = parse_sentences(sentence_iterator, build_batch_from_tagged_words, batch_size, model)
+    treebank = parse_sentences(sentence_iterator, build_batch_from_tagged_words, batch_size, model,
+                               beam_size=beam_size, k_best=k_best if k_best else 1)
 
-    results = [t[1][0][0] for t in treebank]
+    if k_best:
+        return [t[1] for t in treebank]
+    results = [t[1][0][0] if t[1] else None for t in treebank]
     return results
 
 def run_dev_set(model, dev_trees, args):
@@ -558,6 +711,8 @@ def run_dev_set(model, dev_trees, args):
 
     tree_iterator = iter(tqdm(dev_trees))
     treebank = parse_sentences(tree_iterator, build_batch_from_trees, args['eval_batch_size'], model)
+    # the trees which could not be parsed are left out of the evaluation
+    treebank = [x for x in treebank if len(x[1]) > 0]
 
     if len(treebank) < len(dev_trees):
         logger.warning("Only evaluating %d trees instead of %d", len(treebank), len(dev_trees))
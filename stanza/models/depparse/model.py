@@ -6,6 +6,7 @@ from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence, pack_s
 
 from stanza.models.common.biaffine import DeepBiaffineScorer
 from stanza.models.common.hlstm import HighwayLSTM
+from stanza.models.common.packed_lstm import expand_initial_state, run_padded_lstm
 from stanza.models.common.dropout import WordDropout
 from stanza.models.common.vocab import CompositeVocab
 from stanza.models.common.char_model import CharacterModel
@@ -81,12 +82,17 @@ class Parser(nn.Module):
         self.worddrop = WordDropout(args['word_dropout'])
 
     def forward(self, word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, lemma, head, deprel, word_orig_idx, sentlens, wordlens):
+        if not self.training:
+            inputs = self.predict_inputs(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, lemma, head, deprel, word_orig_idx, sentlens, wordlens)
+            unlabeled_scores, deprel_preds = self.predict_forward(**inputs)
+            return 0, [unlabeled_scores.detach().cpu().numpy(), deprel_preds.detach().cpu().numpy()]
+
         def pack(x):
             return pack_padded_sequence(x, sentlens, batch_first=True)
 
         inputs = []
         if self.args['pretrain']:
-            pretrained_emb = self.pretrained_emb(pretrained)
+            pretrained_emb = self.pretrained_emb(pretrained).float()
             pretrained_emb = self.trans_pretrained(pretrained_emb)
             pretrained_emb = pack(pretrained_emb)
             inputs += [pretrained_emb]
@@ -156,37 +162,90 @@ class Parser(nn.Module):
         diag = torch.eye(head.size(-1)+1, dtype=torch.bool, device=head.device).unsqueeze(0)
         unlabeled_scores.masked_fill_(diag, -float('inf'))
 
-        preds = []
-
-        if self.training:
-            unlabeled_scores = unlabeled_scores[:, 1:, :] # exclude attachment for the root symbol
-            unlabeled_scores = unlabeled_scores.masked_fill(word_mask.unsqueeze(1), -float('inf'))
-            unlabeled_target = head.masked_fill(word_mask[:, 1:], -1)
-            loss = self.crit(unlabeled_scores.contiguous().view(-1, unlabeled_scores.size(2)), unlabeled_target.view(-1))
-
-            deprel_scores = deprel_scores[:, 1:] # exclude attachment for the root symbol
-            #deprel_scores = deprel_scores.masked_select(goldmask.unsqueeze(3)).view(-1, len(self.vocab['deprel']))
-            deprel_scores = torch.gather(deprel_scores, 2, head.unsqueeze(2).unsqueeze(3).expand(-1, -1, -1, len(self.vocab['deprel']))).view(-1, len(self.vocab['deprel']))
-            deprel_target = deprel.masked_fill(word_mask[:, 1:], -1)
-            loss += self.crit(deprel_scores.contiguous(), deprel_target.view(-1))
-
-            if self.args['linearization']:
-                #lin_scores = lin_scores[:, 1:].masked_select(goldmask)
-                lin_scores = torch.gather(lin_scores[:, 1:], 2, head.unsqueeze(2)).view(-1)
-                lin_scores = torch.cat([-lin_scores.unsqueeze(1)/2, lin_scores.unsqueeze(1)/2], 1)
-                #lin_target = (head_offset[:, 1:] > 0).long().masked_select(goldmask)
-                lin_target = torch.gather((head_offset[:, 1:] > 0).long(), 2, head.unsqueeze(2))
-                loss += self.crit(lin_scores.contiguous(), lin_target.view(-1))
-
-            if self.args['distance']:
-                #dist_kld = dist_kld[:, 1:].masked_select(goldmask)
-                dist_kld = torch.gather(dist_kld[:, 1:], 2, head.unsqueeze(2))
-                loss -= dist_kld.sum()
-
-            loss /= wordchars.size(0) # number of words
-        else:
-            loss = 0
-            preds.append(F.log_softmax(unlabeled_scores, 2).detach().cpu().numpy())
-            preds.append(deprel_scores.max(3)[1].detach().cpu().numpy())
-
-        return loss, preds
+        unlabeled_scores = unlabeled_scores[:, 1:, :] # exclude attachment for the root symbol
+        unlabeled_scores = unlabeled_scores.masked_fill(word_mask.unsqueeze(1), -float('inf'))
+        unlabeled_target = head.masked_fill(word_mask[:, 1:], -1)
+        loss = self.crit(unlabeled_scores.contiguous().view(-1, unlabeled_scores.size(2)), unlabeled_target.view(-1))
+
+        deprel_scores = deprel_scores[:, 1:] # exclude attachment for the root symbol
+        #deprel_scores = deprel_scores.masked_select(goldmask.unsqueeze(3)).view(-1, len(self.vocab['deprel']))
+        deprel_scores = torch.gather(deprel_scores, 2, head.unsqueeze(2).unsqueeze(3).expand(-1, -1, -1, len(self.vocab['deprel']))).view(-1, len(self.vocab['deprel']))
+        deprel_target = deprel.masked_fill(word_mask[:, 1:], -1)
+        loss += self.crit(deprel_scores.contiguous(), deprel_target.view(-1))
+
+        if self.args['linearization']:
+            #lin_scores = lin_scores[:, 1:].masked_select(goldmask)
+            lin_scores = torch.gather(lin_scores[:, 1:], 2, head.unsqueeze(2)).view(-1)
+            lin_scores = torch.cat([-lin_scores.unsqueeze(1)/2, lin_scores.unsqueeze(1)/2], 1)
+            #lin_target = (head_offset[:, 1:] > 0).long().masked_select(goldmask)
+            lin_target = torch.gather((head_offset[:, 1:] > 0).long(), 2, head.unsqueeze(2))
+            loss += self.crit(lin_scores.contiguous(), lin_target.view(-1))
+
+        if self.args['distance']:
+            #dist_kld = dist_kld[:, 1:].masked_select(goldmask)
+            dist_kld = torch.gather(dist_kld[:, 1:], 2, head.unsqueeze(2))
+            loss -= dist_kld.sum()
+
+        loss /= wordchars.size(0) # number of words
+        return loss, []
+
+    @staticmethod
+    def predict_inputs(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, lemma, head, deprel, word_orig_idx, sentlens, wordlens):
+        """
+        The arguments of predict_forward for the arguments of forward
+        """
+        return {'sentlens': torch.tensor(sentlens), 'word': word, 'lemma': lemma, 'upos': upos, 'xpos': xpos, 'ufeats': ufeats,
+                'pretrained': pretrained, 'wordchars': wordchars, 'wordlens': torch.tensor(wordlens),
+                'word_orig_idx': torch.tensor(word_orig_idx)}
+
+    def predict_forward(self, sentlens, word=None, lemma=None, upos=None, xpos=None, ufeats=None, pretrained=None,
+                        wordchars=None, wordlens=None, word_orig_idx=None):
+        """
+        The forward at prediction time, with only tensors in and out
+
+        The lengths and the word order are tensors rather than lists and
+        the LSTMs run on padded batches, so this is also the graph which
+        stanza.models.common.export traces.  Returns the log softmax of
+        the unlabeled scores and the best deprel for each pair of words.
+        """
+        inputs = []
+        if self.args['pretrain']:
+            inputs.append(self.trans_pretrained(self.pretrained_emb(pretrained).float()))
+        if self.args['word_emb_dim'] > 0:
+            inputs.append(self.word_emb(word))
+            inputs.append(self.lemma_emb(lemma))
+        if self.args['tag_emb_dim'] > 0:
+            pos_emb = self.upos_emb(upos)
+            if isinstance(self.vocab['xpos'], CompositeVocab):
+                for i, emb in enumerate(self.xpos_emb):
+                    pos_emb = pos_emb + emb(xpos[:, :, i])
+            else:
+                pos_emb = pos_emb + self.xpos_emb(xpos)
+            feats_emb = sum(emb(ufeats[:, :, i]) for i, emb in enumerate(self.ufeats_emb))
+            inputs.extend([pos_emb, feats_emb])
+        if self.args['char'] and self.args['char_emb_dim'] > 0:
+            inputs.append(self.trans_char(self.charmodel.predict_forward(wordchars, word_orig_idx, sentlens, wordlens)))
+
+        hx = expand_initial_state(self.parserlstm_h_init, self.parserlstm_c_init, sentlens.size(0))
+        lstm_outputs, _ = run_padded_lstm(self.parserlstm, torch.cat(inputs, 2), sentlens, hx)
+
+        unlabeled_scores = self.unlabeled(lstm_outputs, lstm_outputs).squeeze(3)
+        deprel_scores = self.deprel(lstm_outputs, lstm_outputs)
+
+        positions = torch.arange(lstm_outputs.size(1), device=lstm_outputs.device)
+        if self.args['linearization'] or self.args['distance']:
+            head_offset = (positions.view(1, 1, -1) - positions.view(1, -1, 1)).expand(lstm_outputs.size(0), -1, -1)
+        if self.args['linearization']:
+            lin_scores = self.linearization(lstm_outputs, lstm_outputs).squeeze(3)
+            # logsigmoid as a softplus, as the ONNX export of logsigmoid is log(sigmoid), which underflows to -inf
+            unlabeled_scores = unlabeled_scores - F.softplus(-lin_scores * torch.sign(head_offset).float())
+        if self.args['distance']:
+            dist_scores = self.distance(lstm_outputs, lstm_outputs).squeeze(3)
+            dist_pred = 1 + F.softplus(dist_scores)
+            dist_target = torch.abs(head_offset)
+            unlabeled_scores = unlabeled_scores - torch.log((dist_target.float() - dist_pred)**2/2 + 1)
+
+        # not torch.eye, which onnxruntime has no boolean EyeLike for
+        diag = (positions.view(-1, 1) == positions.view(1, -1)).unsqueeze(0)
+        unlabeled_scores = unlabeled_scores.masked_fill(diag, -float('inf'))
+        return F.log_softmax(unlabeled_scores, 2), deprel_scores.max(3)[1]
@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 
 
 class LangIDBiLSTM(nn.Module):
@@ -65,23 +66,38 @@ class LangIDBiLSTM(nn.Module):
     def loss(self, Y_hat, Y):
         return self.loss_train(Y_hat, Y)
 
-    def forward(self, x):
+    def forward(self, x, lengths=None):
+        """
+        x is a batch of character ids.  If lengths is given, each row
+        of x is padded after lengths[i] characters, and the padding has
+        no effect on the result for that row
+        """
         # embed input
         x = self.char_embeds(x)
-        
+
         # run through LSTM
-        x, _ = self.lstm(x)
-        
+        if lengths is None:
+            x, _ = self.lstm(x)
+        else:
+            # packing keeps the backward direction from reading the padding
+            total_length = x.size(1)
+            x = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            x, _ = self.lstm(x)
+            x, _ = pad_packed_sequence(x, batch_first=True, total_length=total_length)
+
         # run through linear layer
         x = self.hidden_to_tag(x)
-        
+
         # sum character outputs for each sequence
+        if lengths is not None:
+            mask = torch.arange(x.size(1), device=x.device).unsqueeze(0) < lengths.to(x.device).unsqueeze(1)
+            x = x * mask.unsqueeze(2)
         x = torch.sum(x, dim=1)
 
         return x
 
-    def prediction_scores(self, x):
-        prediction_probs = self(x)
+    def prediction_scores(self, x, lengths=None):
+        prediction_probs = self(x, lengths)
         if self.lang_subset:
             prediction_batch_size = prediction_probs.size()[0]
             batch_mask = torch.stack([self.lang_mask for _ in range(prediction_batch_size)])
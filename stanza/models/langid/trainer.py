@@ -1,6 +1,7 @@
 import torch
 import torch.optim as optim
 
+from stanza.models.common import utils
 from stanza.models.langid.model import LangIDBiLSTM
 
 
@@ -35,6 +36,7 @@ class Trainer:
         loss.backward()
         self.optimizer.step()
 
+    @utils.inference_mode()
     def predict(self, inputs):
         self.model.eval()
         sentences, targets = inputs
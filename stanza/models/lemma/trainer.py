@@ -82,6 +82,7 @@ class Trainer(object):
         self.optimizer.step()
         return loss_val
 
+    @utils.inference_mode()
     def predict(self, batch, beam_size=1):
         inputs, orig_idx = unpack_batch(batch, self.use_cuda)
         src, src_mask, tgt, tgt_mask, pos, edits = inputs
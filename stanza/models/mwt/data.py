@@ -6,22 +6,28 @@ import logging
 import torch
 
 import stanza.models.common.seq2seq_constant as constant
-from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all
+from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all, data_to_batches
 from stanza.models.mwt.vocab import Vocab
 from stanza.models.common.doc import Document
 
 logger = logging.getLogger('stanza')
 
 class DataLoader:
-    def __init__(self, doc, batch_size, args, vocab=None, evaluation=False):
+    def __init__(self, doc, batch_size, args, vocab=None, evaluation=False, sort_during_eval=False, skip=None):
         self.batch_size = batch_size
         self.args = args
         self.eval = evaluation
         self.shuffled = not self.eval
+        self.sort_during_eval = sort_during_eval
         self.doc = doc
+        self.data_orig_idx = None
 
         data = self.load_doc(self.doc, evaluation=self.eval)
 
+        if skip is not None:
+            assert len(data) == len(skip)
+            data = [x for x, y in zip(data, skip) if not y]
+
         # handle vocab
         if vocab is None:
             self.vocab = self.init_vocab(data)
@@ -43,7 +49,14 @@ class DataLoader:
         self.num_examples = len(data)
 
         # chunk into batches
-        data = [data[i:i+batch_size] for i in range(0, len(data), batch_size)]
+        if self.eval:
+            # batch_size is the number of tokens to expand in a batch.  max_batch_tokens
+            # optionally also limits the padded number of characters in each batch
+            data, self.data_orig_idx = data_to_batches(data=data, batch_size=args.get('max_batch_tokens', None),
+                                                       eval_mode=True, sort_during_eval=self.sort_during_eval,
+                                                       padded=True, max_batch_sentences=batch_size)
+        else:
+            data = [data[i:i+batch_size] for i in range(0, len(data), batch_size)]
         self.data = data
         logger.debug("{} batches created.".format(len(data)))
 
@@ -70,6 +70,7 @@ class Trainer(BaseTrainer):
         self.optimizer.step()
         return loss_val
 
+    @utils.inference_mode()
     def predict(self, batch, unsort=True):
         inputs, orig_idx = unpack_batch(batch, self.use_cuda)
         src, src_mask, tgt, tgt_mask = inputs
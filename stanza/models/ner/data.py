@@ -2,7 +2,7 @@ import random
 import logging
 import torch
 
-from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all
+from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all, data_to_batches
 from stanza.models.common.vocab import PAD_ID, VOCAB_PREFIX
 from stanza.models.pos.vocab import CharVocab, WordVocab
 from stanza.models.ner.vocab import TagVocab, MultiVocab
@@ -12,11 +12,13 @@ from stanza.models.ner.utils import process_tags
 logger = logging.getLogger('stanza')
 
 class DataLoader:
-    def __init__(self, doc, batch_size, args, pretrain=None, vocab=None, evaluation=False, preprocess_tags=True):
+    def __init__(self, doc, batch_size, args, pretrain=None, vocab=None, evaluation=False, preprocess_tags=True, sort_during_eval=False):
         self.batch_size = batch_size
         self.args = args
         self.eval = evaluation
         self.shuffled = not self.eval
+        self.sort_during_eval = sort_during_eval
+        self.data_orig_idx = None
         self.doc = doc
         self.preprocess_tags = preprocess_tags
 
@@ -169,6 +171,13 @@ class DataLoader:
         self.data = self.chunk_batches(data)
 
     def chunk_batches(self, data):
+        if self.eval:
+            # batch_size is the number of sentences in a batch.  max_batch_tokens optionally
+            # also limits the padded size of each batch
+            data, self.data_orig_idx = data_to_batches(data=data, batch_size=self.args.get('max_batch_tokens', None),
+                                                       eval_mode=True, sort_during_eval=self.sort_during_eval,
+                                                       padded=True, max_batch_sentences=self.batch_size)
+            return data
         data = [data[i:i+self.batch_size] for i in range(0, len(data), self.batch_size)]
         return data
 
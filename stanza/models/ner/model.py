@@ -5,14 +5,15 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence, pack_sequence, PackedSequence
 
-from stanza.models.common.packed_lstm import PackedLSTM
+from stanza.models.common.data import get_long_tensor
+from stanza.models.common.packed_lstm import PackedLSTM, expand_initial_state, run_padded_lstm
 from stanza.models.common.dropout import WordDropout, LockedDropout
 from stanza.models.common.char_model import CharacterModel, CharacterLanguageModel
 from stanza.models.common.crf import CRFLoss
 from stanza.models.common.vocab import PAD_ID
 
 class NERTagger(nn.Module):
-    def __init__(self, args, vocab, emb_matrix=None):
+    def __init__(self, args, vocab, emb_matrix=None, shared_charlms=None):
         super().__init__()
 
         self.vocab = vocab
@@ -40,8 +41,12 @@ class NERTagger(nn.Module):
                     raise FileNotFoundError('Could not find forward character model: {}  Please specify with --charlm_forward_file'.format(args['charlm_forward_file']))
                 if args['charlm_backward_file'] is None or not os.path.exists(args['charlm_backward_file']):
                     raise FileNotFoundError('Could not find backward character model: {}  Please specify with --charlm_backward_file'.format(args['charlm_backward_file']))
-                add_unsaved_module('charmodel_forward', CharacterLanguageModel.load(args['charlm_forward_file'], finetune=False))
-                add_unsaved_module('charmodel_backward', CharacterLanguageModel.load(args['charlm_backward_file'], finetune=False))
+                if shared_charlms is not None:
+                    load_charlm = shared_charlms.load
+                else:
+                    load_charlm = lambda filename: CharacterLanguageModel.load(filename, finetune=False)
+                add_unsaved_module('charmodel_forward', load_charlm(args['charlm_forward_file']))
+                add_unsaved_module('charmodel_backward', load_charlm(args['charlm_backward_file']))
                 input_size += self.charmodel_forward.hidden_dim() + self.charmodel_backward.hidden_dim()
             else:
                 self.charmodel = CharacterModel(args, vocab, bidirectional=True, attention=False)
@@ -83,7 +88,12 @@ class NERTagger(nn.Module):
         self.word_emb.weight.data.copy_(emb_matrix)
 
     def forward(self, word, word_mask, wordchars, wordchars_mask, tags, word_orig_idx, sentlens, wordlens, chars, charoffsets, charlens, char_orig_idx):
-        
+        if tags is None:
+            # at prediction time there are no gold tags, so only the logits and the transitions are needed
+            inputs = self.predict_inputs(word, word_mask, wordchars, wordchars_mask, tags, word_orig_idx, sentlens, wordlens, chars, charoffsets, charlens, char_orig_idx)
+            logits, trans = self.predict_forward(**inputs)
+            return None, logits, trans
+
         def pack(x):
             return pack_padded_sequence(x, sentlens, batch_first=True)
         
@@ -135,3 +145,44 @@ class NERTagger(nn.Module):
         loss, trans = self.crit(logits, word_mask, tags)
         
         return loss, logits, trans
+
+    @staticmethod
+    def predict_inputs(word, word_mask, wordchars, wordchars_mask, tags, word_orig_idx, sentlens, wordlens, chars, charoffsets, charlens, char_orig_idx):
+        """
+        The arguments of predict_forward for the arguments of forward
+        """
+        # the offsets of the missing words of shorter sentences are 0
+        def offsets(x):
+            return get_long_tensor([list(y) for y in x], len(x))
+
+        return {'sentlens': torch.tensor(sentlens), 'word': word, 'wordchars': wordchars, 'wordlens': torch.tensor(wordlens),
+                'word_orig_idx': torch.tensor(word_orig_idx), 'chars_forward': chars[0], 'chars_backward': chars[1],
+                'charlens': torch.tensor(charlens), 'charoffsets_forward': offsets(charoffsets[0]),
+                'charoffsets_backward': offsets(charoffsets[1]), 'char_orig_idx': torch.tensor(char_orig_idx)}
+
+    def predict_forward(self, sentlens, word=None, wordchars=None, wordlens=None, word_orig_idx=None, chars_forward=None, chars_backward=None,
+                        charlens=None, charoffsets_forward=None, charoffsets_backward=None, char_orig_idx=None):
+        """
+        The forward at prediction time, with only tensors in and out
+
+        The lengths, offsets and orders are tensors rather than lists and
+        the LSTMs run on padded batches, so this is also the graph which
+        stanza.models.common.export traces.  Returns the logits, which
+        are not zero past the end of a sentence, and the CRF transitions.
+        """
+        inputs = []
+        if self.args['word_emb_dim'] > 0:
+            inputs.append(self.word_emb(word))
+        if self.args['char'] and self.args['char_emb_dim'] > 0:
+            if self.args.get('charlm', None):
+                inputs.append(self.charmodel_forward.predict_representation(chars_forward, charoffsets_forward, charlens, char_orig_idx, sentlens))
+                inputs.append(self.charmodel_backward.predict_representation(chars_backward, charoffsets_backward, charlens, char_orig_idx, sentlens))
+            else:
+                inputs.append(self.charmodel.predict_forward(wordchars, word_orig_idx, sentlens, wordlens))
+
+        lstm_inputs = torch.cat(inputs, 2)
+        if self.input_transform:
+            lstm_inputs = self.input_transform(lstm_inputs)
+        hx = expand_initial_state(self.taggerlstm_h_init, self.taggerlstm_c_init, sentlens.size(0))
+        lstm_outputs, _ = run_padded_lstm(self.taggerlstm, lstm_inputs, sentlens, hx)
+        return self.tag_clf(lstm_outputs), self.crit._transitions
@@ -11,7 +11,7 @@ from stanza.models.common.trainer import Trainer as BaseTrainer
 from stanza.models.common import utils, loss
 from stanza.models.ner.model import NERTagger
 from stanza.models.ner.vocab import MultiVocab
-from stanza.models.common.crf import viterbi_decode
+from stanza.models.common.crf import batch_viterbi_decode
 
 logger = logging.getLogger('stanza')
 
@@ -45,11 +45,11 @@ def fix_singleton_tags(tags):
 class Trainer(BaseTrainer):
     """ A trainer for training models. """
     def __init__(self, args=None, vocab=None, pretrain=None, model_file=None, use_cuda=False,
-                 train_classifier_only=False):
+                 train_classifier_only=False, shared_charlms=None):
         self.use_cuda = use_cuda
         if model_file is not None:
             # load everything from file
-            self.load(model_file, args)
+            self.load(model_file, args, shared_charlms)
         else:
             assert all(var is not None for var in [args, vocab, pretrain])
             # build model from scratch
@@ -89,21 +89,20 @@ class Trainer(BaseTrainer):
         self.optimizer.step()
         return loss_val
 
+    @utils.inference_mode()
     def predict(self, batch, unsort=True):
         inputs, orig_idx, word_orig_idx, char_orig_idx, sentlens, wordlens, charlens, charoffsets = unpack_batch(batch, self.use_cuda)
         word, word_mask, wordchars, wordchars_mask, chars, tags = inputs
 
         self.model.eval()
         batch_size = word.size(0)
-        _, logits, trans = self.model(word, word_mask, wordchars, wordchars_mask, tags, word_orig_idx, sentlens, wordlens, chars, charoffsets, charlens, char_orig_idx)
+        _, logits, trans = self.model(word, word_mask, wordchars, wordchars_mask, None, word_orig_idx, sentlens, wordlens, chars, charoffsets, charlens, char_orig_idx)
 
         # decode
         trans = trans.data.cpu().numpy()
         scores = logits.data.cpu().numpy()
-        bs = logits.size(0)
         tag_seqs = []
-        for i in range(bs):
-            tags, _ = viterbi_decode(scores[i, :sentlens[i]], trans)
+        for tags in batch_viterbi_decode(scores, trans, sentlens)[0]:
             tags = self.vocab['tag'].unmap(tags)
             tags = fix_singleton_tags(tags)
             tag_seqs += [tags]
@@ -132,7 +131,7 @@ class Trainer(BaseTrainer):
         except:
             logger.warning("Saving failed... continuing anyway.")
 
-    def load(self, filename, args=None):
+    def load(self, filename, args=None, shared_charlms=None):
         try:
             checkpoint = torch.load(filename, lambda storage, loc: storage)
         except BaseException:
@@ -141,6 +140,6 @@ class Trainer(BaseTrainer):
         self.args = checkpoint['config']
         if args: self.args.update(args)
         self.vocab = MultiVocab.load_state_dict(checkpoint['vocab'])
-        self.model = NERTagger(self.args, self.vocab)
+        self.model = NERTagger(self.args, self.vocab, shared_charlms=shared_charlms)
         self.model.load_state_dict(checkpoint['model'], strict=False)
 
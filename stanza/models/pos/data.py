@@ -2,7 +2,7 @@ import random
 import logging
 import torch
 
-from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all
+from stanza.models.common.data import map_to_ids, get_long_tensor, get_float_tensor, sort_all, data_to_batches
 from stanza.models.common.vocab import PAD_ID, VOCAB_PREFIX, CharVocab
 from stanza.models.pos.vocab import WordVocab, XPOSVocab, FeatureVocab, MultiVocab
 from stanza.models.pos.xpos_vocab_factory import xpos_vocab_factory
@@ -141,25 +141,8 @@ class DataLoader:
         random.shuffle(self.data)
 
     def chunk_batches(self, data):
-        res = []
-
-        if not self.eval:
-            # sort sentences (roughly) by length for better memory utilization
-            data = sorted(data, key = lambda x: len(x[0]), reverse=random.random() > .5)
-        elif self.sort_during_eval:
-            (data, ), self.data_orig_idx = sort_all([data], [len(x[0]) for x in data])
-
-        current = []
-        currentlen = 0
-        for x in data:
-            if len(x[0]) + currentlen > self.batch_size and currentlen > 0:
-                res.append(current)
-                current = []
-                currentlen = 0
-            current.append(x)
-            currentlen += len(x[0])
-
-        if currentlen > 0:
-            res.append(current)
-
-        return res
+        # at eval time the batch_size is a budget for the padded size of each batch
+        batches, self.data_orig_idx = data_to_batches(data=data, batch_size=self.batch_size,
+                                                      eval_mode=self.eval, sort_during_eval=self.sort_during_eval,
+                                                      padded=self.eval)
+        return batches
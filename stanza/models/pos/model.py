@@ -6,6 +6,7 @@ from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence, pack_s
 
 from stanza.models.common.biaffine import BiaffineScorer
 from stanza.models.common.hlstm import HighwayLSTM
+from stanza.models.common.packed_lstm import expand_initial_state, run_padded_lstm
 from stanza.models.common.dropout import WordDropout
 from stanza.models.common.vocab import CompositeVocab
 from stanza.models.common.char_model import CharacterModel
@@ -90,7 +91,11 @@ class Tagger(nn.Module):
         self.worddrop = WordDropout(args['word_dropout'])
 
     def forward(self, word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, word_orig_idx, sentlens, wordlens):
-        
+        if upos is None:
+            # at prediction time there are no gold tags, so only the predictions are needed
+            inputs = self.predict_inputs(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, word_orig_idx, sentlens, wordlens)
+            return None, list(self.predict_forward(**inputs))
+
         def pack(x):
             return pack_padded_sequence(x, sentlens, batch_first=True)
         
@@ -101,7 +106,7 @@ class Tagger(nn.Module):
             inputs += [word_emb]
 
         if self.args['pretrain']:
-            pretrained_emb = self.pretrained_emb(pretrained)
+            pretrained_emb = self.pretrained_emb(pretrained).float()
             pretrained_emb = self.trans_pretrained(pretrained_emb)
             pretrained_emb = pack(pretrained_emb)
             inputs += [pretrained_emb]
@@ -168,3 +173,51 @@ class Tagger(nn.Module):
         preds.append(torch.cat(ufeats_preds, 2))
 
         return loss, preds
+
+    @staticmethod
+    def predict_inputs(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, word_orig_idx, sentlens, wordlens):
+        """
+        The arguments of predict_forward for the arguments of forward
+        """
+        return {'sentlens': torch.tensor(sentlens), 'word': word, 'pretrained': pretrained, 'wordchars': wordchars,
+                'wordlens': torch.tensor(wordlens), 'word_orig_idx': torch.tensor(word_orig_idx)}
+
+    def predict_forward(self, sentlens, word=None, pretrained=None, wordchars=None, wordlens=None, word_orig_idx=None):
+        """
+        The forward at prediction time, with only tensors in and out
+
+        The lengths and the word order are tensors rather than lists and
+        the LSTMs run on padded batches, so this is also the graph which
+        stanza.models.common.export traces.  Returns the upos, xpos and
+        feats predictions as batch x max(sentlens) tensors.
+        """
+        inputs = []
+        if self.args['word_emb_dim'] > 0:
+            inputs.append(self.word_emb(word))
+        if self.args['pretrain']:
+            inputs.append(self.trans_pretrained(self.pretrained_emb(pretrained).float()))
+        if self.args['char'] and self.args['char_emb_dim'] > 0:
+            inputs.append(self.trans_char(self.charmodel.predict_forward(wordchars, word_orig_idx, sentlens, wordlens)))
+
+        hx = expand_initial_state(self.taggerlstm_h_init, self.taggerlstm_c_init, sentlens.size(0))
+        lstm_outputs, _ = run_padded_lstm(self.taggerlstm, torch.cat(inputs, 2), sentlens, hx)
+
+        upos_hid = F.relu(self.upos_hid(lstm_outputs))
+        upos = self.upos_clf(upos_hid).max(2)[1]
+
+        if self.share_hid:
+            xpos_hid = upos_hid
+            ufeats_hid = upos_hid
+            clffunc = lambda clf, hid: clf(hid)
+        else:
+            xpos_hid = F.relu(self.xpos_hid(lstm_outputs))
+            ufeats_hid = F.relu(self.ufeats_hid(lstm_outputs))
+            upos_emb = self.upos_emb(upos)
+            clffunc = lambda clf, hid: clf(hid, upos_emb)
+
+        if isinstance(self.vocab['xpos'], CompositeVocab):
+            xpos = torch.cat([clffunc(clf, xpos_hid).max(2, keepdim=True)[1] for clf in self.xpos_clf], 2)
+        else:
+            xpos = clffunc(self.xpos_clf, xpos_hid).max(2)[1]
+        feats = torch.cat([clffunc(clf, ufeats_hid).max(2, keepdim=True)[1] for clf in self.ufeats_clf], 2)
+        return upos, xpos, feats
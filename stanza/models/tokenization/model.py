@@ -99,3 +99,12 @@ class Tokenizer(nn.Module):
             pred = torch.cat([nontok, tok+nonsent, tok+sent], 2)
 
         return pred
+
+    def predict_forward(self, units, features):
+        """
+        The forward at prediction time, which the export traces
+
+        The tokenizer already takes padded tensors and nothing else, so
+        this is forward, which does not use the dropouts in eval mode.
+        """
+        return self(units, features)
@@ -5,6 +5,7 @@ import torch.nn as nn
 import torch.optim as optim
 
 from stanza.models.common.trainer import Trainer as BaseTrainer
+from stanza.models.common import utils
 from stanza.models.tokenization.utils import create_dictionary
 
 from .model import Tokenizer
@@ -58,6 +59,7 @@ class Trainer(BaseTrainer):
 
         return loss.item()
 
+    @utils.inference_mode()
     def predict(self, inputs):
         self.model.eval()
         units, labels, features, _ = inputs
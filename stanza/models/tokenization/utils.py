@@ -239,6 +239,153 @@ def update_pred_regex(raw, pred):
 SPACE_RE = re.compile(r'\s')
 SPACE_SPLIT_RE = re.compile(r'( *[^ ]+)')
 
+def find_skipping_whitespace(text, part, start):
+    """
+    Find part in text, allowing any whitespace in text between the characters of part
+
+    This gives the same span as searching text from start with the regex
+      r'\s*'.join(re.escape(c) for c in part)
+    for the texts used in decode_predictions, where every whitespace
+    character has already been replaced with ' ', and parts which are
+    some leading spaces followed by non-whitespace characters.
+    Returns None if that assumption doesn't hold or there is no match,
+    in which case the caller should fall back to the regex.
+    """
+    stripped = part.lstrip(' ')
+    if SPACE_RE.search(stripped):
+        return None
+    num_spaces = len(part) - len(stripped)
+    text_len = len(text)
+
+    if not stripped:
+        # the regex for two or more spaces matches the whole run of spaces,
+        # whereas a single space has no \s* and matches just itself
+        match_start = text.find(' ' * num_spaces, start)
+        if match_start < 0:
+            return None
+        idx = match_start + num_spaces
+        if num_spaces > 1:
+            while idx < text_len and text[idx] == ' ':
+                idx += 1
+        return match_start, idx
+
+    candidate = start
+    while True:
+        if num_spaces > 0:
+            # the leading spaces can match any run of at least that many spaces
+            match_start = text.find(' ' * num_spaces, candidate)
+            if match_start < 0:
+                return None
+            idx = match_start + num_spaces
+            while idx < text_len and text[idx] == ' ':
+                idx += 1
+        else:
+            match_start = text.find(stripped[0], candidate)
+            if match_start < 0:
+                return None
+            idx = match_start
+
+        matched = True
+        for char_idx, char in enumerate(stripped):
+            if char_idx > 0:
+                while idx < text_len and text[idx] == ' ':
+                    idx += 1
+            if idx >= text_len or text[idx] != char:
+                matched = False
+                break
+            idx += 1
+        if matched:
+            return match_start, idx
+        candidate = match_start + 1
+
+def decode_predictions(vocab, mwt_dict, orig_text, all_raw, all_preds, no_ssplit=False, skip_newline=False, use_la_ittb_shorthand=False):
+    """
+    Turn the tokenizer's per-character predictions into sentences of tokens
+
+    Token boundaries come straight from the prediction arrays, so each
+    token is built with one join over its characters.  The character
+    offsets are recovered with a linear scan of orig_text.
+
+    Returns the number of characters, the number of OOV characters, and the sentences
+    """
+    offset = 0
+    oov_count = 0
+    doc = []
+
+    text = SPACE_RE.sub(' ', orig_text) if orig_text is not None else None
+    char_offset = 0
+
+    UNK_ID = vocab.unit2id('<UNK>')
+    # most characters repeat many times, so each one is only looked up once
+    char_is_unk = {}
+
+    for raw, pred in zip(all_raw, all_preds):
+        # only the characters up to the first <PAD> are decoded
+        try:
+            num_chars = raw.index('<PAD>')
+        except ValueError:
+            num_chars = len(raw)
+        raw = raw[:num_chars]
+        pred = np.asarray(pred[:num_chars])
+        if use_la_ittb_shorthand:
+            # hack la_ittb
+            pred = pred.copy()
+            pred[[idx for idx, t in enumerate(raw) if t in (":", ";")]] = 2
+        offset += num_chars
+
+        for t, count in Counter(raw).items():
+            is_unk = char_is_unk.get(t)
+            if is_unk is None:
+                is_unk = char_is_unk[t] = vocab.unit2id(t) == UNK_ID
+            if is_unk:
+                oov_count += count
+
+        current_sent = []
+        tok_start = 0
+        boundaries = np.nonzero(pred >= 1)[0].tolist()
+        pred = pred.tolist()
+        for tok_end in boundaries:
+            p = pred[tok_end]
+            current_tok = ''.join(raw[tok_start:tok_end+1])
+            tok_start = tok_end + 1
+
+            tok = vocab.normalize_token(current_tok)
+            assert '\t' not in tok, tok
+            if len(tok) <= 0:
+                continue
+            if orig_text is not None:
+                st = -1
+                for part in SPACE_SPLIT_RE.split(current_tok):
+                    if len(part) == 0: continue
+                    if skip_newline:
+                        span = find_skipping_whitespace(text, part, char_offset)
+                        if span is None:
+                            part_pattern = re.compile(r'\s*'.join(re.escape(c) for c in part))
+                            match = part_pattern.search(text, char_offset)
+                            span = match.span(0)
+                        st0 = span[0] - char_offset
+                        partlen = span[1] - span[0]
+                    else:
+                        st0 = text.index(part, char_offset) - char_offset
+                        partlen = len(part)
+                    lstripped = part.lstrip()
+                    if st < 0:
+                        st = char_offset + st0 + (len(part) - len(lstripped))
+                    char_offset += st0 + partlen
+                position_info = (st, char_offset)
+            else:
+                position_info = None
+            current_sent.append((tok, p, position_info))
+            if (p == 2 or p == 4) and not no_ssplit:
+                doc.append(process_sentence(current_sent, mwt_dict))
+                current_sent = []
+
+        assert tok_start == num_chars
+        if len(current_sent):
+            doc.append(process_sentence(current_sent, mwt_dict))
+
+    return offset, oov_count, doc
+
 def output_predictions(output_file, trainer, data_generator, vocab, mwt_dict, max_seqlen=1000, orig_text=None, no_ssplit=False, use_regex_tokens=True):
     paragraphs = []
     for i, p in enumerate(data_generator.sentences):
@@ -312,71 +459,8 @@ def output_predictions(output_file, trainer, data_generator, vocab, mwt_dict, ma
                 all_preds[p[0]] = pred[j][:len1]
             all_raw[p[0]] = raw[j]
 
-    offset = 0
-    oov_count = 0
-    doc = []
-
-    text = SPACE_RE.sub(' ', orig_text) if orig_text is not None else None
-    char_offset = 0
     use_la_ittb_shorthand = trainer.args['shorthand'] == 'la_ittb'
-
-    UNK_ID = vocab.unit2id('<UNK>')
-
-    # Once everything is fed through the tokenizer model, it's time to decode the predictions
-    # into actual tokens and sentences that the rest of the pipeline uses
-    for j in range(len(paragraphs)):
-        raw = all_raw[j]
-        pred = all_preds[j]
-
-        current_tok = ''
-        current_sent = []
-
-        for t, p in zip(raw, pred):
-            if t == '<PAD>':
-                break
-            # hack la_ittb
-            if use_la_ittb_shorthand and t in (":", ";"):
-                p = 2
-            offset += 1
-            if vocab.unit2id(t) == UNK_ID:
-                oov_count += 1
-
-            current_tok += t
-            if p >= 1:
-                tok = vocab.normalize_token(current_tok)
-                assert '\t' not in tok, tok
-                if len(tok) <= 0:
-                    current_tok = ''
-                    continue
-                if orig_text is not None:
-                    st = -1
-                    tok_len = 0
-                    for part in SPACE_SPLIT_RE.split(current_tok):
-                        if len(part) == 0: continue
-                        if skip_newline:
-                            part_pattern = re.compile(r'\s*'.join(re.escape(c) for c in part))
-                            match = part_pattern.search(text, char_offset)
-                            st0 = match.start(0) - char_offset
-                            partlen = match.end(0) - match.start(0)
-                        else:
-                            st0 = text.index(part, char_offset) - char_offset
-                            partlen = len(part)
-                        lstripped = part.lstrip()
-                        if st < 0:
-                            st = char_offset + st0 + (len(part) - len(lstripped))
-                        char_offset += st0 + partlen
-                    position_info = (st, char_offset)
-                else:
-                    position_info = None
-                current_sent.append((tok, p, position_info))
-                current_tok = ''
-                if (p == 2 or p == 4) and not no_ssplit:
-                    doc.append(process_sentence(current_sent, mwt_dict))
-                    current_sent = []
-
-        assert(len(current_tok) == 0)
-        if len(current_sent):
-            doc.append(process_sentence(current_sent, mwt_dict))
+    offset, oov_count, doc = decode_predictions(vocab, mwt_dict, orig_text, all_raw, all_preds, no_ssplit, skip_newline, use_la_ittb_shorthand)
 
     if output_file: CoNLL.dict2conll(doc, output_file)
     return oov_count, offset, all_preds, doc
@@ -12,7 +12,7 @@ ClassifierProcessor and have "sentiment" be an option.
 import stanza.models.constituency.trainer as trainer
 
 from stanza.models.common import doc
-from stanza.models.common.pretrain import Pretrain
+from stanza.models.common.pretrain import get_shared_pretrain
 from stanza.pipeline._constants import *
 from stanza.pipeline.processor import UDProcessor, register_processor
 
@@ -29,17 +29,21 @@ class ConstituencyProcessor(UDProcessor):
     def _set_up_model(self, config, use_gpu):
         # get pretrained word vectors
         pretrain_path = config.get('pretrain_path', None)
-        self._pretrain = Pretrain(pretrain_path) if pretrain_path else None
+        self._pretrain = get_shared_pretrain(pretrain_path) if pretrain_path else None
         # set up model
         charlm_forward_file = config.get('forward_charlm_path', None)
         charlm_backward_file = config.get('backward_charlm_path', None)
         self._model = trainer.Trainer.load(filename=config['model_path'],
                                            pt=self._pretrain,
-                                           forward_charlm=trainer.load_charlm(charlm_forward_file),
-                                           backward_charlm=trainer.load_charlm(charlm_backward_file),
+                                           forward_charlm=self.pipeline.charlms.load(charlm_forward_file) if charlm_forward_file else None,
+                                           backward_charlm=self.pipeline.charlms.load(charlm_backward_file) if charlm_backward_file else None,
                                            use_gpu=use_gpu)
         # batch size counted as sentences
         self._batch_size = config.get('batch_size', ConstituencyProcessor.DEFAULT_BATCH_SIZE)
+        # a beam_size of 1 is the greedy parse
+        self._beam_size = config.get('beam_size', 1)
+        # if more than 1, the k best trees and their scores are kept in sentence.constituency_kbest
+        self._k_best = config.get('k_best', 1)
 
     def process(self, document):
         sentences = document.sentences
@@ -47,6 +51,13 @@ class ConstituencyProcessor(UDProcessor):
         # certainly parsing across an MWT boundary is an error
         # TODO: maybe some constituency models are trained on UPOS not XPOS
         words = [[(w.text, w.xpos) for w in s.words] for s in sentences]
-        trees = trainer.parse_tagged_words(self._model.model, words, self._batch_size)
-        document.set(CONSTITUENCY, trees, to_sentence=True)
+        if self._beam_size > 1 or self._k_best > 1:
+            kbest = trainer.parse_tagged_words(self._model.model, words, self._batch_size,
+                                               beam_size=self._beam_size, k_best=self._k_best)
+            trees = [results[0][0] if results else None for results in kbest]
+            if self._k_best > 1:
+                document.set(doc.CONSTITUENCY_KBEST, kbest, to_sentence=True)
+        else:
+            trees = trainer.parse_tagged_words(self._model.model, words, self._batch_size)
+        document.set(doc.CONSTITUENCY, trees, to_sentence=True)
         return document
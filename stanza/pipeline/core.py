@@ -9,10 +9,15 @@ import torch
 import logging
 import json
 import os
+import queue
+import threading
 
 from distutils.util import strtobool
 from stanza.pipeline._constants import *
+from stanza.models.common.char_model import DEFAULT_OUTPUT_CACHE_SIZE, SharedCharlms
 from stanza.models.common.doc import Document
+from stanza.models.common.quantization import check_quantize_mode, quantize_model
+from stanza.models.common.utils import inference_mode
 from stanza.pipeline.processor import Processor, ProcessorRequirementsException
 from stanza.pipeline.registry import NAME_TO_PROCESSOR_CLASS, PIPELINE_NAMES
 from stanza.pipeline.langid_processor import LangIDProcessor
@@ -71,9 +76,18 @@ class PipelineRequirementsException(Exception):
         return self.message
 
 
+# marks the end of the stream of batches in a staged pipeline
+_STAGE_DONE = object()
+
+class _StageError:
+    """ Wraps an exception raised in one stage of a staged pipeline so it can be passed down the queues """
+    def __init__(self, error):
+        self.error = error
+
+
 class Pipeline:
 
-    def __init__(self, lang='en', dir=DEFAULT_MODEL_DIR, package='default', processors={}, logging_level=None, verbose=None, use_gpu=True, model_dir=None, **kwargs):
+    def __init__(self, lang='en', dir=DEFAULT_MODEL_DIR, package='default', processors={}, logging_level=None, verbose=None, use_gpu=True, model_dir=None, freeze_params=False, charlm_cache_size=DEFAULT_OUTPUT_CACHE_SIZE, quantize=None, **kwargs):
         self.lang, self.dir, self.kwargs = lang, dir, kwargs
         if model_dir is not None and dir == DEFAULT_MODEL_DIR:
             self.dir = model_dir
@@ -116,11 +130,20 @@ class Pipeline:
 
         # Load processors
         self.processors = {}
+        # processors using the same charlm file share the model and its outputs.
+        # charlm_cache_size is the number of sentences whose outputs are kept, 0 to turn that off
+        self.charlms = SharedCharlms(charlm_cache_size)
 
         # configs that are the same for all processors
         pipeline_level_configs = {'lang': lang, 'mode': 'predict'}
         self.use_gpu = torch.cuda.is_available() and use_gpu
         logger.info("Use device: {}".format("gpu" if self.use_gpu else "cpu"))
+        if quantize:
+            check_quantize_mode(quantize)
+            if self.use_gpu:
+                raise ValueError("Quantized models only run on cpu.  Please use use_gpu=False with quantize='{}'".format(quantize))
+            # processors which cache their predictions keep the quantized predictions separate
+            pipeline_level_configs['quantize'] = quantize
 
         # set up processors
         pipeline_reqs_exceptions = []
@@ -176,8 +199,36 @@ class Pipeline:
             logger.info('\n')
             raise PipelineRequirementsException(pipeline_reqs_exceptions)
 
+        if quantize:
+            self.quantize(quantize)
+        if freeze_params:
+            self.freeze_params()
+
         logger.info("Done loading processors!")
 
+    def quantize(self, mode):
+        """
+        Quantize the LSTM and Linear layers of all the loaded models for faster inference on cpu
+
+        See stanza.models.common.quantization for the available modes
+        """
+        # pool imports this module, so this can't be imported at the top
+        from stanza.pipeline.pool import pipeline_modules
+        logger.info("Quantizing models: %s", mode)
+        for module in pipeline_modules(self):
+            quantize_model(module, mode)
+
+    def freeze_params(self):
+        """
+        Mark the parameters of all the loaded models as not requiring gradients
+
+        The output of the models is unchanged.  Use this when the pipeline is only used for annotation
+        """
+        # pool imports this module, so this can't be imported at the top
+        from stanza.pipeline.pool import pipeline_modules
+        for module in pipeline_modules(self):
+            module.requires_grad_(False)
+
     @staticmethod
     def update_kwargs(kwargs, processor_list):
         processor_dict = {processor: {'package': package, 'dependencies': dependencies} for (processor, package, dependencies) in processor_list}
@@ -216,15 +267,161 @@ class Pipeline:
 
     def process(self, doc):
         # run the pipeline
+        # a Document returned by an earlier run can be corrected, for example by setting the text or upos
+        # of some words, and passed in again.  Only the processors whose inputs changed then rerun,
+        # and only on the changed sentences
 
         # determine whether we are in bulk processing mode for multiple documents
         bulk=(isinstance(doc, list) and len(doc) > 0 and isinstance(doc[0], Document))
-        for processor_name in PIPELINE_NAMES:
-            if self.processors.get(processor_name):
-                process = self.processors[processor_name].bulk_process if bulk else self.processors[processor_name].process
-                doc = process(doc)
+        # annotating never needs gradients
+        with inference_mode():
+            for processor_name in PIPELINE_NAMES:
+                if self.processors.get(processor_name):
+                    processor = self.processors[processor_name]
+                    if bulk:
+                        process = processor.bulk_process
+                    elif isinstance(doc, Document) and doc.annotated_by.get(processor_name) == processor.instance_id:
+                        # only redo the sentences which changed since this same processor annotated the document
+                        process = processor.process_changed
+                    else:
+                        process = processor.process
+                    doc = process(doc)
+        self._mark_processed(doc if bulk else [doc])
+        # the cached charlm outputs are only useful for the document being processed
+        self.charlms.clear_caches()
         return doc
 
+    def _mark_processed(self, docs):
+        """
+        Record which processors annotated the documents, and forget the changes made to them so far.
+
+        Passing one of the documents to the pipeline again only reprocesses the sentences changed after this.
+        """
+        instance_ids = {processor_name: self.processors[processor_name].instance_id
+                        for processor_name in PIPELINE_NAMES if self.processors.get(processor_name)}
+        for doc in docs:
+            if isinstance(doc, Document):
+                doc.annotated_by.update(instance_ids)
+                doc.clear_changes()
+                # sentences may have been added to or removed from an annotated document
+                doc._count_words()
+
+    def stream(self, docs, batch_docs=50, max_chars=None, staged=False, queue_size=2):
+        """
+        Lazily process an iterable of texts or Documents, yielding annotated Documents in input order.
+
+        Documents are pulled from the iterable only as needed and grouped into batches
+        which go through the cross-document bulk_process path of each processor.
+        Only a bounded number of batches is held in memory at a time, so arbitrarily
+        large corpora can be processed without materializing every Document.
+
+        batch_docs: maximum number of documents per batch
+        max_chars: if set, a batch is also closed once its texts reach this many characters
+        staged: if True, each processor runs in its own thread, connected to the next
+          processor by a queue of batches, so that later processors work on batch N
+          while earlier processors are already working on batch N+1
+        queue_size: maximum number of batches waiting between two stages when staged
+        """
+        if batch_docs < 1:
+            raise ValueError("batch_docs must be at least 1, got {}".format(batch_docs))
+
+        batches = self._stream_batches(docs, batch_docs, max_chars)
+        if staged:
+            yield from self._staged_process(batches, queue_size)
+        else:
+            for batch in batches:
+                yield from self.process(batch)
+
+    @staticmethod
+    def _stream_batches(docs, batch_docs, max_chars):
+        batch = []
+        batch_chars = 0
+        for doc in docs:
+            if not isinstance(doc, Document):
+                doc = Document([], text=doc)
+            batch.append(doc)
+            if max_chars is not None and isinstance(doc.text, str):
+                batch_chars += len(doc.text)
+            if len(batch) >= batch_docs or (max_chars is not None and batch_chars >= max_chars):
+                yield batch
+                batch = []
+                batch_chars = 0
+        if batch:
+            yield batch
+
+    def _staged_process(self, batches, queue_size):
+        """
+        Run each loaded processor in its own thread over a stream of batches of Documents.
+
+        Torch releases the GIL inside its ops, so the stages genuinely overlap on multi-core machines.
+        An exception in any stage (or in the input iterable) stops the stream and is reraised here.
+        """
+        processors = self.loaded_processors
+        queues = [queue.Queue(maxsize=queue_size) for _ in range(len(processors) + 1)]
+        stop = threading.Event()
+
+        def feed():
+            try:
+                for batch in batches:
+                    if stop.is_set():
+                        break
+                    queues[0].put(batch)
+            except Exception as e:
+                queues[0].put(_StageError(e))
+            queues[0].put(_STAGE_DONE)
+
+        def run_stage(processor, in_queue, out_queue):
+            failed = False
+            while True:
+                item = in_queue.get()
+                if item is _STAGE_DONE:
+                    out_queue.put(item)
+                    return
+                if failed:
+                    # keep draining so that upstream stages never block on a full queue
+                    continue
+                if isinstance(item, _StageError):
+                    failed = True
+                else:
+                    try:
+                        # inference mode is thread local, so each stage turns it on for itself
+                        with inference_mode():
+                            item = processor.bulk_process(item)
+                    except Exception as e:
+                        failed = True
+                        item = _StageError(e)
+                out_queue.put(item)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for idx, processor in enumerate(processors):
+            threads.append(threading.Thread(target=run_stage, args=(processor, queues[idx], queues[idx+1]), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        item = None
+        error = None
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _STAGE_DONE:
+                    break
+                if isinstance(item, _StageError):
+                    error = item.error
+                    break
+                self._mark_processed(item)
+                yield from item
+        finally:
+            # either finished, failed, or the caller stopped iterating early.
+            # in all cases, wind down the stages before returning
+            stop.set()
+            while item is not _STAGE_DONE:
+                item = queues[-1].get()
+            for thread in threads:
+                thread.join()
+            self.charlms.clear_caches()
+        if error is not None:
+            raise error
+
     def __call__(self, doc):
         assert any([isinstance(doc, str), isinstance(doc, list),
                     isinstance(doc, Document)]), 'input should be either str, list or Document'
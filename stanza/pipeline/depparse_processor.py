@@ -3,7 +3,7 @@ Processor for performing dependency parsing
 """
 
 from stanza.models.common import doc
-from stanza.models.common.pretrain import Pretrain
+from stanza.models.common.pretrain import get_shared_pretrain
 from stanza.models.common.utils import unsort
 from stanza.models.depparse.data import DataLoader
 from stanza.models.depparse.trainer import Trainer
@@ -32,7 +32,7 @@ class DepparseProcessor(UDProcessor):
             self._requires = self.__class__.REQUIRES_DEFAULT
 
     def _set_up_model(self, config, use_gpu):
-        self._pretrain = Pretrain(config['pretrain_path']) if 'pretrain_path' in config else None
+        self._pretrain = get_shared_pretrain(config['pretrain_path']) if 'pretrain_path' in config else None
         self._trainer = Trainer(pretrain=self.pretrain, model_file=config['model_path'], use_cuda=use_gpu)
 
     def process(self, document):
@@ -7,6 +7,7 @@ import re
 import stanza
 import torch
 
+from stanza.models.common.data import data_to_batches
 from stanza.models.common.doc import Document
 from stanza.models.langid.model import LangIDBiLSTM
 from stanza.pipeline._constants import *
@@ -38,20 +39,23 @@ class LangIDProcessor(UDProcessor):
 
     def _text_to_tensor(self, docs):
         """
-        Map list of strings to batch tensor. Assumed all docs are same length.
+        Map list of strings to batch tensor, padded to the longest doc.  Also returns the lengths of the docs
         """
 
+        max_length = max(len(doc) for doc in docs)
         all_docs = []
         for doc in docs:
             doc_chars = [self._char_index.get(c, self._char_index["UNK"]) for c in list(doc)]
+            doc_chars = doc_chars + [self._model.padding_idx] * (max_length - len(doc_chars))
             all_docs.append(doc_chars)
-        return torch.tensor(all_docs, device=self._device, dtype=torch.long)
+        lengths = torch.tensor([len(doc) for doc in docs], device=self._device, dtype=torch.long)
+        return torch.tensor(all_docs, device=self._device, dtype=torch.long), lengths
 
-    def _id_langs(self, batch_tensor):
+    def _id_langs(self, batch_tensor, lengths=None):
         """
         Identify languages for each sequence in a batch tensor
         """
-        predictions = self._model.prediction_scores(batch_tensor)
+        predictions = self._model.prediction_scores(batch_tensor, lengths)
         prediction_labels = [self._model.idx_to_tag[prediction] for prediction in predictions]
 
         return prediction_labels
@@ -93,18 +97,14 @@ class LangIDProcessor(UDProcessor):
         if isinstance(docs[0], str):
             docs = [Document([], text) for text in docs]
 
-        docs_by_length = {}
-        for doc in docs:
-            text = LangIDProcessor.clean_text(doc.text) if self._clean_text else doc.text
-            doc_length = len(text)
-            if doc_length not in docs_by_length:
-                docs_by_length[doc_length] = []
-            docs_by_length[doc_length].append((doc, text))
-
-        for doc_length in docs_by_length:
-            inputs = [doc[1] for doc in docs_by_length[doc_length]]
-            predictions = self._id_langs(self._text_to_tensor(inputs))
-            for doc, lang in zip(docs_by_length[doc_length], predictions):
+        texts = [(doc, LangIDProcessor.clean_text(doc.text) if self._clean_text else doc.text) for doc in docs]
+        # sort by length so that each batch needs very little padding
+        batches, _ = data_to_batches(texts, batch_size=None, eval_mode=True, sort_during_eval=True,
+                                     max_batch_sentences=self._model.batch_size, key=lambda x: len(x[1]))
+        for batch in batches:
+            inputs = [doc[1] for doc in batch]
+            predictions = self._id_langs(*self._text_to_tensor(inputs))
+            for doc, lang in zip(batch, predictions):
                 doc[0].lang = lang
 
         return docs
@@ -124,3 +124,9 @@ class LangIDProcessor(UDProcessor):
 
         return self._process_list(docs)
 
+    def process_changed(self, doc):
+        """
+        The language is predicted from the text of the document, which has not changed since it was annotated
+        """
+        return doc
+
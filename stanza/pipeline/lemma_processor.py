@@ -3,6 +3,8 @@ Processor for performing lemmatization
 """
 
 from stanza.models.common import doc
+from stanza.models.common.prediction_cache import PredictionCache, model_namespace, split_cached
+from stanza.models.common.utils import unsort
 from stanza.models.lemma.data import DataLoader
 from stanza.models.lemma.trainer import Trainer
 from stanza.pipeline._constants import *
@@ -18,12 +20,31 @@ class LemmaProcessor(UDProcessor):
     REQUIRES_DEFAULT = set([TOKENIZE])
     # default batch size
     DEFAULT_BATCH_SIZE = 5000
+    # default number of (word, upos) predictions of the seq2seq model kept in memory
+    DEFAULT_CACHE_SIZE = 10000
 
     def __init__(self, config, pipeline, use_gpu):
         # run lemmatizer in identity mode
         self._use_identity = None
         self._pretagged = None
+        self._cache = None
         super().__init__(config, pipeline, use_gpu)
+        self._set_up_cache()
+
+    def _set_up_cache(self):
+        """
+        Set up the cache of seq2seq predictions.  lemma_cache_path adds a persistent sqlite tier
+        """
+        if self.use_identity or self._trainer is None or self.config.get('dict_only', False):
+            return
+        cache_size = self.config.get('cache_size', LemmaProcessor.DEFAULT_CACHE_SIZE)
+        cache_path = self.config.get('cache_path', None)
+        if cache_size > 0 or cache_path:
+            settings = [self.config['beam_size']]
+            if self.config.get('quantize'):
+                settings.append(self.config['quantize'])
+            namespace = model_namespace(LEMMA, self.config['model_path'], *settings)
+            self._cache = PredictionCache(namespace, max_size=cache_size, filename=cache_path)
 
     @property
     def use_identity(self):
@@ -47,31 +68,61 @@ class LemmaProcessor(UDProcessor):
         else:
             self._requires = LemmaProcessor.REQUIRES_DEFAULT
 
-    def process(self, document):
-        if not self.use_identity:
-            batch = DataLoader(document, self.config['batch_size'], self.config, vocab=self.vocab, evaluation=True)
+    def _predict_seq2seq(self, document, pairs, skip):
+        """
+        Run the seq2seq model on the (word, upos) pairs which are not skipped
+
+        Each distinct pair only goes through the model once, and pairs in
+        the prediction cache not at all.  Returns the predictions and edits
+        for the pairs which are not skipped.
+        """
+        # the DataLoader uses '_' for a missing upos
+        keys = [(word, '_' if upos is None else upos) for word, upos in pairs]
+        known, model_skip = split_cached(self._cache, keys, skip)
+        seq2seq_batch = DataLoader(document, self.config['batch_size'], self.config, vocab=self.vocab,
+                                   evaluation=True, skip=model_skip, sort_during_eval=True)
+
+        preds = []
+        edits = []
+        for i, b in enumerate(seq2seq_batch):
+            ps, es = self.trainer.predict(b, self.config['beam_size'])
+            preds += ps
+            if es is not None:
+                edits += es
+        preds = unsort(preds, seq2seq_batch.data_orig_idx)
+        if edits:
+            edits = unsort(edits, seq2seq_batch.data_orig_idx)
         else:
-            batch = DataLoader(document, self.config['batch_size'], self.config, evaluation=True, conll_only=True)
+            edits = [None] * len(preds)
+
+        results = dict(zip([key for key, s in zip(keys, model_skip) if not s], zip(preds, edits)))
+        if self._cache is not None:
+            self._cache.update(results)
+        results.update(known)
+
+        preds = []
+        edits = []
+        for key, s in zip(keys, skip):
+            if not s:
+                pred, edit = results[key]
+                preds.append(pred)
+                edits.append(edit)
+        return preds, edits
+
+    def process(self, document):
+        batch = DataLoader(document, self.config['batch_size'], self.config, evaluation=True, conll_only=True)
         if self.use_identity:
             preds = [word.text for sent in batch.doc.sentences for word in sent.words]
         elif self.config.get('dict_only', False):
             preds = self.trainer.predict_dict(batch.doc.get([doc.TEXT, doc.UPOS]))
         else:
+            pairs = batch.doc.get([doc.TEXT, doc.UPOS])
             if self.config.get('ensemble_dict', False):
                 # skip the seq2seq model when we can
-                skip = self.trainer.skip_seq2seq(batch.doc.get([doc.TEXT, doc.UPOS]))
-                seq2seq_batch = DataLoader(document, self.config['batch_size'], self.config, vocab=self.vocab,
-                                           evaluation=True, skip=skip)
+                skip = self.trainer.skip_seq2seq(pairs)
             else:
-                seq2seq_batch = batch
-
-            preds = []
-            edits = []
-            for i, b in enumerate(seq2seq_batch):
-                ps, es = self.trainer.predict(b, self.config['beam_size'])
-                preds += ps
-                if es is not None:
-                    edits += es
+                skip = [False] * len(pairs)
+            preds, edits = self._predict_seq2seq(document, pairs, skip)
 
             if self.config.get('ensemble_dict', False):
                 preds = self.trainer.postprocess([x for x, y in zip(batch.doc.get([doc.TEXT]), skip) if not y], preds, edits=edits)
@@ -84,7 +135,7 @@ class LemmaProcessor(UDProcessor):
                     else:
                         preds1.append(preds[i])
                         i += 1
-                preds = self.trainer.ensemble(batch.doc.get([doc.TEXT, doc.UPOS]), preds1)
+                preds = self.trainer.ensemble(pairs, preds1)
             else:
                 preds = self.trainer.postprocess(batch.doc.get([doc.TEXT]), preds, edits=edits)
 
@@ -2,18 +2,46 @@
 Class for running multilingual pipelines
 """
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+
 import torch
 
 from stanza.models.common.doc import Document
 from stanza.pipeline.core import Pipeline
+from stanza.pipeline.pool import estimate_pipeline_memory
 from stanza.pipeline._constants import *
 from stanza.resources.common import DEFAULT_MODEL_DIR
 
+logger = logging.getLogger('stanza')
+
 
 class MultilingualPipeline:
     """
     Pipeline for handling multilingual data. Takes in text, detects language, and routes request to pipeline for that
     language.
+
+    The language specific pipelines are kept in an LRU cache of at
+    most max_cache_size pipelines.  If max_cache_memory is set, least
+    recently used pipelines are also dropped while the estimated
+    memory of the models in the cache is more than that many bytes.
+    The most recently used pipeline is always kept.
+
+    Languages in preload_langs are loaded when the MultilingualPipeline
+    is built.  Other languages are loaded in a background thread the
+    first time they are needed, while the languages which are already
+    loaded are processed.  The cache may be used from several threads.
+    close(), or using the MultilingualPipeline as a context manager,
+    stops those threads.
+
+    If lang_workers is more than 1, the batches for the different
+    languages in one call are run at the same time in a pool of that
+    many threads.  Torch releases the GIL while it computes, so the
+    languages do not wait for each other.  Each pipeline still uses
+    torch's own thread pool, so on CPU it may help to lower
+    torch.set_num_threads to avoid oversubscribing the cores.
     """
 
     def __init__(
@@ -23,49 +51,113 @@ class MultilingualPipeline:
         lang_configs: dict = None,
         ld_batch_size: int = 64,
         max_cache_size: int = 10,
-        use_gpu: bool = None
+        use_gpu: bool = None,
+        max_cache_memory: int = None,
+        preload_langs: list = None,
+        lang_workers: int = None
     ):
         # set up configs and cache for various language pipelines
         self.model_dir = model_dir
         self.lang_id_config = {} if lang_id_config is None else lang_id_config
         self.lang_configs = {} if lang_configs is None else lang_configs
+        if max_cache_size < 1:
+            raise ValueError("max_cache_size must be at least 1, not %d" % max_cache_size)
         self.max_cache_size = max_cache_size
-        self.pipeline_cache = {}
-        self.lang_request_history = []
-        
+        self.max_cache_memory = max_cache_memory
+        # least recently used languages first
+        self.pipeline_cache = OrderedDict()
+        self.pipeline_memory = {}
+        self._cache_lock = threading.RLock()
+        # pipelines being built, lang -> Future
+        self._loading = {}
+        # pipelines are built one at a time, as building one may download files
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stanza_pipeline_loader")
+        if lang_workers is not None and lang_workers > 1:
+            self._lang_executor = ThreadPoolExecutor(max_workers=lang_workers, thread_name_prefix="stanza_multilingual")
+        else:
+            self._lang_executor = None
+
         # set use_gpu
         if use_gpu is None:
             self.use_gpu = torch.cuda.is_available()
         else:
             self.use_gpu = use_gpu
-        
+
         # build language id pipeline
-        self.lang_id_pipeline = Pipeline(dir=self.model_dir, lang='multilingual', processors="langid", 
+        self.lang_id_pipeline = Pipeline(dir=self.model_dir, lang='multilingual', processors="langid",
                                          use_gpu=self.use_gpu, **self.lang_id_config)
 
+        if preload_langs:
+            for lang in preload_langs:
+                self.get_pipeline(lang)
+
+    def _lang_config(self, lang):
+        with self._cache_lock:
+            if lang not in self.lang_configs:
+                self.lang_configs[lang] = {'lang': lang}
+            return self.lang_configs[lang]
+
+    def _build_pipeline(self, lang):
+        """
+        Build the pipeline for a language, then add it to the cache, evicting old pipelines as needed
+        """
+        try:
+            pipeline = Pipeline(dir=self.model_dir, **self._lang_config(lang))
+            memory = estimate_pipeline_memory(pipeline)
+            with self._cache_lock:
+                self.pipeline_cache[lang] = pipeline
+                self.pipeline_memory[lang] = memory
+                self._evict()
+            return pipeline
+        finally:
+            with self._cache_lock:
+                self._loading.pop(lang, None)
+
+    def _evict(self):
+        # called with the cache lock held.  pipelines in use by other threads keep working after eviction
+        while len(self.pipeline_cache) > 1:
+            if len(self.pipeline_cache) <= self.max_cache_size:
+                if self.max_cache_memory is None or sum(self.pipeline_memory.values()) <= self.max_cache_memory:
+                    break
+            lru_lang, _ = self.pipeline_cache.popitem(last=False)
+            del self.pipeline_memory[lru_lang]
+            logger.debug("Dropping pipeline for %s from the multilingual cache", lru_lang)
+
+    def _request_pipeline(self, lang):
+        """
+        Return the cached pipeline for lang, or a Future for the pipeline if it needs to be built
+        """
+        with self._cache_lock:
+            if lang in self.pipeline_cache:
+                self.pipeline_cache.move_to_end(lang)
+                return self.pipeline_cache[lang]
+            if lang not in self._loading:
+                self._loading[lang] = self._loader.submit(self._build_pipeline, lang)
+            return self._loading[lang]
+
+    def get_pipeline(self, lang):
+        """
+        Return the pipeline for lang, loading it if needed
+        """
+        pipeline = self._request_pipeline(lang)
+        if not isinstance(pipeline, Pipeline):
+            pipeline = pipeline.result()
+        return pipeline
+
+    @staticmethod
+    def _run_pipeline(pipeline, docs):
+        """
+        Run a pipeline, or a Future for a pipeline which is being loaded, on the docs for its language
+        """
+        if not isinstance(pipeline, Pipeline):
+            pipeline = pipeline.result()
+        return pipeline(docs)
+
     def _update_pipeline_cache(self, lang):
         """
-        Do any necessary updates to the pipeline cache for this language. This includes building a new
-        pipeline for the lang, and possibly clearing out a language with the old last access date.
+        Make sure the pipeline for this language is in the cache, marked as the most recently used
         """
-        
-        # update request history
-        if lang in self.lang_request_history:
-            self.lang_request_history.remove(lang)
-        self.lang_request_history.append(lang)
-
-        # update language configs
-        if lang not in self.lang_configs:
-            self.lang_configs[lang] = {'lang': lang}
-
-        # update pipeline cache
-        if lang not in self.pipeline_cache:
-            # clear least recently used lang from pipeline cache
-            if len(self.pipeline_cache) == self.max_cache_size:
-                lru_lang = self.lang_request_history[0]
-                self.pipeline_cache.remove(lru_lang)
-                self.lang_request_history.remove(lru_lang)
-            self.pipeline_cache[lang] = Pipeline(dir=self.model_dir, **self.lang_configs[lang])
+        self.get_pipeline(lang)
 
     def process(self, doc):
         """
@@ -93,9 +185,19 @@ class MultilingualPipeline:
             lang_batches[doc.lang].append(doc)
 
         # run through each language, submit a batch to the language specific pipeline
-        for lang in lang_batches.keys():
-            self._update_pipeline_cache(lang)
-            self.pipeline_cache[lang](lang_batches[lang])
+        # languages which still need to be loaded are processed last, so the
+        # loading happens in the background while the other languages are processed
+        pipelines = {lang: self._request_pipeline(lang) for lang in lang_batches}
+        order = sorted(pipelines, key=lambda lang: not isinstance(pipelines[lang], Pipeline))
+        if self._lang_executor is None:
+            for lang in order:
+                self._run_pipeline(pipelines[lang], lang_batches[lang])
+        else:
+            # the docs are annotated in place, so they stay in the order they came in
+            futures = [self._lang_executor.submit(self._run_pipeline, pipelines[lang], lang_batches[lang])
+                       for lang in order]
+            for future in futures:
+                future.result()
 
         # only return a list if given a list
         if singleton_input:
@@ -107,3 +209,21 @@ class MultilingualPipeline:
         doc = self.process(doc)
         return doc
 
+    def close(self):
+        """
+        Stop the threads which load pipelines and run languages at the same time
+
+        A pipeline which is being loaded is finished first.  The cached
+        pipelines can still be used with get_pipeline, but process can't
+        load new languages afterwards.
+        """
+        self._loader.shutdown()
+        if self._lang_executor is not None:
+            self._lang_executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
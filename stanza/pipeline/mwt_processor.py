@@ -4,6 +4,8 @@ Processor for performing multi-word-token expansion
 
 import io
 
+from stanza.models.common.prediction_cache import PredictionCache, model_namespace, split_cached
+from stanza.models.common.utils import unsort
 from stanza.models.mwt.data import DataLoader
 from stanza.models.mwt.trainer import Trainer
 from stanza.pipeline._constants import *
@@ -17,29 +19,53 @@ class MWTProcessor(UDProcessor):
     # set of processor requirements for this processor
     REQUIRES_DEFAULT = set([TOKENIZE])
 
+    # default number of token expansions of the seq2seq model kept in memory
+    DEFAULT_CACHE_SIZE = 10000
+
     def _set_up_model(self, config, use_gpu):
         self._trainer = Trainer(model_file=config['model_path'], use_cuda=use_gpu)
 
+        # mwt_cache_path adds a persistent sqlite tier to the cache of seq2seq predictions
+        self._cache = None
+        cache_size = config.get('cache_size', MWTProcessor.DEFAULT_CACHE_SIZE)
+        cache_path = config.get('cache_path', None)
+        if (cache_size > 0 or cache_path) and not self._trainer.args['dict_only']:
+            settings = [self._trainer.args['beam_size']]
+            if config.get('quantize'):
+                settings.append(config['quantize'])
+            namespace = model_namespace(MWT, config['model_path'], *settings)
+            self._cache = PredictionCache(namespace, max_size=cache_size, filename=cache_path)
+
     def process(self, document):
-        batch = DataLoader(document, self.config['batch_size'], self.config, vocab=self.vocab, evaluation=True)
-        if len(batch) > 0:
-            dict_preds = self.trainer.predict_dict(batch.doc.get_mwt_expansions(evaluation=True))
+        expansions = document.get_mwt_expansions(evaluation=True)
+        if len(expansions) > 0:
             # decide trainer type and run eval
             if self.config['dict_only']:
-                preds = dict_preds
+                preds = self.trainer.predict_dict(expansions)
             else:
+                # each distinct token only goes through the model once, and tokens in the cache not at all
+                known, model_skip = split_cached(self._cache, expansions)
+                batch = DataLoader(document, self.config['batch_size'], self.config, vocab=self.vocab, evaluation=True,
+                                   sort_during_eval=True, skip=model_skip)
                 preds = []
                 for i, b in enumerate(batch):
                     preds += self.trainer.predict(b)
+                preds = unsort(preds, batch.data_orig_idx)
+
+                results = dict(zip([x for x, s in zip(expansions, model_skip) if not s], preds))
+                if self._cache is not None:
+                    self._cache.update(results)
+                results.update(known)
+                preds = [results[x] for x in expansions]
 
                 if self.config.get('ensemble_dict', False):
-                    preds = self.trainer.ensemble(batch.doc.get_mwt_expansions(evaluation=True), preds)
+                    preds = self.trainer.ensemble(expansions, preds)
         else:
             # skip eval if dev data does not exist
             preds = []
 
-        batch.doc.set_mwt_expansions(preds)
-        return batch.doc
+        document.set_mwt_expansions(preds)
+        return document
 
     def bulk_process(self, docs):
         """
@@ -49,3 +75,8 @@ class MWTProcessor(UDProcessor):
         for doc in docs:
             doc._count_words()
         return docs
+
+    def process_changed(self, document):
+        document = super().process_changed(document)
+        document._count_words()
+        return document
@@ -24,15 +24,18 @@ class NERProcessor(UDProcessor):
         # set up trainer
         args = {'charlm_forward_file': config.get('forward_charlm_path', None),
                 'charlm_backward_file': config.get('backward_charlm_path', None)}
-        self._trainer = Trainer(args=args, model_file=config['model_path'], use_cuda=use_gpu)
+        self._trainer = Trainer(args=args, model_file=config['model_path'], use_cuda=use_gpu,
+                                shared_charlms=self.pipeline.charlms)
 
     def process(self, document):
         # set up a eval-only data loader and skip tag preprocessing
         batch = DataLoader(
-            document, self.config['batch_size'], self.config, vocab=self.vocab, evaluation=True, preprocess_tags=False)
+            document, self.config['batch_size'], self.config, vocab=self.vocab, evaluation=True, preprocess_tags=False,
+            sort_during_eval=True)
         preds = []
         for i, b in enumerate(batch):
             preds += self.trainer.predict(b)
+        preds = unsort(preds, batch.data_orig_idx)
         batch.doc.set([doc.NER], [y for x in preds for y in x], to_token=True)
         # collect entities into document attribute
         total = len(batch.doc.build_ents())
@@ -47,3 +50,11 @@ class NERProcessor(UDProcessor):
         for doc in docs:
             doc.build_ents()
         return docs
+
+    def process_changed(self, document):
+        """
+        The entities of the whole document are collected again after the changed sentences are tagged
+        """
+        document = super().process_changed(document)
+        document.build_ents()
+        return document
@@ -0,0 +1,177 @@
+"""
+Class for running a Pipeline over several worker processes which share one copy of the models
+"""
+
+import itertools
+import logging
+import multiprocessing
+
+import numpy as np
+import torch
+
+from stanza.models.common.doc import Document
+from stanza.pipeline.core import Pipeline
+
+logger = logging.getLogger('stanza')
+
+# pipelines which the worker processes inherit when they are forked, keyed by the id of their pool
+_POOL_PIPELINES = {}
+
+def _init_worker(torch_threads):
+    if torch_threads is not None:
+        torch.set_num_threads(torch_threads)
+
+def _process_chunk(pool_key, docs):
+    return _POOL_PIPELINES[pool_key].process(docs)
+
+def pipeline_modules(pipeline):
+    """
+    Yield the torch modules used by the loaded processors of a pipeline
+    """
+    for processor in pipeline.loaded_processors:
+        for model in (getattr(processor, '_trainer', None), getattr(processor, '_model', None)):
+            if model is None:
+                continue
+            if isinstance(model, torch.nn.Module):
+                yield model
+                continue
+            for value in vars(model).values():
+                if isinstance(value, torch.nn.Module):
+                    yield value
+
+def pipeline_pretrain_embeddings(pipeline):
+    """
+    Yield (pretrain, embedding matrix) for the pretrains of a pipeline which are already loaded
+
+    The emb property is lazy, so pretrains which have not been used yet
+    are skipped.  Pretrains shared between processors are only returned once
+    """
+    seen = set()
+    for processor in pipeline.loaded_processors:
+        pretrain = getattr(processor, '_pretrain', None)
+        emb = getattr(pretrain, '_emb', None)
+        if isinstance(emb, np.ndarray) and id(pretrain) not in seen:
+            seen.add(id(pretrain))
+            yield pretrain, emb
+
+def share_pipeline_memory(pipeline):
+    """
+    Move the model parameters and pretrained embeddings of a pipeline into shared memory
+
+    Forked workers then read the same pages as the parent process,
+    rather than each one eventually holding its own copy.
+    """
+    # memory mapped pretrains are already shared through the page cache,
+    # and moving them to shared memory would read the entire file into memory
+    skip_ptrs = set()
+    # the other pretrains are moved to shared memory once.  The models wrap the pretrain
+    # with torch.from_numpy, so their weights are then pointed at that same copy
+    shared_embs = {}
+    old_embs = []
+    for pretrain, emb in list(pipeline_pretrain_embeddings(pipeline)):
+        if isinstance(emb, np.memmap):
+            skip_ptrs.add(emb.ctypes.data)
+        else:
+            shared = torch.from_numpy(emb).share_memory_()
+            shared_embs[emb.ctypes.data] = shared
+            skip_ptrs.add(shared.data_ptr())
+            # keep the old array alive until the models stop using it, so its address is not reused
+            old_embs.append(emb)
+            pretrain._emb = shared.numpy()
+
+    for module in pipeline_modules(pipeline):
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            shared = shared_embs.get(tensor.data_ptr())
+            if shared is not None and tensor.shape == shared.shape and tensor.dtype == shared.dtype:
+                tensor.data = shared
+            elif tensor.data_ptr() not in skip_ptrs:
+                tensor.share_memory_()
+
+def estimate_pipeline_memory(pipeline):
+    """
+    Estimate the number of bytes of memory used by the models of a pipeline
+
+    Counts the parameters and buffers of the models and the loaded
+    pretrained embeddings, each piece of memory once.  Memory mapped
+    pretrains are not counted, since the OS can drop those pages.
+    """
+    seen = set()
+    total = 0
+    for _, emb in pipeline_pretrain_embeddings(pipeline):
+        seen.add(emb.ctypes.data)
+        if not isinstance(emb, np.memmap):
+            total += emb.nbytes
+    for module in pipeline_modules(pipeline):
+        for tensor in itertools.chain(module.parameters(), module.buffers()):
+            if tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.nelement() * tensor.element_size()
+    return total
+
+class PipelinePool:
+    """
+    Loads a Pipeline once, then forks num_workers processes which all run that same Pipeline.
+
+    The models are loaded before the workers are created, so the weights are shared
+    between the processes instead of loaded once per process.  Documents are sent to
+    the workers in chunks of chunk_size and the results are returned in input order.
+    Note that the results are copies sent back from the workers, not the input Documents.
+
+    Workers are forked, so this requires the 'fork' start method and runs on cpu only,
+    as CUDA cannot be used in forked children.
+    """
+
+    def __init__(self, lang='en', processors={}, num_workers=None, chunk_size=16, torch_threads=1, **kwargs):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("PipelinePool requires the 'fork' multiprocessing start method, which is not available on this platform")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1, got {}".format(chunk_size))
+
+        kwargs['use_gpu'] = False
+        self.pipeline = Pipeline(lang=lang, processors=processors, **kwargs)
+        share_pipeline_memory(self.pipeline)
+
+        self.num_workers = num_workers if num_workers is not None else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+
+        self._key = id(self)
+        _POOL_PIPELINES[self._key] = self.pipeline
+        logger.info("Starting %d pipeline worker processes", self.num_workers)
+        self._pool = multiprocessing.get_context('fork').Pool(self.num_workers, initializer=_init_worker, initargs=(torch_threads,))
+
+    def process(self, doc):
+        """
+        Process a string, a Document, or a list of either.  Only returns a list if given a list
+        """
+        if self._pool is None:
+            raise RuntimeError("PipelinePool has already been closed")
+
+        singleton_input = not isinstance(doc, list)
+        docs = [doc] if singleton_input else doc
+        docs = [x if isinstance(x, Document) else Document([], text=x) for x in docs]
+
+        chunks = [docs[i:i+self.chunk_size] for i in range(0, len(docs), self.chunk_size)]
+        results = self._pool.starmap(_process_chunk, [(self._key, chunk) for chunk in chunks])
+        processed = [x for chunk in results for x in chunk]
+
+        if singleton_input:
+            return processed[0]
+        return processed
+
+    def close(self):
+        """ Shut down the worker processes """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        _POOL_PIPELINES.pop(self._key, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __call__(self, doc):
+        return self.process(doc)
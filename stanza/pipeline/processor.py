@@ -2,11 +2,24 @@
 Base classes for processors
 """
 
+import uuid
 from abc import ABC, abstractmethod
 
+from stanza.models.common import doc
 from stanza.models.common.doc import Document
+from stanza.pipeline._constants import *
 from stanza.pipeline.registry import NAME_TO_PROCESSOR_CLASS, PIPELINE_NAMES, PROCESSOR_VARIANTS
 
+# the fields of a sentence which each annotation sets
+ANNOTATION_FIELDS = {
+    TOKENIZE: set([doc.TOKENS]),
+    MWT: set([doc.WORDS]),
+    POS: set([doc.UPOS, doc.XPOS, doc.FEATS]),
+    LEMMA: set([doc.LEMMA]),
+    DEPPARSE: set([doc.HEAD, doc.DEPREL]),
+    NER: set([doc.NER]),
+}
+
 class ProcessorRequirementsException(Exception):
     """ Exception indicating a processor's requirements will not be met """
 
@@ -57,6 +70,8 @@ class Processor(ABC):
         self._config = config
         # pipeline building this processor (presently processors are only meant to exist in one pipeline)
         self._pipeline = pipeline
+        # recorded on the documents this processor annotates, so that only this processor reannotates them incrementally
+        self._instance_id = uuid.uuid4().hex
         self._set_up_variants(config, use_gpu)
         # run set up process
         # set up what annotations are required based on config
@@ -82,6 +97,11 @@ class Processor(ABC):
 
         return [self.process(doc) for doc in docs]
 
+    def process_changed(self, doc):
+        """ Process a Document which this processor has already annotated, after some of its sentences changed.
+        By default the whole Document is processed again. """
+        return self.process(doc)
+
     def _set_up_provides(self):
         """ Set up what processor requirements this processor fulfills.  Default is to use a class defined list. """
         self._provides = self.__class__.PROVIDES_DEFAULT
@@ -111,6 +131,11 @@ class Processor(ABC):
     def provides(self):
         return self._provides
 
+    @property
+    def instance_id(self):
+        """ A unique id of this processor, which stays the same in forked worker processes """
+        return self._instance_id
+
     @property
     def requires(self):
         return self._requires
@@ -157,6 +182,8 @@ class UDProcessor(Processor):
         self._vocab = None
         if not hasattr(self, '_variant'):
             self._set_up_model(config, use_gpu)
+            if config.get('exported_path') and self._trainer is not None:
+                self._set_up_exported(config['exported_path'], use_gpu)
 
         # build the final config for the processor
         self._set_up_final_config(config)
@@ -165,6 +192,15 @@ class UDProcessor(Processor):
     def _set_up_model(self, config, gpu):
         pass
 
+    def _set_up_exported(self, path, use_gpu):
+        """ Run the graph exported with stanza.utils.export_model in place of the model of the trainer. """
+        processor_name = list(self.__class__.PROVIDES_DEFAULT)[0]
+        if use_gpu:
+            raise ValueError("Exported models only run on cpu.  Please use use_gpu=False with %s_exported_path" % processor_name)
+        # the export module imports every model it can export, so it is only loaded when used
+        from stanza.models.common.export import load_exported
+        self._trainer.model = load_exported(path, self._trainer.vocab, name=processor_name)
+
     def _set_up_final_config(self, config):
         """ Finalize the configurations for this processor, based off of values from a UD model. """
         # set configurations from loaded model
@@ -181,6 +217,8 @@ class UDProcessor(Processor):
         """ Drop memory intensive resources if keeping this processor around for reasons other than running it. """
         self._trainer = None
         self._vocab = None
+        # pretrains may be shared with other processors, so this only drops this processor's reference
+        self._pretrain = None
 
     @property
     def pretrain(self):
@@ -194,6 +232,14 @@ class UDProcessor(Processor):
     def vocab(self):
         return self._vocab
 
+    @property
+    def input_fields(self):
+        """ The fields of a sentence which the annotations of this processor are predicted from """
+        # every processor reads the words of the sentence, even with pretagged input which has no requirements
+        fields = set([doc.TOKENS, doc.WORDS]).union(*[ANNOTATION_FIELDS.get(x, set()) for x in self.requires])
+        # corrections to the annotations of this processor are inputs of later processors only
+        return fields.difference(*[ANNOTATION_FIELDS.get(x, set()) for x in self.provides])
+
     @staticmethod
     def filter_out_option(option):
         """ Filter out non-processor configurations """
@@ -225,6 +271,29 @@ class UDProcessor(Processor):
 
         return docs
 
+    def process_changed(self, doc):
+        """
+        Only the sentences with a changed input field, such as corrected words or tags of an earlier processor, are
+        processed again.  As in bulk_process, they are combined into a Document of their own and the annotations are
+        attached to the sentence objects.
+        """
+
+        if hasattr(self, '_variant'):
+            return super().process_changed(doc)
+
+        input_fields = self.input_fields
+        changed_sents = [sent for sent in doc.sentences if not input_fields.isdisjoint(sent.changed_fields)]
+        if len(changed_sents) == 0:
+            return doc
+
+        changed_doc = Document([])
+        changed_doc.sentences = changed_sents
+        changed_doc._count_words()
+
+        self.process(changed_doc)
+
+        return doc
+
 class ProcessorRegisterException(Exception):
     """ Exception indicating processor or processor registration failure """
 
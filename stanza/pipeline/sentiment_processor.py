@@ -12,8 +12,7 @@ ClassifierProcessor and have "sentiment" be an option.
 import stanza.models.classifiers.cnn_classifier as cnn_classifier
 
 from stanza.models.common import doc
-from stanza.models.common.char_model import CharacterLanguageModel
-from stanza.models.common.pretrain import Pretrain
+from stanza.models.common.pretrain import get_shared_pretrain
 from stanza.pipeline._constants import *
 from stanza.pipeline.processor import UDProcessor, register_processor
 
@@ -30,11 +29,11 @@ class SentimentProcessor(UDProcessor):
     def _set_up_model(self, config, use_gpu):
         # get pretrained word vectors
         pretrain_path = config.get('pretrain_path', None)
-        self._pretrain = Pretrain(pretrain_path) if pretrain_path else None
+        self._pretrain = get_shared_pretrain(pretrain_path) if pretrain_path else None
         forward_charlm_path = config.get('forward_charlm_path', None)
-        charmodel_forward = CharacterLanguageModel.load(forward_charlm_path, finetune=False) if forward_charlm_path else None
+        charmodel_forward = self.pipeline.charlms.load(forward_charlm_path) if forward_charlm_path else None
         backward_charlm_path = config.get('backward_charlm_path', None)
-        charmodel_backward = CharacterLanguageModel.load(backward_charlm_path, finetune=False) if backward_charlm_path else None
+        charmodel_backward = self.pipeline.charlms.load(backward_charlm_path) if backward_charlm_path else None
         # set up model
         self._model = cnn_classifier.load(filename=config['model_path'],
                                           pretrain=self._pretrain,
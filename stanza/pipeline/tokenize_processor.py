@@ -138,3 +138,10 @@ class TokenizeProcessor(UDProcessor):
             charoffset += len(thisdoc.text) + 2
 
         return docs
+
+    def process_changed(self, document):
+        """
+        The tokens of an annotated document are kept, along with any corrections made to them.
+        Setting new text on the document has it tokenized from scratch instead.
+        """
+        return document
@@ -2,7 +2,10 @@
 Client for accessing Stanford CoreNLP in Python
 """
 
+import asyncio
 import atexit
+import base64
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import enum
 import io
@@ -16,12 +19,13 @@ import socket
 import subprocess
 import time
 import sys
+import threading
 import uuid
 
 from datetime import datetime
 from pathlib import Path
 
-from six.moves.urllib.parse import urlparse
+from six.moves.urllib.parse import urlencode, urlparse
 
 from stanza.protobuf import Document, parseFromDelimitedString, writeToDelimitedString, to_text
 __author__ = 'arunchaganty, kelvinguu, vzhong, wmonroe4'
@@ -96,12 +100,65 @@ def clean_props_file(props_file):
             os.remove(props_file)
 
 
+def content_type(properties):
+    """
+    The content-type header for a request with the given properties
+    """
+    input_format = properties.get("inputFormat", "text")
+    if input_format == "text":
+        return "text/plain; charset=utf-8"
+    elif input_format == "serialized":
+        return "application/x-protobuf"
+    else:
+        raise ValueError("Unrecognized inputFormat " + input_format)
+
+def parse_annotation(output_format, content):
+    """
+    Turn the bytes returned by an annotate request into the result for the given output_format
+    """
+    if output_format == "json":
+        return json.loads(content)
+    elif output_format == "serialized":
+        doc = Document()
+        parseFromDelimitedString(doc, content)
+        return doc
+    else:
+        return content.decode("utf-8")
+
+def regex_properties(annotators=None, properties=None):
+    """
+    The properties of a tokensregex, semgrex, or tregex request
+    """
+    if properties is None:
+        properties = {}
+        properties.update({
+            'inputFormat': 'text',
+            'serializer': 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
+        })
+    if annotators:
+        properties['annotators'] = ",".join(annotators) if isinstance(annotators, list) else annotators
+
+    # force output for regex requests to be json
+    properties['outputFormat'] = 'json'
+    # if the server is trying to send back character offsets, it
+    # should send back codepoints counts as well in case the text
+    # has extra wide characters
+    properties['tokenize.codepoint'] = 'true'
+    return properties
+
+
 class RobustService(object):
     """ Service that resuscitates itself if it is not available. """
     CHECK_ALIVE_TIMEOUT = 120
+    # after the service answers a ping, requests for this many seconds
+    # skip the ping.  a request which can't connect marks the service
+    # as inactive, so the next check pings (and restarts) it again
+    CHECK_ALIVE_INTERVAL = 10
+    # least number of connections kept open to the service
+    DEFAULT_POOL_SIZE = 10
 
     def __init__(self, start_cmd, stop_cmd, endpoint, stdout=None,
-                 stderr=None, be_quiet=False, host=None, port=None, ignore_binding_error=False):
+                 stderr=None, be_quiet=False, host=None, port=None, ignore_binding_error=False, pool_size=None):
         self.start_cmd = start_cmd and shlex.split(start_cmd)
         self.stop_cmd = stop_cmd and shlex.split(stop_cmd)
         self.endpoint = endpoint
@@ -114,13 +171,34 @@ class RobustService(object):
         self.host = host
         self.port = port
         self.ignore_binding_error = ignore_binding_error
+        # one session for all the requests, so connections are kept alive and reused
+        self.session = requests.Session()
+        self.pool_size = 0
+        self.ensure_pool_size(max(pool_size or 0, self.DEFAULT_POOL_SIZE))
+        # annotate_many calls ensure_alive from several threads
+        self._alive_lock = threading.RLock()
+        self._last_alive = None
         atexit.register(self.atexit_kill)
 
+    def ensure_pool_size(self, pool_size):
+        """
+        Keep at least pool_size connections open to the service
+
+        A pool smaller than the number of requests sent at once would
+        close and reopen the extra connections for every request.
+        """
+        if pool_size <= self.pool_size:
+            return
+        self.pool_size = pool_size
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
     def is_alive(self):
         try:
             if not self.ignore_binding_error and self.server is not None and self.server.poll() is not None:
                 return False
-            return requests.get(self.endpoint + "/ping").ok
+            return self.session.get(self.endpoint + "/ping").ok
         except requests.exceptions.ConnectionError as e:
             raise ShouldRetryException(e)
 
@@ -180,6 +258,8 @@ class RobustService(object):
         if self.stop_cmd:
             subprocess.run(self.stop_cmd, check=True)
         self.is_active = False
+        # the session is still usable afterwards, it just drops its open connections
+        self.session.close()
 
     def __enter__(self):
         self.start()
@@ -188,37 +268,70 @@ class RobustService(object):
     def __exit__(self, _, __, ___):
         self.stop()
 
+    def recently_alive(self):
+        """
+        True if the service answered a ping recently enough that ensure_alive would not check it again
+        """
+        return (self.is_active and self._last_alive is not None and
+                time.time() - self._last_alive < self.CHECK_ALIVE_INTERVAL and
+                (self.server is None or self.server.poll() is None))
+
     def ensure_alive(self):
-        # Check if the service is active and alive
-        if self.is_active:
-            try:
-                if self.is_alive():
+        with self._alive_lock:
+            # Check if the service is active and alive
+            if self.is_active:
+                if self.recently_alive():
                     return
-                else:
-                    self.stop()
-            except ShouldRetryException:
-                pass
+                try:
+                    if self.is_alive():
+                        self._last_alive = time.time()
+                        return
+                    else:
+                        self.stop()
+                except ShouldRetryException:
+                    pass
 
-        # If not, try to start up the service.
-        if self.server is None:
-            self.start()
+            # If not, try to start up the service.
+            if self.server is None:
+                self.start()
 
-        # Wait for the service to start up.
-        start_time = time.time()
-        while True:
-            try:
-                if self.is_alive():
-                    break
-            except ShouldRetryException:
-                pass
+            # Wait for the service to start up.
+            start_time = time.time()
+            while True:
+                try:
+                    if self.is_alive():
+                        break
+                except ShouldRetryException:
+                    pass
 
-            if time.time() - start_time < self.CHECK_ALIVE_TIMEOUT:
-                time.sleep(1)
-            else:
-                raise PermanentlyFailedException("Timed out waiting for service to come alive.")
+                if time.time() - start_time < self.CHECK_ALIVE_TIMEOUT:
+                    time.sleep(1)
+                else:
+                    raise PermanentlyFailedException("Timed out waiting for service to come alive.")
+
+            # At this point we are guaranteed that the service is alive.
+            self.is_active = True
+            self._last_alive = time.time()
+
+    def _post(self, url, **kwargs):
+        """
+        Post to the service with the shared session, restarting the service if it went away
 
-        # At this point we are guaranteed that the service is alive.
-        self.is_active = True
+        If the service can't be reached even after checking it is
+        alive, raises ShouldRetryException
+        """
+        self.ensure_alive()
+        try:
+            return self.session.post(url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            # the service may have gone away since it was last checked
+            self.is_active = False
+        self.ensure_alive()
+        try:
+            return self.session.post(url, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            self.is_active = False
+            raise ShouldRetryException(e) from e
 
 
 def resolve_classpath(classpath=None):
@@ -250,6 +363,7 @@ class CoreNLPClient(RobustService):
     DEFAULT_OUTPUT_FORMAT = "serialized"
     DEFAULT_MEMORY = "5G"
     DEFAULT_MAX_CHAR_LENGTH = 100000
+    DEFAULT_MAX_RETRIES = 3
 
     def __init__(self, start_server=StartServer.FORCE_START,
                  endpoint=DEFAULT_ENDPOINT,
@@ -353,9 +467,11 @@ class CoreNLPClient(RobustService):
             host = port = None
 
         super(CoreNLPClient, self).__init__(start_cmd, stop_cmd, endpoint,
-                                            stdout, stderr, be_quiet, host=host, port=port, ignore_binding_error=(start_server == StartServer.TRY_START))
+                                            stdout, stderr, be_quiet, host=host, port=port, ignore_binding_error=(start_server == StartServer.TRY_START),
+                                            pool_size=threads)
 
         self.timeout = timeout
+        self.threads = threads
 
     def _setup_client_defaults(self):
         """
@@ -433,25 +549,17 @@ class CoreNLPClient(RobustService):
         :param (dict) properties: properties that the server expects
         :return: request result
         """
-        self.ensure_alive()
-
         try:
-            input_format = properties.get("inputFormat", "text")
-            if input_format == "text":
-                ctype = "text/plain; charset=utf-8"
-            elif input_format == "serialized":
-                ctype = "application/x-protobuf"
-            else:
-                raise ValueError("Unrecognized inputFormat " + input_format)
+            ctype = content_type(properties)
             # handle auth
             if 'username' in kwargs and 'password' in kwargs:
                 kwargs['auth'] = requests.auth.HTTPBasicAuth(kwargs['username'], kwargs['password'])
                 kwargs.pop('username')
                 kwargs.pop('password')
-            r = requests.post(self.endpoint,
-                              params={'properties': str(properties), 'resetDefault': str(reset_default).lower()},
-                              data=buf, headers={'content-type': ctype},
-                              timeout=(self.timeout*2)/1000, **kwargs)
+            r = self._post(self.endpoint,
+                           params={'properties': str(properties), 'resetDefault': str(reset_default).lower()},
+                           data=buf, headers={'content-type': ctype},
+                           timeout=(self.timeout*2)/1000, **kwargs)
             r.raise_for_status()
             return r
         except requests.HTTPError as e:
@@ -483,6 +591,19 @@ class CoreNLPClient(RobustService):
         :return: request result
         """
 
+        request_properties, reset_default = self._annotate_properties(annotators, output_format, properties, reset_default)
+        r = self._request(text.encode('utf-8'), request_properties, reset_default, **kwargs)
+        if request_properties["outputFormat"] in ["json", "serialized", "text", "conllu", "conll", "xml"]:
+            return parse_annotation(request_properties["outputFormat"], r.content)
+        else:
+            return r
+
+    def _annotate_properties(self, annotators=None, output_format=None, properties=None, reset_default=None):
+        """
+        Build the properties of an annotate request, following the precedence described in annotate
+
+        :return: the request properties and the reset_default value to send with them
+        """
         # validate request properties
         validate_corenlp_props(properties=properties, annotators=annotators, output_format=output_format)
         # set request properties
@@ -516,21 +637,42 @@ class CoreNLPClient(RobustService):
         if output_format is not None and type(output_format) == str:
             request_properties['outputFormat'] = output_format
 
-        # make the request
         # if not explicitly set or the case of pipelineLanguage, reset_default should be None
         if reset_default is None:
             reset_default = False
-        r = self._request(text.encode('utf-8'), request_properties, reset_default, **kwargs)
-        if request_properties["outputFormat"] == "json":
-            return r.json()
-        elif request_properties["outputFormat"] == "serialized":
-            doc = Document()
-            parseFromDelimitedString(doc, r.content)
-            return doc
-        elif request_properties["outputFormat"] in ["text", "conllu", "conll", "xml"]:
-            return r.text
-        else:
-            return r
+        return request_properties, reset_default
+
+    def annotate_many(self, texts, max_concurrency=None, max_retries=DEFAULT_MAX_RETRIES, **kwargs):
+        """
+        Annotate several texts, sending up to max_concurrency requests to the server at once
+
+        :param texts: the texts to annotate
+        :param (int) max_concurrency: how many requests to have in flight.  defaults to the server's thread count
+        :param (int) max_retries: how many times to retry a text if the server could not be reached
+        :param kwargs: passed to annotate, such as annotators, output_format, or properties
+
+        :return: a list of the results of annotate, in the same order as texts
+        """
+        texts = list(texts)
+        if max_concurrency is None:
+            max_concurrency = self.threads
+        max_concurrency = max(1, min(max_concurrency, len(texts)))
+        self.ensure_pool_size(max_concurrency)
+
+        def annotate_one(text):
+            for attempt in range(max_retries + 1):
+                try:
+                    return self.annotate(text, **kwargs)
+                except ShouldRetryException:
+                    if attempt == max_retries:
+                        raise
+                    logger.debug("Retrying a request to %s", self.endpoint)
+                    time.sleep(attempt)
+
+        if max_concurrency <= 1:
+            return [annotate_one(text) for text in texts]
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(annotate_one, texts))
 
     def update(self, doc, annotators=None, properties=None):
         if properties is None:
@@ -577,34 +719,13 @@ class CoreNLPClient(RobustService):
         :param properties: option to filter sentences that contain matches, if false returns matches
         :return: request result
         """
-        self.ensure_alive()
-        if properties is None:
-            properties = {}
-            properties.update({
-                'inputFormat': 'text',
-                'serializer': 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
-            })
-        if annotators:
-            properties['annotators'] = ",".join(annotators) if isinstance(annotators, list) else annotators
-
-        # force output for regex requests to be json
-        properties['outputFormat'] = 'json'
-        # if the server is trying to send back character offsets, it
-        # should send back codepoints counts as well in case the text
-        # has extra wide characters
-        properties['tokenize.codepoint'] = 'true'
+        properties = regex_properties(annotators, properties)
 
         try:
             # Error occurs unless put properties in params
-            input_format = properties.get("inputFormat", "text")
-            if input_format == "text":
-                ctype = "text/plain; charset=utf-8"
-            elif input_format == "serialized":
-                ctype = "application/x-protobuf"
-            else:
-                raise ValueError("Unrecognized inputFormat " + input_format)
+            ctype = content_type(properties)
             # change request method from `get` to `post` as required by CoreNLP
-            r = requests.post(
+            r = self._post(
                 self.endpoint + path, params={
                     'pattern': pattern,
                     'filter': filter,
@@ -625,6 +746,255 @@ class CoreNLPClient(RobustService):
             raise AnnotationException(r.text)
 
 
+class AsyncCoreNLPClient:
+    """
+    An asyncio client to the Stanford CoreNLP server.
+
+    Takes the same arguments as CoreNLPClient, which it uses to start,
+    check, and stop the server, plus max_connections, the number of
+    requests which can be sent to the server at once.  This defaults to
+    the number of threads the server uses.
+
+    Requests are sent over plain asyncio streams, with the connections
+    kept alive and reused, so no extra http library is needed.
+    Protobuf and json results are parsed in a worker thread.
+
+        async with AsyncCoreNLPClient(annotators="tokenize,ssplit,pos") as client:
+            docs = await asyncio.gather(*[client.annotate(text) for text in texts])
+    """
+    def __init__(self, *args, max_connections=None, **kwargs):
+        self.client = CoreNLPClient(*args, **kwargs)
+        endpoint = urlparse(self.client.endpoint)
+        self._ssl = endpoint.scheme == "https"
+        self._host = endpoint.hostname
+        self._port = endpoint.port if endpoint.port else (443 if self._ssl else 80)
+        self._path = endpoint.path.rstrip("/")
+        self.max_connections = max_connections if max_connections else self.client.threads
+        # open connections which are not currently in use
+        self._idle = []
+        # built when first needed, so that it belongs to the running event loop
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, _, __, ___):
+        await self.stop()
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.client.start)
+
+    async def stop(self):
+        await self.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.client.stop)
+
+    async def close(self):
+        """
+        Close the idle connections to the server
+        """
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def ensure_alive(self):
+        # the check may ping the server or even start it, so it runs in a thread
+        if not self.client.recently_alive():
+            await asyncio.get_running_loop().run_in_executor(None, self.client.ensure_alive)
+
+    async def _send(self, connection, path, params, data, headers):
+        """
+        Send one request on the connection and read the response
+
+        :return: status code, response headers, body, and whether the connection can be reused
+        """
+        reader, writer = connection
+        target = self._path + path + "?" + urlencode(params)
+        lines = ["POST %s HTTP/1.1" % target,
+                 "Host: %s:%d" % (self._host, self._port),
+                 "Content-Length: %d" % len(data),
+                 "Connection: keep-alive"]
+        lines.extend("%s: %s" % (key, value) for key, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+        # interim 1xx responses, such as 100 Continue, come before the real one
+        status = 100
+        while 100 <= status < 200:
+            version, status, response_headers = await self._read_head(reader)
+
+        keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("Connection closed by the server")
+                size = self._parse_int(line.split(b";")[0].strip(), 16)
+                if size == 0:
+                    # skip the trailer headers, which end with an empty line
+                    while (await reader.readline()).strip():
+                        pass
+                    break
+                chunk = await reader.readexactly(size + 2)
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        elif "content-length" in response_headers:
+            body = await reader.readexactly(self._parse_int(response_headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, response_headers, body, keep_alive
+
+    async def _read_head(self, reader):
+        """
+        Read the status line and the headers of a response
+
+        A response which does not follow HTTP raises AnnotationException,
+        which is not retried, as sending the request again would not help.
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        pieces = status_line.decode("latin-1").split()
+        if len(pieces) < 2 or not pieces[0].startswith("HTTP/"):
+            raise AnnotationException("Malformed status line from the CoreNLP server: %r" % status_line)
+        version, status = pieces[0], self._parse_int(pieces[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed by the server")
+            line = line.decode("latin-1").strip()
+            if not line:
+                return version, status, headers
+            if ":" not in line:
+                raise AnnotationException("Malformed header from the CoreNLP server: %r" % line)
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+
+    @staticmethod
+    def _parse_int(text, base=10):
+        try:
+            return int(text, base)
+        except ValueError:
+            raise AnnotationException("Malformed response from the CoreNLP server: %r" % text) from None
+
+    async def _post(self, path, params, data, headers):
+        """
+        Post a request to the server, returning the status code and body
+
+        A kept-alive connection the server has since closed is simply
+        replaced.  If a new connection fails, the server is checked
+        with ensure_alive (restarting it if needed) and the request is
+        tried once more before raising ShouldRetryException.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        timeout = (self.client.timeout * 2) / 1000
+        failures = 0
+        await self.ensure_alive()
+        async with self._semaphore:
+            while True:
+                reused = len(self._idle) > 0
+                connection = self._idle.pop() if reused else None
+                try:
+                    if connection is None:
+                        connection = await asyncio.wait_for(
+                            asyncio.open_connection(self._host, self._port, ssl=self._ssl or None), timeout)
+                    status, _, body, keep_alive = await asyncio.wait_for(
+                        self._send(connection, path, params, data, headers), timeout)
+                except asyncio.TimeoutError:
+                    self._close_connection(connection)
+                    raise TimeoutException("CoreNLP request timed out after %.1f seconds" % timeout)
+                except AnnotationException:
+                    # a malformed response leaves the connection in an unknown state
+                    self._close_connection(connection)
+                    raise
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    # OSError includes the ConnectionErrors
+                    self._close_connection(connection)
+                    if reused:
+                        continue
+                    self.client.is_active = False
+                    failures += 1
+                    if failures > 1:
+                        raise ShouldRetryException(e) from e
+                    await self.ensure_alive()
+                    continue
+                if keep_alive:
+                    self._idle.append(connection)
+                else:
+                    self._close_connection(connection)
+                return status, body
+
+    @staticmethod
+    def _close_connection(connection):
+        if connection is not None:
+            connection[1].close()
+
+    async def annotate(self, text, annotators=None, output_format=None, properties=None, reset_default=None, username=None, password=None):
+        """
+        Send a request to the CoreNLP server.
+
+        The arguments and results are the same as CoreNLPClient.annotate
+        """
+        request_properties, reset_default = self.client._annotate_properties(annotators, output_format, properties, reset_default)
+        headers = {'content-type': content_type(request_properties)}
+        if username is not None and password is not None:
+            credentials = base64.b64encode(("%s:%s" % (username, password)).encode("utf-8")).decode("ascii")
+            headers['authorization'] = "Basic " + credentials
+        params = {'properties': str(request_properties), 'resetDefault': str(reset_default).lower()}
+        status, body = await self._post("", params, text.encode('utf-8'), headers)
+        if status >= 400:
+            message = body.decode("utf-8", errors="replace")
+            if message == "CoreNLP request timed out. Your document may be too long.":
+                raise TimeoutException(message)
+            else:
+                raise AnnotationException(message)
+
+        output_format = request_properties["outputFormat"]
+        if output_format in ("json", "serialized"):
+            return await asyncio.get_running_loop().run_in_executor(None, parse_annotation, output_format, body)
+        return parse_annotation(output_format, body)
+
+    async def tokensregex(self, text, pattern, filter=False, to_words=False, annotators=None, properties=None):
+        matches = await self._regex('/tokensregex', text, pattern, filter, annotators, properties)
+        if to_words:
+            matches = regex_matches_to_indexed_words(matches)
+        return matches
+
+    async def semgrex(self, text, pattern, filter=False, to_words=False, annotators=None, properties=None):
+        matches = await self._regex('/semgrex', text, pattern, filter, annotators, properties)
+        if to_words:
+            matches = regex_matches_to_indexed_words(matches)
+        return matches
+
+    async def tregex(self, text, pattern, filter=False, annotators=None, properties=None):
+        return await self._regex('/tregex', text, pattern, filter, annotators, properties)
+
+    async def _regex(self, path, text, pattern, filter, annotators=None, properties=None):
+        """
+        Send a regex-related request to the CoreNLP server.
+
+        The arguments and results are the same as for CoreNLPClient
+        """
+        properties = regex_properties(annotators, properties)
+        headers = {'content-type': content_type(properties)}
+        params = {'pattern': pattern, 'filter': filter, 'properties': str(properties)}
+        status, body = await self._post(path, params, text.encode('utf-8'), headers)
+        message = body.decode("utf-8", errors="replace")
+        if status >= 400:
+            if message.startswith("Timeout"):
+                raise TimeoutException(message)
+            else:
+                raise AnnotationException(message)
+        try:
+            return json.loads(message)
+        except json.JSONDecodeError:
+            raise AnnotationException(message)
+
+
 def read_corenlp_props(props_path):
     """ Read a Stanford CoreNLP properties file into a dict """
     props_dict = {}
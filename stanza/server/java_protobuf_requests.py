@@ -1,23 +1,33 @@
+import atexit
 from collections import deque
+import logging
+import os
 import subprocess
+import threading
+import time
 
 from stanza.models.constituency.parse_tree import Tree
 from stanza.protobuf import FlattenedParseTree
 from stanza.server.client import resolve_classpath
 
+logger = logging.getLogger('stanza')
+
+# by default, a pool can run this many java processes at once for each java_main
+DEFAULT_POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# java processes which have not been used for this many seconds are shut down
+DEFAULT_IDLE_TIMEOUT = 60
+
 def send_request(request, response_type, java_main, classpath=None):
     """
-    Use subprocess to run a Java protobuf processor on the given request
+    Run a Java protobuf processor on the given request
+
+    The request goes to the process-wide pool of java processes for
+    this java_main, so repeated calls do not pay for starting a new JVM
+    each time.  See get_java_pool
 
     Returns the protobuf response
     """
-    pipe = subprocess.run(["java", "-cp", resolve_classpath(classpath), java_main],
-                          input=request.SerializeToString(),
-                          stdout=subprocess.PIPE,
-                          check=True)
-    response = response_type()
-    response.ParseFromString(pipe.stdout)
-    return response
+    return get_java_pool(java_main, classpath).process_request(request, response_type)
 
 def add_tree_nodes(proto_tree, tree, score):
     # add an open node
@@ -152,6 +162,83 @@ def add_word_to_graph(graph, word, sent_idx, word_idx):
         edge.target = word_idx+1
         edge.dep = word.deprel
 
+class JavaProtobufWorker(object):
+    """
+    One java process which answers protobuf requests
+
+    The process is run with -multiple, so it reads any number of
+    requests, each one prefixed with its length as 4 bytes, and
+    answers each in the same format.  A length of 0 tells it to exit.
+    """
+    def __init__(self, classpath, java_main):
+        self.pipe = subprocess.Popen(["java", "-cp", classpath, java_main, "-multiple"],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+        self.java_main = java_main
+        self.last_used = time.monotonic()
+        self.timed_out = False
+
+    def is_alive(self):
+        return self.pipe.poll() is None
+
+    def kill(self):
+        if self.pipe.poll() is None:
+            self.pipe.kill()
+            self.pipe.wait()
+
+    def _timeout(self):
+        self.timed_out = True
+        self.pipe.kill()
+
+    def process_request(self, request, build_response, timeout=None):
+        """
+        Send one request and wait for the response
+
+        If the process dies, or takes more than timeout seconds, the
+        process is killed, as the stream may be left in the middle of a
+        message, and an exception is raised.
+        """
+        text = request.SerializeToString()
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._timeout)
+            timer.start()
+        try:
+            self.pipe.stdin.write(len(text).to_bytes(4, 'big'))
+            self.pipe.stdin.write(text)
+            self.pipe.stdin.flush()
+            response_length = self.pipe.stdout.read(4)
+            if len(response_length) < 4:
+                raise RuntimeError("Could not communicate with java process!")
+            response_length = int.from_bytes(response_length, "big")
+            response_text = self.pipe.stdout.read(response_length)
+            if len(response_text) < response_length:
+                raise RuntimeError("Could not communicate with java process!")
+        except (OSError, RuntimeError) as e:
+            self.kill()
+            if self.timed_out:
+                raise TimeoutError("Java process %s did not answer within %s seconds" % (self.java_main, timeout)) from e
+            if isinstance(e, OSError):
+                raise RuntimeError("Could not communicate with java process!") from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        self.last_used = time.monotonic()
+        response = build_response()
+        response.ParseFromString(response_text)
+        return response
+
+    def close(self):
+        if self.pipe.poll() is None:
+            try:
+                self.pipe.stdin.write((0).to_bytes(4, 'big'))
+                self.pipe.stdin.flush()
+                self.pipe.stdin.close()
+                self.pipe.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+
 class JavaProtobufContext(object):
     """
     A generic context for sending requests to a java program using protobufs in a subprocess
@@ -163,27 +250,170 @@ class JavaProtobufContext(object):
 
 
     def __enter__(self):
-        self.pipe = subprocess.Popen(["java", "-cp", self.classpath, self.java_main, "-multiple"],
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE)
+        self.worker = JavaProtobufWorker(self.classpath, self.java_main)
+        self.pipe = self.worker.pipe
         return self
 
     def __exit__(self, type, value, traceback):
-        if self.pipe.poll() is None:
-            self.pipe.stdin.write((0).to_bytes(4, 'big'))
-            self.pipe.stdin.flush()
+        self.worker.close()
 
     def process_request(self, request):
-        text = request.SerializeToString()
-        self.pipe.stdin.write(len(text).to_bytes(4, 'big'))
-        self.pipe.stdin.write(text)
-        self.pipe.stdin.flush()
-        response_length = self.pipe.stdout.read(4)
-        if len(response_length) < 4:
-            raise RuntimeError("Could not communicate with java process!")
-        response_length = int.from_bytes(response_length, "big")
-        response_text = self.pipe.stdout.read(response_length)
-        response = self.build_response()
-        response.ParseFromString(response_text)
-        return response
+        return self.worker.process_request(request, self.build_response)
+
+class JavaProtobufPool(object):
+    """
+    A pool of long lived java processes for one java_main
+
+    Requests from different threads are sent to different processes
+    at the same time.  Processes are started as they are needed, up
+    to num_workers of them.  Once all of them are busy, further
+    requests wait for one to finish.
+
+    A process which dies is dropped, and a new one is started the next
+    time one is needed.  Processes which have been idle for
+    idle_timeout seconds are shut down.  If timeout is set, a request
+    which takes longer than that many seconds kills its process and
+    raises TimeoutError.
+    """
+    def __init__(self, classpath, java_main, num_workers=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.classpath = resolve_classpath(classpath)
+        self.java_main = java_main
+        if num_workers is None:
+            num_workers = DEFAULT_POOL_WORKERS
+        if num_workers < 1:
+            raise ValueError("A JavaProtobufPool needs at least one worker, not %d" % num_workers)
+        self.num_workers = num_workers
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._condition = threading.Condition()
+        # processes not currently in use, most recently used last
+        self._idle = []
+        # number of processes either in use or idle
+        self._num_running = 0
+        self._reaper = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @property
+    def num_running(self):
+        return self._num_running
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("JavaProtobufPool for %s has been closed" % self.java_main)
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.is_alive():
+                        return worker
+                    logger.debug("Java process for %s died while idle", self.java_main)
+                    self._num_running -= 1
+                if self._num_running < self.num_workers:
+                    self._num_running += 1
+                    break
+                self._condition.wait()
+
+        # starting a JVM is slow, so this happens outside the lock
+        try:
+            return JavaProtobufWorker(self.classpath, self.java_main)
+        except:
+            with self._condition:
+                self._num_running -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker):
+        with self._condition:
+            keep = worker.is_alive() and not self._closed
+            if keep:
+                self._idle.append(worker)
+                self._start_reaper()
+            else:
+                self._num_running -= 1
+            self._condition.notify()
+        if not keep:
+            worker.close()
+
+    def _start_reaper(self):
+        # called with the lock held
+        if self.idle_timeout is None or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap_idle_workers, daemon=True)
+        self._reaper.start()
+
+    def _reap_idle_workers(self):
+        while True:
+            with self._condition:
+                if not self._idle or self._closed:
+                    self._reaper = None
+                    return
+                now = time.monotonic()
+                expired = [worker for worker in self._idle if now - worker.last_used >= self.idle_timeout]
+                if expired:
+                    self._idle = [worker for worker in self._idle if now - worker.last_used < self.idle_timeout]
+                    self._num_running -= len(expired)
+                    self._condition.notify_all()
+                else:
+                    oldest = min(worker.last_used for worker in self._idle)
+                    self._condition.wait(oldest + self.idle_timeout - now)
+            for worker in expired:
+                logger.debug("Shutting down idle java process for %s", self.java_main)
+                worker.close()
+
+    def process_request(self, request, build_response):
+        """
+        Send one request to an available process and return the response
+        """
+        worker = self._acquire()
+        try:
+            return worker.process_request(request, build_response, self.timeout)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        """
+        Shut down the idle processes.  Processes in use are shut down when their request finishes
+        """
+        with self._condition:
+            self._closed = True
+            workers = self._idle
+            self._idle = []
+            self._num_running -= len(workers)
+            self._condition.notify_all()
+        for worker in workers:
+            worker.close()
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_java_pool(java_main, classpath=None):
+    """
+    Returns the process-wide JavaProtobufPool for this java_main and classpath, creating it if needed
+    """
+    classpath = resolve_classpath(classpath)
+    key = (java_main, classpath)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key, None)
+        if pool is None:
+            pool = JavaProtobufPool(classpath, java_main)
+            _POOLS[key] = pool
+    return pool
+
+def close_java_pools():
+    """
+    Shut down all of the process-wide java pools.  New pools are created if more requests are sent
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
 
+atexit.register(close_java_pools)
@@ -20,16 +20,12 @@ whose description is in the proto file included with stanza.
 
 A minimal example is the main method of this module.
 
-Note that launching the subprocess is potentially quite expensive
-relative to the search if used many times on small documents.  Ideally
-larger texts would be processed, and all of the desired semgrex
-patterns would be run at once.  The worst thing to do would be to call
-this multiple times on a large document, one invocation per semgrex
-pattern, as that would serialize the document each time.  There are of
-course multiple ways of making this more efficient, such as including
-it as a separate call in the server or keeping the subprocess alive
-for multiple queries, but we didn't do any of those.  We do, however,
-accept pull requests...
+process_doc sends its requests to a pool of java processes which are
+kept alive between calls (see JavaProtobufPool), so only the first
+call pays for starting java.  It is still best to run all of the
+desired semgrex patterns at once.  The worst thing to do would be to
+call this multiple times on a large document, one invocation per
+semgrex pattern, as that would serialize the document each time.
 """
 
 import stanza
@@ -1,6 +1,10 @@
+import random
+
 import pytest
 
 from stanza.models.constituency import parse_transitions
+from stanza.models.constituency import transition_sequence
+from stanza.models.constituency import tree_reader
 from stanza.models.constituency.base_model import SimpleModel
 from stanza.models.constituency.parse_transitions import TransitionScheme
 from stanza.tests import *
@@ -410,3 +414,40 @@ def test_sort():
     transitions = set(expected)
     transitions = sorted(transitions)
     assert transitions == expected
+
+def check_legal_mask(model, transitions, trees, steps=80):
+    """
+    Walk through random legal transitions, checking that legal_transition_mask agrees with is_legal
+    """
+    transitions = sorted(transitions)
+    categories = parse_transitions.transition_categories(transitions, model)
+    rng = random.Random(1000)
+    for _ in range(5):
+        states = parse_transitions.initial_state_from_gold_trees(trees, model)
+        for _ in range(steps):
+            mask = parse_transitions.legal_transition_mask(states, model, categories)
+            expected = [[t.is_legal(state, model) for t in transitions] for state in states]
+            assert mask.tolist() == expected
+            states = [state for state, legal in zip(states, expected) if any(legal) and not state.finished(model)]
+            if not states:
+                break
+            chosen = [rng.choice([t for t, is_legal in zip(transitions, legal) if is_legal])
+                      for legal in expected if any(legal)]
+            states = parse_transitions.bulk_apply(model, states, chosen)
+
+@pytest.mark.parametrize("transition_scheme", list(TransitionScheme))
+def test_legal_mask(transition_scheme):
+    text = ("((SBARQ (WHNP (WP Who)) (SQ (VP (VBZ sits) (PP (IN in) (NP (DT this) (NN seat))))) (. ?)))"
+            "((S (VP (VB Unban)) (NP (NNP Mox) (NNP Opal))))")
+    trees = tree_reader.read_trees(text)
+    model = SimpleModel(transition_scheme)
+    sequences = transition_sequence.build_treebank(trees, transition_scheme)
+    transitions = set(transition_sequence.all_transitions(sequences))
+    # add a few transitions the gold trees don't use, so the root rules are exercised
+    transitions.update([parse_transitions.OpenConstituent("ROOT"),
+                        parse_transitions.OpenConstituent("S"),
+                        parse_transitions.CompoundUnary(["ROOT"]),
+                        parse_transitions.CompoundUnary(["NP"]),
+                        parse_transitions.Shift(),
+                        parse_transitions.CloseConstituent()])
+    check_legal_mask(model, transitions, trees)
@@ -2,10 +2,13 @@ import logging
 import tempfile
 
 import pytest
+import torch
 
 from stanza.models import constituency_parser
 from stanza.models.common import pretrain
+from stanza.models.common.quantization import quantize_model
 from stanza.models.constituency import lstm_model
+from stanza.models.constituency import parse_transitions
 from stanza.models.constituency import trainer
 from stanza.models.constituency import tree_reader
 from stanza.tests import *
@@ -87,3 +90,104 @@ def test_save_load_model(pt):
 
         # load it back in
         tr.load(filename, pt, None, None, False)
+
+def tagged_words_from_trees(trees):
+    return [[(pt.children[0].label, pt.label) for pt in tree.preterminals()] for tree in trees]
+
+def test_parse_order(pt):
+    """
+    The trees should come back in the same order as the sentences, even though short sentences finish first
+    """
+    model = build_trainer(pt).model
+    words = tagged_words_from_trees(tree_reader.read_trees(TREEBANK)) * 3
+    with torch.no_grad():
+        trees = trainer.parse_tagged_words(model, words, 2)
+    assert len(trees) == len(words)
+    for tree, sentence in zip(trees, words):
+        assert [x.children[0].label for x in tree.preterminals()] == [word for word, _ in sentence]
+
+def test_beam_size_one(pt):
+    """
+    A beam of size 1 should find the same trees and scores as the greedy parse
+    """
+    model = build_trainer(pt).model
+    model.eval()
+    words = tagged_words_from_trees(tree_reader.read_trees(TREEBANK))
+    with torch.no_grad():
+        greedy = trainer.parse_sentences(iter(words), trainer.build_batch_from_tagged_words, 3, model)
+        states = parse_transitions.initial_state_from_words(words, model)
+        beam = trainer.beam_search(model, states, beam_size=1, k_best=1)
+    assert len(greedy) == len(beam)
+    for (_, greedy_results), beam_results in zip(greedy, beam):
+        assert len(greedy_results) == 1
+        assert len(beam_results) == 1
+        assert greedy_results[0][0] == beam_results[0][0]
+        assert greedy_results[0][1] < 0.0
+        assert greedy_results[0][1] == pytest.approx(beam_results[0][1])
+
+def test_k_best(pt):
+    """
+    Check that the k best lists are sorted, the right size, and for the right sentences
+    """
+    model = build_trainer(pt).model
+    words = tagged_words_from_trees(tree_reader.read_trees(TREEBANK))
+    with torch.no_grad():
+        results = trainer.parse_tagged_words(model, words, 3, beam_size=4, k_best=3)
+    assert len(results) == len(words)
+    for k_best, sentence in zip(results, words):
+        assert 1 <= len(k_best) <= 3
+        scores = [score for _, score in k_best]
+        assert scores == sorted(scores, reverse=True)
+        for tree, _ in k_best:
+            assert [x.children[0].label for x in tree.preterminals()] == [word for word, _ in sentence]
+
+def test_unparsed_sentence(pt, monkeypatch):
+    """
+    A sentence which could not be parsed keeps its place in the results, so the other trees line up with their sentences
+    """
+    model = build_trainer(pt).model
+    words = tagged_words_from_trees(tree_reader.read_trees(TREEBANK))
+    stuck_length = len(words[1])
+
+    predict = model.predict
+    def stuck_predict(states, is_legal=True):
+        predictions, transitions = predict(states, is_legal=is_legal)
+        transitions = [None if state.sentence_length == stuck_length else transition
+                       for state, transition in zip(states, transitions)]
+        return predictions, transitions
+    monkeypatch.setattr(model, "predict", stuck_predict)
+
+    beam_search = trainer.beam_search
+    def stuck_beam_search(model, states, beam_size, k_best):
+        results = beam_search(model, states, beam_size, k_best)
+        return [[] if state.sentence_length == stuck_length else result for state, result in zip(states, results)]
+    monkeypatch.setattr(trainer, "beam_search", stuck_beam_search)
+
+    with torch.no_grad():
+        trees = trainer.parse_tagged_words(model, words, 2)
+        kbest = trainer.parse_tagged_words(model, words, 2, beam_size=3, k_best=2)
+    assert len(trees) == len(words)
+    assert len(kbest) == len(words)
+    assert trees[1] is None
+    assert kbest[1] == []
+    for idx, sentence in enumerate(words):
+        if idx == 1:
+            continue
+        assert [x.children[0].label for x in trees[idx].preterminals()] == [word for word, _ in sentence]
+        for tree, _ in kbest[idx]:
+            assert [x.children[0].label for x in tree.preterminals()] == [word for word, _ in sentence]
+
+def test_quantized_parse(pt):
+    """
+    The parser still works once its LSTM and Linear layers are quantized
+    """
+    model = build_trainer(pt).model
+    words = tagged_words_from_trees(tree_reader.read_trees(TREEBANK))
+    quantize_model(model)
+    with torch.no_grad():
+        trees = trainer.parse_tagged_words(model, words, 2)
+        kbest = trainer.parse_tagged_words(model, words, 2, beam_size=3, k_best=2)
+    assert len(trees) == len(words)
+    for tree, sentence in zip(trees, words):
+        assert [x.children[0].label for x in tree.preterminals()] == [word for word, _ in sentence]
+    assert all(len(results) == 2 for results in kbest)
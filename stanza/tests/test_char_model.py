@@ -0,0 +1,166 @@
+"""
+Tests of the charlm output cache and of sharing charlms in a pipeline
+"""
+
+import os
+import tempfile
+
+import pytest
+import torch
+
+from stanza.models.common.char_model import CharacterLanguageModel, CharlmOutputCache, SharedCharlms, CHARLM_END, CHARLM_START
+from stanza.models.common.data import get_long_tensor, sort_all
+from stanza.models.common.utils import inference_mode
+from stanza.models.common.vocab import CharVocab
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+SENTENCES = [["this", "is", "a", "test"],
+             ["unban", "mox", "opal"],
+             ["x"],
+             ["this", "is", "a", "test", "too"]]
+
+def build_charlm(num_layers=1):
+    torch.manual_seed(1234)
+    vocab = {'char': CharVocab([[["abcdefghijklmnopqrstuvwxyz .\n"]]], 'en', idx=0)}
+    args = {'char_emb_dim': 10, 'char_hidden_dim': 16, 'char_num_layers': num_layers, 'char_dropout': 0.1, 'char_rec_dropout': 0}
+    model = CharacterLanguageModel(args, vocab)
+    for param in model.parameters():
+        torch.nn.init.normal_(param, std=0.3)
+    model.eval()
+    return model
+
+def sentence_chars(model, words, padding=0):
+    """
+    Chars and offsets the way the NER model builds them, plus the extra padding the sentiment model adds
+    """
+    chars = [CHARLM_START]
+    offsets = []
+    for word in words:
+        chars.extend(word)
+        chars.append(CHARLM_END)
+        offsets.append(len(chars) - 1)
+    for _ in range(padding):
+        chars.append(CHARLM_END)
+        offsets.append(len(chars) - 1)
+    return model.char_vocab().map(chars), offsets
+
+def count_encodes(model):
+    calls = []
+    encode = model.encode
+    def counting_encode(chars, charlens, hidden=None):
+        calls.append(sum(charlens))
+        return encode(chars, charlens, hidden)
+    model.encode = counting_encode
+    return calls
+
+def check_same(expected, results):
+    assert len(expected) == len(results)
+    for x, y in zip(expected, results):
+        assert x.shape == y.shape
+        assert torch.allclose(x, y, atol=1e-6)
+
+@pytest.mark.parametrize("num_layers", [1, 2])
+def test_output_cache(num_layers):
+    """
+    Sequences which are in the cache are not run again, and the results do not change
+    """
+    model = build_charlm(num_layers)
+    chars, offsets = zip(*[sentence_chars(model, words) for words in SENTENCES])
+    with inference_mode():
+        expected = model.build_char_representation(chars, offsets)
+
+        model.output_cache = CharlmOutputCache(10)
+        calls = count_encodes(model)
+        check_same(expected, model.build_char_representation(chars, offsets))
+        assert len(calls) == 1
+        assert len(model.output_cache) == len(SENTENCES)
+
+        check_same(expected, model.build_char_representation(chars, offsets))
+        assert len(calls) == 1
+
+@pytest.mark.parametrize("num_layers", [1, 2])
+def test_padded_sequences(num_layers):
+    """
+    A cached sequence followed by more padding only runs the charlm over the padding
+    """
+    model = build_charlm(num_layers)
+    chars, offsets = zip(*[sentence_chars(model, words) for words in SENTENCES])
+    padded_chars, padded_offsets = zip(*[sentence_chars(model, words, padding=3) for words in SENTENCES])
+    with inference_mode():
+        expected = model.build_char_representation(padded_chars, padded_offsets)
+
+        model.output_cache = CharlmOutputCache(10)
+        model.build_char_representation(chars, offsets)
+        calls = count_encodes(model)
+        check_same(expected, model.build_char_representation(padded_chars, padded_offsets))
+        assert calls == [3 * len(SENTENCES)]
+
+def test_get_representation():
+    """
+    get_representation gives the same results whether or not it uses the cache
+    """
+    model = build_charlm()
+    # as in the NER batches, the sentences are sorted by number of words
+    sentences = sorted(SENTENCES, key=len, reverse=True)
+    chars, offsets = zip(*[sentence_chars(model, words) for words in sentences])
+    charlens = [len(x) for x in chars]
+    (chars, offsets), orig_idx = sort_all([chars, offsets], charlens)
+    charlens = [len(x) for x in chars]
+    chars = get_long_tensor(chars, len(chars), pad_id=model.pad_id())
+
+    with inference_mode():
+        expected = model.get_representation(chars, offsets, charlens, orig_idx)
+        model.output_cache = CharlmOutputCache(10)
+        model.get_representation(chars, offsets, charlens, orig_idx)
+        result = model.get_representation(chars, offsets, charlens, orig_idx)
+    assert torch.equal(expected.batch_sizes, result.batch_sizes)
+    assert torch.allclose(expected.data, result.data, atol=1e-6)
+
+def test_cache_needs_autograd_off():
+    """
+    With autograd on, the cache is not used
+    """
+    model = build_charlm()
+    model.output_cache = CharlmOutputCache(10)
+    chars, offsets = zip(*[sentence_chars(model, words) for words in SENTENCES])
+    model.build_char_representation(chars, offsets)
+    assert len(model.output_cache) == 0
+
+def test_cache_size():
+    model = build_charlm()
+    model.output_cache = CharlmOutputCache(2)
+    chars, offsets = zip(*[sentence_chars(model, words) for words in SENTENCES])
+    with inference_mode():
+        model.build_char_representation(chars, offsets)
+    assert len(model.output_cache) == 2
+    model.output_cache.clear()
+    assert len(model.output_cache) == 0
+
+def test_shared_charlms():
+    """
+    Each file is only loaded once
+    """
+    model = build_charlm()
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        filename = os.path.join(tempdir, "charlm.pt")
+        model.save(filename)
+
+        charlms = SharedCharlms(cache_size=10)
+        first = charlms.load(filename)
+        second = charlms.load(os.path.join(tempdir, ".", "charlm.pt"))
+        assert first is second
+        assert len(charlms) == 1
+        assert isinstance(first.output_cache, CharlmOutputCache)
+        assert not first.finetune
+
+        chars, offsets = zip(*[sentence_chars(first, words) for words in SENTENCES])
+        with inference_mode():
+            first.build_char_representation(chars, offsets)
+        assert len(first.output_cache) == len(SENTENCES)
+        charlms.clear_caches()
+        assert len(first.output_cache) == 0
+
+        assert SharedCharlms(cache_size=0).load(filename).output_cache is None
@@ -0,0 +1,58 @@
+"""
+Test the MST decoding used by the dependency parser
+"""
+
+import pytest
+import numpy as np
+
+from stanza.models.common import chuliu_edmonds
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+def random_scores(rng, batch_size, max_len):
+    scores = rng.normal(size=(batch_size, max_len, max_len)) * 3
+    scores[:, np.arange(max_len), np.arange(max_len)] = -np.inf
+    # log softmax, as produced by the parser
+    return scores - np.log(np.exp(scores).sum(axis=2, keepdims=True))
+
+def check_tree(tree):
+    # exactly one word attached to the root
+    assert (tree[1:] == 0).sum() == 1
+    # every word reaches the root
+    for node in range(1, len(tree)):
+        seen = set()
+        while node != 0:
+            assert node not in seen
+            seen.add(node)
+            node = tree[node]
+
+def test_tarjan():
+    # 1 <-> 2 is a cycle, 3 hangs off the cycle, 4 attaches to the root
+    tree = np.array([0, 2, 1, 1, 0])
+    cycles = chuliu_edmonds.tarjan(tree)
+    assert len(cycles) == 1
+    np.testing.assert_array_equal(cycles[0], [False, True, True, False, False])
+
+    assert chuliu_edmonds.tarjan(np.array([0, 0, 1, 2])) == []
+
+def test_one_root():
+    rng = np.random.default_rng(1234)
+    for scores in random_scores(rng, 20, 12):
+        check_tree(chuliu_edmonds.chuliu_edmonds_one_root(scores))
+
+def test_batch_matches_single():
+    """
+    The batched decoder should give exactly the same trees as decoding one sentence at a time
+    """
+    rng = np.random.default_rng(1234)
+    for max_len in (2, 5, 17, 40):
+        scores = random_scores(rng, 10, max_len)
+        lengths = rng.integers(2, max_len + 1, size=10)
+        lengths[0] = max_len
+        trees = chuliu_edmonds.chuliu_edmonds_one_root_batch(scores, lengths)
+        assert len(trees) == 10
+        for tree, sentence_scores, length in zip(trees, scores, lengths):
+            assert len(tree) == length
+            expected = chuliu_edmonds.chuliu_edmonds_one_root(sentence_scores[:length, :length])
+            np.testing.assert_array_equal(tree, expected)
+            check_tree(tree)
@@ -2,12 +2,21 @@
 Tests that call a running CoreNLPClient.
 """
 
+import asyncio
+import http.server
+import io
+import json
+import logging
 import pytest
 import stanza.server as corenlp
 import stanza.server.client as client
 import shlex
 import subprocess
+import threading
 import time
+import urllib.parse
+
+from stanza.protobuf import Document, writeToDelimitedString
 
 from stanza.tests import *
 
@@ -184,3 +193,235 @@ def test_external_server_force_start():
     assert external_server_process
     external_server_process.terminate()
     external_server_process.wait(5)
+
+def chunked_response(body):
+    # two chunks, one with an extension, then a trailer
+    return (b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n" +
+            b"%x;name=value\r\n%s\r\n" % (3, body[:3]) + b"%x\r\n%s\r\n" % (len(body) - 3, body[3:]) +
+            b"0\r\nX-Trailer: done\r\n\r\n")
+
+def continue_response(body):
+    return (b"HTTP/1.1 100 Continue\r\n\r\n" +
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+
+def close_response(body):
+    # no Content-Length, so the body ends when the connection is closed
+    return b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n" + body
+
+def malformed_response(body):
+    return b"HTTP/1.1 200 OK\r\nContent-Type application/json\r\n\r\n" + body
+
+# responses the fake server writes by hand, for the texts which ask for them
+RAW_RESPONSES = {
+    "chunked": chunked_response,
+    "continue": continue_response,
+    "close": close_response,
+    "malformed": malformed_response,
+}
+
+class FakeCoreNLPHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers annotate requests by echoing the text back as json
+
+    Keeps track of how many connections were opened, the most
+    requests it was handling at once, and which texts it should
+    drop the connection for
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_json(200, "pong")
+
+    def do_POST(self):
+        self.path = urllib.parse.unquote_plus(self.path)
+        text = self.rfile.read(int(self.headers['Content-Length'])).decode("utf-8")
+        with self.server.lock:
+            if self.server.failures.get(text, 0) > 0:
+                self.server.failures[text] -= 1
+                self.close_connection = True
+                return
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(0.05)
+        with self.server.lock:
+            self.server.active -= 1
+        if text == "bad request":
+            self.send_json(500, "Bad request")
+        elif text in RAW_RESPONSES:
+            self.send_raw(text)
+        elif "'outputFormat': 'serialized'" in self.path:
+            self.send_serialized(text)
+        else:
+            self.send_json(200, {"text": text})
+
+    def send_serialized(self, text):
+        with io.BytesIO() as stream:
+            writeToDelimitedString(Document(text=text), stream)
+            body = stream.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_raw(self, text):
+        body = json.dumps({"text": text}).encode("utf-8")
+        self.wfile.write(RAW_RESPONSES[text](body))
+        self.close_connection = text in ("close", "malformed")
+
+    def send_json(self, code, value):
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def fake_server():
+    server = http.server.ThreadingHTTPServer(("localhost", 0), FakeCoreNLPHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.active = 0
+    server.max_active = 0
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def fake_server_client(server):
+    return corenlp.CoreNLPClient(start_server=corenlp.StartServer.DONT_START,
+                                 endpoint="http://localhost:%d" % server.server_address[1],
+                                 output_format="json")
+
+def test_keep_alive(fake_server):
+    """ Test that one connection is reused for many requests """
+    with fake_server_client(fake_server) as fake_client:
+        for idx in range(5):
+            assert fake_client.annotate("text %d" % idx) == {"text": "text %d" % idx}
+    assert fake_server.connections == 1
+
+def test_annotate_many(fake_server):
+    """ Test that annotate_many runs requests at the same time and keeps them in order """
+    texts = ["text %d" % idx for idx in range(20)]
+    with fake_server_client(fake_server) as fake_client:
+        results = fake_client.annotate_many(texts, max_concurrency=4)
+    assert results == [{"text": text} for text in texts]
+    assert 1 < fake_server.max_active <= 4
+    assert fake_server.connections <= 4
+
+def test_pool_size(fake_server, caplog):
+    """ Test that the connection pool grows to the number of requests in flight, so no connection is thrown away """
+    texts = ["text %d" % idx for idx in range(30)]
+    with corenlp.CoreNLPClient(start_server=corenlp.StartServer.DONT_START, threads=12,
+                               endpoint="http://localhost:%d" % fake_server.server_address[1],
+                               output_format="json") as fake_client:
+        assert fake_client.pool_size == 12
+        with caplog.at_level(logging.WARNING, logger="urllib3"):
+            results = fake_client.annotate_many(texts, max_concurrency=15)
+        assert fake_client.pool_size == 15
+        assert results == [{"text": text} for text in texts]
+        assert not any("pool is full" in record.getMessage() for record in caplog.records)
+        assert fake_server.connections <= 15
+
+def test_annotate_many_retry(fake_server):
+    """ Test that a text whose connection keeps getting dropped is retried """
+    texts = ["text %d" % idx for idx in range(6)]
+    fake_server.failures["text 3"] = 3
+    with fake_server_client(fake_server) as fake_client:
+        results = fake_client.annotate_many(texts, max_concurrency=2)
+        assert results == [{"text": text} for text in texts]
+
+        fake_server.failures["text 3"] = 10
+        with pytest.raises(corenlp.ShouldRetryException):
+            fake_client.annotate_many(texts, max_concurrency=2, max_retries=1)
+
+def fake_async_client(server, **kwargs):
+    return corenlp.AsyncCoreNLPClient(start_server=corenlp.StartServer.DONT_START,
+                                      endpoint="http://localhost:%d" % server.server_address[1],
+                                      output_format="json", **kwargs)
+
+def test_async_annotate(fake_server):
+    """ Test that the async client can have several requests in flight and reuses its connections """
+    texts = ["text %d" % idx for idx in range(20)]
+    async def run():
+        async with fake_async_client(fake_server, max_connections=4) as fake_client:
+            return await asyncio.gather(*[fake_client.annotate(text) for text in texts])
+    results = asyncio.run(run())
+    assert results == [{"text": text} for text in texts]
+    assert 1 < fake_server.max_active <= 4
+    # one more connection for the ping from the CoreNLPClient
+    assert fake_server.connections <= 5
+
+def test_async_serialized(fake_server):
+    """ Test that the protobuf results are parsed into a Document """
+    async def run():
+        async with fake_async_client(fake_server) as fake_client:
+            return await fake_client.annotate("Unban Mox Opal", output_format="serialized")
+    doc = asyncio.run(run())
+    assert isinstance(doc, Document)
+    assert doc.text == "Unban Mox Opal"
+
+def test_async_regex(fake_server):
+    """ The regex requests are answered with json """
+    async def run():
+        async with fake_async_client(fake_server) as fake_client:
+            return await fake_client.tokensregex("Unban Mox Opal", "Mox")
+    assert asyncio.run(run()) == {"text": "Unban Mox Opal"}
+
+def test_async_errors(fake_server):
+    """ Test dropped connections and server errors """
+    async def run():
+        async with fake_async_client(fake_server) as fake_client:
+            assert await fake_client.annotate("first") == {"text": "first"}
+            # a kept alive connection which went away is replaced
+            fake_server.failures["second"] = 1
+            assert await fake_client.annotate("second") == {"text": "second"}
+
+            fake_server.failures["third"] = 10
+            with pytest.raises(corenlp.ShouldRetryException):
+                await fake_client.annotate("third")
+
+            with pytest.raises(corenlp.AnnotationException):
+                await fake_client.annotate("bad request")
+    asyncio.run(run())
+
+def test_async_responses(fake_server):
+    """ Test chunked bodies, interim responses, and a server which closes the connection """
+    async def run():
+        async with fake_async_client(fake_server, max_connections=1) as fake_client:
+            results = []
+            for text in ("first", "chunked", "continue", "second", "close", "third"):
+                results.append(await fake_client.annotate(text))
+                connections.append(fake_server.connections)
+            return results
+    connections = []
+    results = asyncio.run(run())
+    assert results == [{"text": text} for text in ("first", "chunked", "continue", "second", "close", "third")]
+    # the connection is kept until the server closes it
+    assert connections[:5] == [connections[0]] * 5
+    assert connections[5] == connections[0] + 1
+
+def test_async_malformed(fake_server):
+    """ A response which is not HTTP is an error rather than a retry """
+    async def run():
+        async with fake_async_client(fake_server) as fake_client:
+            with pytest.raises(corenlp.AnnotationException):
+                await fake_client.annotate("malformed")
+            # the next request gets a new connection
+            assert await fake_client.annotate("first") == {"text": "first"}
+    connections = fake_server.connections
+    asyncio.run(run())
+    # the ping, the malformed request, which was not sent again, and the next request
+    assert fake_server.connections == connections + 3
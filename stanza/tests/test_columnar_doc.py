@@ -0,0 +1,132 @@
+"""
+Tests of the columnar document, which should read and write the same as a Document
+"""
+
+import tracemalloc
+
+import pytest
+
+from stanza.models.common.columnar_doc import ColumnarDocument, ColumnarToken, ColumnarWord
+from stanza.models.common.doc import Document
+from stanza.utils.conll import CoNLL
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+CONLLU = """
+# text = Il a vu au marché.
+1	Il	il	PRON	PRP	Number=Sing	3	nsubj	_	start_char=0|end_char=2
+2	a	avoir	AUX	VBZ	_	3	aux	_	start_char=3|end_char=4
+3	vu	voir	VERB	VBN	_	0	root	_	start_char=5|end_char=7
+4-5	au	_	_	_	_	_	_	_	start_char=8|end_char=10
+4	à	à	ADP	IN	_	6	case	_	_
+5	le	le	DET	DT	_	6	det	_	_
+6	marché	marché	NOUN	NN	Gender=Masc	3	obl	_	start_char=11|end_char=17|SpaceAfter=No
+7	.	.	PUNCT	.	_	3	punct	_	start_char=17|end_char=18
+
+# text = Oui
+1	Oui	oui	INTJ	UH	_	0	root	_	start_char=19|end_char=22
+""".lstrip()
+
+TEXT = "Il a vu au marché. Oui"
+
+@pytest.fixture
+def doc():
+    sentences, _ = CoNLL.conll2dict(input_str=CONLLU)
+    return Document(sentences, text=TEXT)
+
+@pytest.fixture
+def columnar(doc):
+    return ColumnarDocument.from_document(doc)
+
+def test_same_as_document(doc, columnar):
+    """
+    A ColumnarDocument has the same sentences, tokens, words and fields as the Document it was built from
+    """
+    assert columnar.to_dict() == doc.to_dict()
+    assert columnar.num_tokens == doc.num_tokens
+    assert columnar.num_words == doc.num_words
+    for field in ('id', 'text', 'lemma', 'upos', 'xpos', 'feats', 'head', 'deprel', 'misc', 'start_char', 'end_char'):
+        assert columnar.get(field) == doc.get(field)
+        assert columnar.get([field, 'text'], as_sentences=True) == doc.get([field, 'text'], as_sentences=True)
+    for field in ('id', 'text', 'misc', 'ner', 'start_char', 'end_char'):
+        assert columnar.get(field, from_token=True) == doc.get(field, from_token=True)
+
+    for sentence, columnar_sentence in zip(doc.sentences, columnar.sentences):
+        assert columnar_sentence.text == sentence.text
+        assert columnar_sentence.dependencies_string() == sentence.dependencies_string()
+
+    assert columnar.to_document().to_dict() == doc.to_dict()
+
+def test_views(columnar):
+    """
+    Words and tokens are views of the columns, with the same links as in a Document
+    """
+    sentence = columnar.sentences[0]
+    token = sentence.tokens[3]
+    assert isinstance(token, ColumnarToken)
+    assert token.id == (4, 5)
+    assert [word.text for word in token.words] == ["à", "le"]
+
+    word = token.words[1]
+    assert isinstance(word, ColumnarWord)
+    assert word.parent == token
+    assert word.sent == sentence
+    assert columnar.sentences[1].words[0].sent.id == 1
+    assert word.pretty_print() == "<ColumnarWord id=5;text=le;lemma=le;upos=DET;xpos=DT;head=6;deprel=det>"
+    assert not hasattr(word, '__dict__')
+
+    word.upos = "PRON"
+    word.lemma = "_"
+    word.head = "2"
+    assert columnar.get(['upos', 'lemma', 'head'])[4] == ["PRON", None, 2]
+    assert sentence.words[4].pos == "PRON"
+
+    with pytest.raises(ValueError):
+        word.id = 3
+    with pytest.raises(ValueError):
+        token.start_char = 3
+
+def test_set(columnar):
+    """
+    set writes whole columns, which the views then read
+    """
+    columnar.set(['upos', 'deprel'], [["X", "_"]] * columnar.num_words)
+    assert [word.upos for word in columnar.iter_words()] == ["X"] * columnar.num_words
+    assert [word.deprel for word in columnar.iter_words()] == [None] * columnar.num_words
+    assert columnar.column('upos').values[columnar.column('upos').ids[0]] == "X"
+
+    columnar.set('ner', ["O", "B-LOC", "I-LOC", "E-LOC", "O", "O", "O"], to_token=True)
+    assert columnar.sentences[0].tokens[3].ner == "E-LOC"
+
+    with pytest.raises(ValueError):
+        columnar.set('start_char', list(range(columnar.num_words)))
+    with pytest.raises(ValueError):
+        columnar.get('sentiment')
+
+def test_memory():
+    """
+    A large batch takes much less memory as a ColumnarDocument than as a Document
+    """
+    upos = ["NOUN", "VERB", "DET", "ADJ", "PUNCT"]
+    def build_sentences():
+        return [[{'id': i+1, 'text': "w%d" % (i % 50), 'lemma': "w%d" % (i % 50), 'upos': upos[i % 5], 'xpos': "NN",
+                  'feats': "Number=Sing", 'head': 0 if i == 0 else 1, 'deprel': "dep",
+                  'start_char': j * 100 + i * 5, 'end_char': j * 100 + i * 5 + 4}
+                 for i in range(20)]
+                for j in range(2000)]
+
+    sizes = {}
+    for doc_class in (Document, ColumnarDocument):
+        sentences = build_sentences()
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            doc = doc_class(sentences)
+            sizes[doc_class] = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        assert doc.num_words == 40000
+
+    assert sizes[ColumnarDocument] * 4 < sizes[Document]
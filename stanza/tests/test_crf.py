@@ -0,0 +1,41 @@
+"""
+Basic tests of the CRF viterbi decoding
+"""
+
+import numpy as np
+import pytest
+import torch
+
+from stanza.models.common.crf import CRFLoss, viterbi_decode, batch_viterbi_decode
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+def test_batch_viterbi_decode():
+    """
+    The batched decoding should give the same results as decoding one sentence at a time
+    """
+    rng = np.random.default_rng(1234)
+    scores = rng.standard_normal((6, 9, 5)).astype(np.float32)
+    transitions = rng.standard_normal((5, 5)).astype(np.float32)
+    lengths = [9, 1, 4, 9, 7, 2]
+
+    tags, tag_scores = batch_viterbi_decode(scores, transitions, lengths)
+    assert len(tags) == len(lengths)
+    for i, length in enumerate(lengths):
+        expected_tags, expected_score = viterbi_decode(scores[i, :length], transitions)
+        assert len(tags[i]) == length
+        assert list(tags[i]) == list(expected_tags)
+        assert tag_scores[i] == pytest.approx(expected_score)
+
+def test_crf_loss_without_tags():
+    """
+    With no gold tags, CRFLoss skips the loss and only returns the transitions
+    """
+    crit = CRFLoss(4)
+    inputs = torch.randn(2, 3, 4)
+    masks = torch.zeros(2, 3, dtype=torch.bool)
+    loss, transitions = crit(inputs, masks, None)
+    assert loss is None
+    assert transitions is crit._transitions
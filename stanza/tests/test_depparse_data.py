@@ -57,6 +57,33 @@ def test_data_to_batches_eval_mode():
     batched_data = data_to_batches(data, batch_size=5, eval_mode=True, sort_during_eval=False, min_length_to_batch_separately=3)
     check_batches(batched_data[0], [1, 4, 1], ['A', 'B', 'C'])
 
+def test_data_to_batches_padded():
+    """
+    With padded=True, the budget is the length of the longest sentence times the number of sentences
+    """
+    data = make_fake_data(3, 2, 1)
+    batched_data = data_to_batches(data, batch_size=5, eval_mode=True, sort_during_eval=True, min_length_to_batch_separately=None, padded=True)
+    check_batches(batched_data[0], [3, 3], ['A', 'B', 'C'])
+
+    # one long sentence no longer pads the short sentences up to its length
+    data = make_fake_data(1, 1, 8, 1, 1)
+    batched_data = data_to_batches(data, batch_size=8, eval_mode=True, sort_during_eval=True, min_length_to_batch_separately=None, padded=True)
+    check_batches(batched_data[0], [8, 4], ['C', 'E', 'D', 'B', 'A'])
+    assert batched_data[1] == [2, 4, 3, 1, 0]
+
+def test_data_to_batches_max_sentences():
+    """
+    max_batch_sentences limits the number of sentences in a batch, with or without a word budget
+    """
+    data = make_fake_data(1, 1, 1, 1, 1)
+    batched_data = data_to_batches(data, batch_size=None, eval_mode=True, sort_during_eval=False, min_length_to_batch_separately=None, max_batch_sentences=2)
+    check_batches(batched_data[0], [2, 2, 1], ['A', 'B', 'C', 'D', 'E'])
+    assert batched_data[1] is None
+
+    data = make_fake_data(2, 2, 1, 1, 1)
+    batched_data = data_to_batches(data, batch_size=4, eval_mode=True, sort_during_eval=False, min_length_to_batch_separately=None, max_batch_sentences=3, padded=True)
+    check_batches(batched_data[0], [4, 3], ['A', 'B', 'C', 'D', 'E'])
+
 if __name__ == '__main__':
     test_data_to_batches()
 
@@ -2,7 +2,7 @@ import pytest
 
 import stanza
 from stanza.tests import *
-from stanza.models.common.doc import Document, ID, TEXT, NER
+from stanza.models.common.doc import Document, Word, ID, TEXT, NER, UPOS, LEMMA, TOKENS, WORDS, CONSTITUENCY, CONSTITUENCY_KBEST
 
 pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
 
@@ -42,6 +42,19 @@ def test_set_sentence(doc):
     assert doc.sentences[0].sentiment == "4"
     assert doc.sentences[1].sentiment == "0"
 
+def test_set_constituency(doc):
+    """
+    The constituency fields start unset, and an unparsed sentence can be set to None or an empty k best list
+    """
+    assert doc.sentences[0].constituency is None
+    assert doc.sentences[0].constituency_kbest is None
+    doc.set(CONSTITUENCY, ["(ROOT (S foo))", None], to_sentence=True)
+    doc.set(CONSTITUENCY_KBEST, [[("(ROOT (S foo))", -0.5)], []], to_sentence=True)
+    assert doc.sentences[0].constituency == "(ROOT (S foo))"
+    assert doc.sentences[1].constituency is None
+    assert doc.sentences[0].constituency_kbest == [("(ROOT (S foo))", -0.5)]
+    assert doc.sentences[1].constituency_kbest == []
+
 def test_set_tokens(doc):
     """
     Test setting values on tokens
@@ -55,3 +68,59 @@ def test_set_tokens(doc):
     assert result == ner_contents
 
 
+
+def test_set_get_words(doc):
+    """
+    Test setting and getting several fields at once on words
+    """
+    contents = [["NOUN", "unban"], ["NOUN", "mox"], ["ADJ", "opal"], ["VERB", "ban"], ["PROPN", "Lurrus"]]
+    doc.set(fields=["upos", "lemma"], contents=contents)
+
+    assert doc.get(["upos", "lemma"]) == contents
+    assert doc.get(["upos"], as_sentences=True) == [["NOUN", "NOUN", "ADJ"], ["VERB", "PROPN"]]
+
+def test_add_property(doc):
+    """
+    Test adding a settable property to Word, which get and set can use
+    """
+    Word.add_property('test_tag', default="X", setter=lambda self, value: setattr(self, '_test_tag', value))
+    assert doc.get(["test_tag"]) == ["X"] * 5
+    doc.set(["test_tag"], ["A", "B", "C", "D", "E"])
+    assert doc.get(["test_tag"]) == ["A", "B", "C", "D", "E"]
+
+def test_changed_fields(doc):
+    """
+    Sentences record which of their fields changed, and only for values which really changed
+    """
+    assert doc.sentences[0].changed_fields == {TOKENS, WORDS}
+    doc.clear_changes()
+    assert all(len(sentence.changed_fields) == 0 for sentence in doc.sentences)
+
+    doc.sentences[0].words[0].upos = "VERB"
+    doc.sentences[0].words[0].lemma = "unban"
+    doc.sentences[1].tokens[1].ner = "S-PER"
+    assert doc.sentences[0].changed_fields == {UPOS, LEMMA}
+    assert doc.sentences[1].changed_fields == {NER}
+
+    doc.clear_changes()
+    doc.set([UPOS], ["VERB", "NOUN", "NOUN", "VERB", "PROPN"])
+    assert doc.sentences[0].changed_fields == {UPOS}
+    assert doc.sentences[1].changed_fields == {UPOS}
+    doc.clear_changes()
+    doc.set([UPOS], ["VERB", "NOUN", "NOUN", "VERB", "PROPN"])
+    assert all(len(sentence.changed_fields) == 0 for sentence in doc.sentences)
+
+    doc.sentences[1].words[1].text = "Lurrus"
+    assert doc.sentences[1].changed_fields == set()
+    doc.sentences[1].words[1].text = "Kroxa"
+    doc.sentences[0].tokens[2].text = "Opal"
+    assert doc.sentences[1].changed_fields == {WORDS}
+    assert doc.sentences[0].changed_fields == {TOKENS}
+
+def test_annotated_by(doc):
+    """
+    New text means a document has to be processed from scratch
+    """
+    doc.annotated_by.update({"tokenize": "1234", "pos": "5678"})
+    doc.text = "unban mox opal"
+    assert doc.annotated_by == {}
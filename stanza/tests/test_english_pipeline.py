@@ -168,6 +168,24 @@ def test_empty(pipeline):
     pipeline("")
     pipeline("--")
 
+def test_incremental(pipeline):
+    """
+    A corrected document only has its changed sentences processed again
+    """
+    doc = pipeline(EN_DOC)
+    assert {"tokenize", "pos", "depparse"} <= doc.annotated_by.keys()
+
+    # a corrected tag is kept, as the tagger does not run again on that sentence
+    doc.sentences[0].words[0].upos = "X"
+    doc.sentences[1].words[0].text = "She"
+    doc = pipeline(doc)
+    assert doc.sentences[0].words[0].upos == "X"
+    assert all(len(sentence.changed_fields) == 0 for sentence in doc.sentences)
+
+    expected = pipeline(EN_DOC.replace("He was", "She was"))
+    assert doc.sentences[1].words_string() == expected.sentences[1].words_string()
+    assert doc.sentences[2].words_string() == expected.sentences[2].words_string()
+
 @pytest.fixture(scope="module")
 def processed_multidoc(pipeline):
     """ Document created by running full English pipeline on a few sentences """
@@ -191,6 +209,35 @@ def test_dependency_parse_multidoc(processed_multidoc):
            EN_DOC_DEPENDENCY_PARSES_GOLD
 
 
+def test_stream(pipeline):
+    # batches of 2 documents means the last batch is a partial one
+    processed = list(pipeline.stream(EN_DOCS, batch_docs=2))
+    assert len(processed) == len(EN_DOCS)
+    assert [doc.text for doc in processed] == EN_DOCS
+    assert "".join([CoNLL.doc2conll_text(doc) for doc in processed]) == EN_DOC_CONLLU_GOLD_MULTIDOC
+
+def test_stream_max_chars(pipeline):
+    # a tiny character budget forces one document per batch
+    docs = (Document([], text=t) for t in EN_DOCS)
+    processed = list(pipeline.stream(docs, max_chars=1))
+    assert "\n\n".join([sent.dependencies_string() for doc in processed for sent in doc.sentences]) == \
+           EN_DOC_DEPENDENCY_PARSES_GOLD
+
+def test_stream_staged(pipeline):
+    # each processor runs in its own thread, but the results must be the same
+    processed = list(pipeline.stream(EN_DOCS, batch_docs=1, staged=True))
+    assert [doc.text for doc in processed] == EN_DOCS
+    assert "".join([CoNLL.doc2conll_text(doc) for doc in processed]) == EN_DOC_CONLLU_GOLD_MULTIDOC
+
+def test_pipeline_pool():
+    with stanza.PipelinePool(dir=TEST_MODELS_DIR, num_workers=2, chunk_size=1) as pool:
+        processed = pool(EN_DOCS)
+        assert [doc.text for doc in processed] == EN_DOCS
+        assert "".join([CoNLL.doc2conll_text(doc) for doc in processed]) == EN_DOC_CONLLU_GOLD_MULTIDOC
+
+        processed = pool(EN_DOC)
+        assert CoNLL.doc2conll_text(processed) == EN_DOC_CONLLU_GOLD
+
 @pytest.fixture(scope="module")
 def processed_multidoc_variant():
     """ Document created by running full English pipeline on a few sentences """
@@ -0,0 +1,233 @@
+"""
+Tests of exporting the tagger, parser, NER and tokenizer graphs to TorchScript
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+import torch
+
+from stanza.models import ner_tagger, parser, tagger
+from stanza.models.common import pretrain
+from stanza.models.common.doc import Document
+from stanza.models.common.export import ONNX, TORCHSCRIPT, export_model, load_exported, metadata_path, native_lstms, count_differences, predict_calls
+from stanza.models.common.packed_lstm import PackedLSTM
+from stanza.models.depparse.data import DataLoader as ParserDataLoader
+from stanza.models.depparse.trainer import Trainer as ParserTrainer
+from stanza.models.ner.data import DataLoader as NERDataLoader
+from stanza.models.ner.trainer import Trainer as NERTrainer
+from stanza.models.pos.data import DataLoader as TaggerDataLoader
+from stanza.models.pos.trainer import Trainer as TaggerTrainer, unpack_batch as unpack_tagger_batch
+from stanza.models.tokenization.model import Tokenizer
+from stanza.models.tokenization.vocab import Vocab as TokenizeVocab
+from stanza.tests.test_char_model import build_charlm
+from stanza.utils.conll import CoNLL
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+TRAIN_DATA = """
+1	This	this	PRON	DT	Number=Sing|PronType=Dem	4	nsubj	_	_
+2	is	be	AUX	VBZ	Mood=Ind|Number=Sing	4	cop	_	_
+3	a	a	DET	DT	Definite=Ind	4	det	_	_
+4	test	test	NOUN	NN	Number=Sing	0	root	_	_
+
+1	Unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	0	root	_	_
+2	Mox	Mox	PROPN	NNP	Number=Sing	1	obj	_	_
+3	Opal	Opal	PROPN	NNP	Number=Sing	2	flat	_	_
+
+1	Opal	Opal	PROPN	NNP	Number=Sing	2	nsubj	_	_
+2	is	be	AUX	VBZ	Mood=Ind|Number=Sing	0	root	_	_
+
+1	This	this	PRON	DT	Number=Sing|PronType=Dem	0	root	_	_
+2	is	be	AUX	VBZ	Mood=Ind|Number=Sing	1	cop	_	_
+3	a	a	DET	DT	Definite=Ind	1	det	_	_
+4	test	test	NOUN	NN	Number=Sing	1	nsubj	_	_
+5	of	of	ADP	IN	_	6	case	_	_
+6	unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	4	nmod	_	_
+""".lstrip()
+
+NER_DATA = [[("Chris", "B-PER"), ("Manning", "E-PER"), ("is", "O"), ("a", "O"), ("good", "O"), ("man", "O")],
+            [("He", "O"), ("works", "O"), ("in", "O"), ("Stanford", "S-ORG")],
+            [("Unban", "O"), ("Mox", "B-MISC"), ("Opal", "E-MISC")]]
+
+def randomize(model):
+    # the classifiers start at zero, which would make every prediction the same
+    torch.manual_seed(1000)
+    for param in model.parameters():
+        torch.nn.init.normal_(param)
+
+def load_pretrain():
+    return pretrain.Pretrain(vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.txt', save_to_file=False)
+
+def check_export(trainer, batches, tempdir, export_format=TORCHSCRIPT):
+    """
+    Trace with the first batch, then check the predictions of the exported graph on all of the batches
+    """
+    filename = os.path.join(tempdir, "model.onnx" if export_format == ONNX else "model.pt")
+    export_model(trainer.model, trainer.vocab, predict_calls(trainer, batches[:1])[0], filename, export_format=export_format)
+    exported = load_exported(filename, trainer.vocab)
+    assert count_differences(trainer, exported, batches) == 0
+    return filename
+
+def batches_of_sizes(build_batches):
+    # batches of different sizes and lengths from the one used to trace
+    return [batch for batch_size in (2, 1, 3, 10) for batch in build_batches(batch_size)]
+
+def build_tagger_trainer(extra_args):
+    args = vars(tagger.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--composite_deep_biaff_hidden_dim", "10",
+                                   "--transformed_dim", "10", "--word_emb_dim", "10", "--char_emb_dim", "10",
+                                   "--tag_emb_dim", "5"] + extra_args))
+    pt = load_pretrain()
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    vocab = TaggerDataLoader(doc, 2, args, pt, evaluation=False).vocab
+    trainer = TaggerTrainer(args=args, vocab=vocab, pretrain=pt)
+    randomize(trainer.model)
+    batches = batches_of_sizes(lambda batch_size: list(TaggerDataLoader(doc, batch_size, args, pt, vocab=vocab, evaluation=True, sort_during_eval=True)))
+    return trainer, batches
+
+@pytest.mark.parametrize("extra_args", [[], ["--rec_dropout", "0.2", "--char_rec_dropout", "0.2"], ["--share_hid"]])
+def test_export_tagger(extra_args):
+    trainer, batches = build_tagger_trainer(extra_args)
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        check_export(trainer, batches, tempdir)
+
+@pytest.mark.parametrize("extra_args", [[], ["--rec_dropout", "0.2", "--char_rec_dropout", "0.2"]])
+def test_tagger_predict_forward(extra_args):
+    """
+    predict_forward, which forward uses without gold tags, predicts the same tags as the packed forward
+    """
+    args = vars(tagger.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--composite_deep_biaff_hidden_dim", "10",
+                                   "--transformed_dim", "10", "--word_emb_dim", "10", "--char_emb_dim", "10",
+                                   "--tag_emb_dim", "5"] + extra_args))
+    pt = load_pretrain()
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    vocab = TaggerDataLoader(doc, 2, args, pt, evaluation=False).vocab
+    trainer = TaggerTrainer(args=args, vocab=vocab, pretrain=pt)
+    randomize(trainer.model)
+    trainer.model.eval()
+    for batch in TaggerDataLoader(doc, 3, args, pt, vocab=vocab, evaluation=True, sort_during_eval=True):
+        inputs, _, word_orig_idx, sentlens, wordlens = unpack_tagger_batch(batch, use_cuda=False)
+        word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained = inputs
+        with torch.no_grad():
+            _, expected = trainer.model(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, word_orig_idx, sentlens, wordlens)
+            _, preds = trainer.model(word, word_mask, wordchars, wordchars_mask, None, None, None, pretrained, word_orig_idx, sentlens, wordlens)
+        for x, y in zip(expected, preds):
+            for idx, length in enumerate(sentlens):
+                assert torch.equal(x[idx, :length], y[idx, :length])
+
+def build_parser_trainer(extra_args):
+    args = vars(parser.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--transformed_dim", "10",
+                                   "--word_emb_dim", "10", "--char_emb_dim", "10", "--tag_emb_dim", "5"] + extra_args))
+    pt = load_pretrain()
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    vocab = ParserDataLoader(doc, 2, args, pt, evaluation=False).vocab
+    trainer = ParserTrainer(args=args, vocab=vocab, pretrain=pt)
+    randomize(trainer.model)
+    batches = batches_of_sizes(lambda batch_size: list(ParserDataLoader(doc, batch_size, args, pt, vocab=vocab, evaluation=True, sort_during_eval=True)))
+    return trainer, batches
+
+@pytest.mark.parametrize("extra_args", [[], ["--rec_dropout", "0.2", "--no_linearization", "--no_distance"]])
+def test_export_parser(extra_args):
+    trainer, batches = build_parser_trainer(extra_args)
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        check_export(trainer, batches, tempdir)
+
+@pytest.mark.parametrize("build_trainer", [build_tagger_trainer, build_parser_trainer])
+def test_export_onnx(build_trainer):
+    """
+    The ONNX graphs, run with onnxruntime, make the same predictions as the eager models
+    """
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    trainer, batches = build_trainer(["--rec_dropout", "0.2"])
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        filename = check_export(trainer, batches, tempdir, export_format=ONNX)
+        with open(metadata_path(filename), encoding="utf-8") as fin:
+            assert json.load(fin)['format'] == ONNX
+
+def build_ner_trainer(tempdir, charlm):
+    extra_args = []
+    if charlm:
+        charlm_file = os.path.join(tempdir, "charlm.pt")
+        build_charlm().save(charlm_file)
+        extra_args = ["--charlm", "--charlm_forward_file", charlm_file, "--charlm_backward_file", charlm_file]
+    args = vars(ner_tagger.parse_args(["--shorthand", "en_test", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                       "--word_emb_dim", "4", "--char_emb_dim", "10"] + extra_args))
+    pt = load_pretrain()
+    doc = Document([[{'id': idx, 'text': text, 'ner': tag} for idx, (text, tag) in enumerate(sentence, start=1)]
+                    for sentence in NER_DATA])
+    vocab = NERDataLoader(doc, 2, args, pt, evaluation=False).vocab
+    trainer = NERTrainer(args=args, vocab=vocab, pretrain=pt)
+    randomize(trainer.model)
+    batches = batches_of_sizes(lambda batch_size: list(NERDataLoader(doc, batch_size, args, vocab=vocab, evaluation=True, preprocess_tags=False, sort_during_eval=True)))
+    return trainer, batches
+
+@pytest.mark.parametrize("charlm", [False, True])
+def test_export_ner(charlm):
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        trainer, batches = build_ner_trainer(tempdir, charlm)
+        check_export(trainer, batches, tempdir)
+
+def test_export_tokenizer():
+    args = {'feat_dim': 3, 'rnn_layers': 1, 'conv_res': None, 'use_mwt': True, 'hierarchical': True,
+            'hier_invtemp': 0.5, 'tok_noise': 0.02}
+    torch.manual_seed(1234)
+    model = Tokenizer(args, 10, 8, 8, dropout=0.33, feat_dropout=0.05)
+    model.eval()
+    vocab = TokenizeVocab(["unban mox opal"], "en")
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        filename = os.path.join(tempdir, "tokenizer.pt")
+        units = torch.randint(10, (2, 7))
+        features = torch.rand(2, 7, 3)
+        export_model(model, vocab, (units, features), filename)
+        exported = load_exported(filename, vocab)
+        for shape in ((2, 7), (1, 20), (5, 3)):
+            units = torch.randint(10, shape)
+            features = torch.rand(*shape, 3)
+            with torch.no_grad():
+                assert torch.allclose(model(units, features), exported(units, features), atol=1e-5)
+
+def test_metadata():
+    """
+    The metadata has the vocab and the inputs, and a graph can't be used with another model
+    """
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        trainer, batches = build_ner_trainer(tempdir, charlm=False)
+        filename = check_export(trainer, batches, tempdir)
+        with open(metadata_path(filename), encoding="utf-8") as fin:
+            metadata = json.load(fin)
+        assert metadata['model'] == 'ner'
+        assert metadata['format'] == 'torchscript'
+        assert metadata['input_names'] == ['sentlens', 'word', 'wordchars', 'wordlens', 'word_orig_idx']
+        assert metadata['vocab']['tag']['_id2unit'] == trainer.vocab['tag']._id2unit
+
+        with pytest.raises(ValueError):
+            load_exported(filename, name='pos')
+        trainer.vocab['tag']._id2unit = trainer.vocab['tag']._id2unit + ['S-FOO']
+        with pytest.raises(ValueError):
+            load_exported(filename, trainer.vocab)
+
+def test_native_lstms():
+    """
+    An LSTM with recurrent dropout is the same as an nn.LSTM at inference time
+    """
+    torch.manual_seed(1234)
+    lstm = PackedLSTM(4, 6, 2, batch_first=True, bidirectional=True, rec_dropout=0.5)
+    lstm.eval()
+    inputs = torch.randn(3, 5, 4)
+    packed = torch.nn.utils.rnn.pack_padded_sequence(inputs, [5, 3, 2], batch_first=True)
+    with torch.no_grad():
+        expected, (h, c) = lstm(packed, [5, 3, 2])
+        native_lstms(lstm)
+        assert isinstance(lstm.lstm, torch.nn.LSTM)
+        result, (h2, c2) = lstm(packed, [5, 3, 2])
+    assert torch.allclose(expected.data, result.data, atol=1e-6)
+    assert torch.allclose(h, h2, atol=1e-6)
+    assert torch.allclose(c, c2, atol=1e-6)
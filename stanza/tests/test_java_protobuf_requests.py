@@ -1,8 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
 import tempfile
+import time
 
 import pytest
 
 from stanza.models.constituency import tree_reader
+from stanza.protobuf import SemgrexRequest
 from stanza.server import java_protobuf_requests
 from stanza.tests import *
 
@@ -21,3 +26,85 @@ def test_build_tree():
     for tree in trees:
         proto_tree = java_protobuf_requests.build_tree(trees[0], 1.0)
         check_tree(proto_tree, trees[0], 1.0)
+
+FAKE_JAVA = """#!{python}
+# answers each length prefixed request by echoing it back, like the java side of JavaProtobufWorker
+import sys
+import time
+
+while True:
+    length = int.from_bytes(sys.stdin.buffer.read(4), 'big')
+    if length == 0:
+        break
+    text = sys.stdin.buffer.read(length)
+    if b'crash' in text:
+        sys.exit(1)
+    if b'sleep' in text:
+        time.sleep(5)
+    sys.stdout.buffer.write(len(text).to_bytes(4, 'big'))
+    sys.stdout.buffer.write(text)
+    sys.stdout.buffer.flush()
+"""
+
+@pytest.fixture
+def fake_java(tmp_path, monkeypatch):
+    """
+    Put a fake java which echoes its requests at the front of the PATH
+    """
+    java = tmp_path / "java"
+    java.write_text(FAKE_JAVA.format(python=sys.executable))
+    java.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ["PATH"])
+    return str(tmp_path)
+
+def build_request(pattern):
+    request = SemgrexRequest()
+    request.semgrex.append(pattern)
+    return request
+
+def test_pool_concurrent(fake_java):
+    with java_protobuf_requests.JavaProtobufPool(fake_java, "FakeMain", num_workers=2) as pool:
+        patterns = ["pattern %d" % i for i in range(20)]
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            responses = list(executor.map(lambda x: pool.process_request(build_request(x), SemgrexRequest), patterns))
+        assert [response.semgrex[0] for response in responses] == patterns
+        assert 1 <= pool.num_running <= 2
+    assert pool.num_running == 0
+
+def test_pool_restart(fake_java):
+    with java_protobuf_requests.JavaProtobufPool(fake_java, "FakeMain", num_workers=1) as pool:
+        with pytest.raises(RuntimeError):
+            pool.process_request(build_request("crash"), SemgrexRequest)
+        assert pool.num_running == 0
+        response = pool.process_request(build_request("foo"), SemgrexRequest)
+        assert response.semgrex[0] == "foo"
+        assert pool.num_running == 1
+
+def test_pool_timeout(fake_java):
+    with java_protobuf_requests.JavaProtobufPool(fake_java, "FakeMain", num_workers=1, timeout=0.5) as pool:
+        with pytest.raises(TimeoutError):
+            pool.process_request(build_request("sleep"), SemgrexRequest)
+        response = pool.process_request(build_request("foo"), SemgrexRequest)
+        assert response.semgrex[0] == "foo"
+
+def test_pool_idle_timeout(fake_java):
+    with java_protobuf_requests.JavaProtobufPool(fake_java, "FakeMain", idle_timeout=0.2) as pool:
+        pool.process_request(build_request("foo"), SemgrexRequest)
+        assert pool.num_running == 1
+        for _ in range(50):
+            if pool.num_running == 0:
+                break
+            time.sleep(0.1)
+        assert pool.num_running == 0
+
+def test_send_request_pool(fake_java):
+    try:
+        response = java_protobuf_requests.send_request(build_request("foo"), SemgrexRequest, "FakeMain", fake_java)
+        assert response.semgrex[0] == "foo"
+        pool = java_protobuf_requests.get_java_pool("FakeMain", fake_java)
+        assert pool.num_running == 1
+        response = java_protobuf_requests.send_request(build_request("bar"), SemgrexRequest, "FakeMain", fake_java)
+        assert response.semgrex[0] == "bar"
+        assert pool.num_running == 1
+    finally:
+        java_protobuf_requests.close_java_pools()
@@ -2,9 +2,14 @@
 Basic tests of langid module
 """
 
+import threading
+
 import pytest
+import torch
 
 from stanza.models.common.doc import Document
+from stanza.models.langid.model import LangIDBiLSTM
+from stanza.pipeline import multilingual
 from stanza.pipeline.core import Pipeline
 from stanza.pipeline.multilingual import MultilingualPipeline
 from stanza.tests import *
@@ -539,6 +544,25 @@ def test_langid_benchmark():
     assert accuracy >= 0.98
 
 
+def test_padded_scores():
+    """
+    Padded sequences with lengths should get the same scores as the unpadded sequences
+    """
+    torch.manual_seed(1234)
+    char_to_idx = {"a": 0, "b": 1, "c": 2, "UNK": 3, "<PAD>": 4}
+    tag_to_idx = {"en": 0, "fr": 1, "de": 2}
+    model = LangIDBiLSTM(char_to_idx, tag_to_idx, num_layers=2, embedding_dim=8, hidden_dim=8)
+    model.eval()
+
+    sequences = [[0, 1, 2, 0, 1], [2, 2], [1, 0, 2]]
+    padded = torch.tensor([x + [4] * (5 - len(x)) for x in sequences])
+    lengths = torch.tensor([len(x) for x in sequences])
+    with torch.no_grad():
+        padded_scores = model(padded, lengths)
+        for idx, x in enumerate(sequences):
+            scores = model(torch.tensor([x]))
+            assert torch.allclose(scores[0], padded_scores[idx], atol=1e-5)
+
 def test_text_cleaning():
     """
     Basic test of cleaning text
@@ -602,12 +626,84 @@ def test_multilingual_pipeline():
         "('.', 4, 'punct')"
     ))
 
-    nlp = MultilingualPipeline(model_dir=TEST_MODELS_DIR)
-    docs = [english_text, french_text]
-    docs = nlp(docs)
+    with MultilingualPipeline(model_dir=TEST_MODELS_DIR) as nlp:
+        docs = [english_text, french_text]
+        docs = nlp(docs)
 
     assert docs[0].lang == "en"
     assert docs[0].sentences[0].dependencies_string() == english_deps_gold
     assert docs[1].lang == "fr"
     assert docs[1].sentences[0].dependencies_string() == french_deps_gold
 
+
+class FakePipeline:
+    """
+    Stands in for Pipeline when testing the cache of MultilingualPipeline
+
+    The langid pipeline takes the language from the start of the text
+    """
+    built = []
+
+    def __init__(self, dir=None, lang=None, **kwargs):
+        self.lang = lang
+        FakePipeline.built.append(lang)
+
+    def process(self, docs):
+        for doc in docs:
+            doc.lang = doc.text.split(":")[0]
+        return docs
+
+    def __call__(self, docs):
+        for doc in docs:
+            doc.processed_by = self.lang
+        return docs
+
+@pytest.fixture
+def fake_multilingual(monkeypatch):
+    FakePipeline.built = []
+    monkeypatch.setattr(multilingual, "Pipeline", FakePipeline)
+    monkeypatch.setattr(multilingual, "estimate_pipeline_memory", lambda pipeline: 100)
+
+def test_multilingual_lru_cache(fake_multilingual):
+    nlp = MultilingualPipeline(max_cache_size=2)
+    docs = nlp(["en: foo", "fr: bar", "en: baz"])
+    assert [doc.processed_by for doc in docs] == ["en", "fr", "en"]
+    assert list(nlp.pipeline_cache.keys()) == ["en", "fr"]
+
+    # en becomes the most recently used, so de replaces fr
+    nlp("en: foo")
+    nlp("de: foo")
+    assert list(nlp.pipeline_cache.keys()) == ["en", "de"]
+    doc = nlp("fr: foo")
+    assert doc.processed_by == "fr"
+    assert list(nlp.pipeline_cache.keys()) == ["de", "fr"]
+    assert FakePipeline.built == ["multilingual", "en", "fr", "de", "fr"]
+    nlp.close()
+
+def test_multilingual_cache_memory(fake_multilingual):
+    nlp = MultilingualPipeline(max_cache_size=10, max_cache_memory=250, preload_langs=["en", "fr"])
+    assert list(nlp.pipeline_cache.keys()) == ["en", "fr"]
+    nlp(["de: foo"])
+    assert list(nlp.pipeline_cache.keys()) == ["fr", "de"]
+    nlp.close()
+
+    # the most recently used pipeline is kept even if it is over the budget
+    nlp = MultilingualPipeline(max_cache_memory=50)
+    nlp(["en: foo", "fr: foo"])
+    assert list(nlp.pipeline_cache.keys()) == ["fr"]
+    nlp.close()
+
+def multilingual_threads():
+    return [thread for thread in threading.enumerate()
+            if thread.name.startswith("stanza_pipeline_loader") or thread.name.startswith("stanza_multilingual")]
+
+def test_multilingual_lang_workers(fake_multilingual):
+    threads = multilingual_threads()
+    with MultilingualPipeline(lang_workers=3) as nlp:
+        texts = ["%s: text %d" % (lang, idx) for idx, lang in enumerate(["en", "fr", "de", "en", "es", "fr"])]
+        docs = nlp(texts)
+        assert [doc.text for doc in docs] == texts
+        assert [doc.processed_by for doc in docs] == ["en", "fr", "de", "en", "es", "fr"]
+        assert len(multilingual_threads()) > len(threads)
+    # closing the pipeline stops its threads
+    assert multilingual_threads() == threads
@@ -0,0 +1,127 @@
+"""
+Tests of reannotating a corrected document, using small randomly initialized tagger models
+"""
+
+import json
+import os
+import tempfile
+
+import pytest
+import torch
+
+import stanza
+from stanza.models import tagger
+from stanza.models.common import pretrain
+from stanza.models.pos.data import DataLoader
+from stanza.models.pos.trainer import Trainer
+from stanza.utils.conll import CoNLL
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+TRAIN_DATA = """
+1	Unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	0	root	_	_
+2	Mox	Mox	PROPN	NNP	Number=Sing	3	compound	_	_
+3	Opal	Opal	PROPN	NNP	Number=Sing	1	obj	_	_
+
+1	This	this	PRON	DT	Number=Sing|PronType=Dem	4	nsubj	_	_
+2	is	be	AUX	VBZ	Mood=Ind|Number=Sing	4	cop	_	_
+3	a	a	DET	DT	Definite=Ind	4	det	_	_
+4	test	test	NOUN	NN	Number=Sing	0	root	_	_
+""".lstrip()
+
+SENTENCES = [["Unban", "Mox", "Opal"], ["This", "is", "a", "test", "too"], ["Opal", "is", "a", "test"]]
+
+def build_tagger(filename, pt, seed):
+    args = vars(tagger.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--composite_deep_biaff_hidden_dim", "10",
+                                   "--transformed_dim", "10", "--word_emb_dim", "10", "--char_emb_dim", "10",
+                                   "--tag_emb_dim", "5"]))
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    vocab = DataLoader(doc, 2, args, pt, evaluation=False).vocab
+    trainer = Trainer(args=args, vocab=vocab, pretrain=pt)
+    # the classifiers start at zero, which would make every prediction the same
+    torch.manual_seed(seed)
+    for param in trainer.model.parameters():
+        torch.nn.init.normal_(param)
+    trainer.save(filename)
+
+@pytest.fixture(scope="module")
+def models_dir():
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        pt = pretrain.Pretrain(vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.txt', save_to_file=False)
+        pt.save(os.path.join(tempdir, "pretrain.npy"))
+        build_tagger(os.path.join(tempdir, "pos_a.pt"), pt, 1000)
+        build_tagger(os.path.join(tempdir, "pos_b.pt"), pt, 2000)
+        resources = {"en": {"lang_name": "English", "default_processors": {"tokenize": "test", "pos": "test", "lemma": "test"},
+                            "default_dependencies": {}, "tokenize": {"test": {}}, "pos": {"test": {}}, "lemma": {"test": {}}}}
+        with open(os.path.join(tempdir, "resources.json"), "w") as fout:
+            json.dump(resources, fout)
+        yield tempdir
+
+def build_pipeline(models_dir, pos_model):
+    return stanza.Pipeline("en", dir=models_dir, processors="tokenize,pos,lemma", tokenize_pretokenized=True,
+                           lemma_use_identity=True, pos_model_path=os.path.join(models_dir, pos_model),
+                           pos_pretrain_path=os.path.join(models_dir, "pretrain.npy"), use_gpu=False)
+
+def count_tagged_sentences(pipeline):
+    """
+    Keep track of how many sentences the tagger of the pipeline tags
+    """
+    tagged = []
+    trainer = pipeline.processors['pos'].trainer
+    predict = trainer.predict
+    def counting_predict(batch):
+        preds = predict(batch)
+        tagged.append(len(preds))
+        return preds
+    trainer.predict = counting_predict
+    return tagged
+
+def annotations(doc):
+    # a corrected word keeps its character offsets, so those are not compared
+    return [[(word.text, word.upos, word.xpos, word.feats, word.lemma) for word in sentence.words] for sentence in doc.sentences]
+
+def test_incremental(models_dir):
+    """
+    Reannotating a corrected document only tags the changed sentences
+    """
+    pipeline = build_pipeline(models_dir, "pos_a.pt")
+    tagged = count_tagged_sentences(pipeline)
+    doc = pipeline(SENTENCES)
+    assert sum(tagged) == 3
+
+    tagged.clear()
+    doc = pipeline(doc)
+    assert sum(tagged) == 0
+
+    doc.sentences[1].words[3].text = "Mox"
+    doc = pipeline(doc)
+    assert sum(tagged) == 1
+    assert doc.sentences[1].words[3].lemma == "Mox"
+    expected = pipeline([SENTENCES[0], ["This", "is", "a", "Mox", "too"], SENTENCES[2]])
+    assert annotations(doc) == annotations(expected)
+
+    # a corrected tag is kept, as the tagger does not run again on that sentence
+    tagged.clear()
+    doc.sentences[0].words[0].upos = "X"
+    doc = pipeline(doc)
+    assert sum(tagged) == 0
+    assert doc.sentences[0].words[0].upos == "X"
+
+def test_other_pipeline(models_dir):
+    """
+    A pipeline with a different tagger than the one which annotated the document tags all of it
+    """
+    pipeline_a = build_pipeline(models_dir, "pos_a.pt")
+    pipeline_b = build_pipeline(models_dir, "pos_b.pt")
+    expected_a = annotations(pipeline_a(SENTENCES))
+    expected_b = annotations(pipeline_b(SENTENCES))
+    assert expected_a != expected_b
+
+    doc = pipeline_a(SENTENCES)
+    doc = pipeline_b(doc)
+    assert annotations(doc) == expected_b
+    doc = pipeline_a(doc)
+    assert annotations(doc) == expected_a
@@ -0,0 +1,58 @@
+"""
+Tests of moving the models of a pipeline into shared memory for PipelinePool
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from stanza.models import tagger
+from stanza.models.common import pretrain
+from stanza.models.pos.data import DataLoader
+from stanza.models.pos.trainer import Trainer
+from stanza.pipeline.pool import estimate_pipeline_memory, share_pipeline_memory
+from stanza.utils.conll import CoNLL
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+TRAIN_DATA = """
+1	Unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	0	root	_	_
+2	Mox	Mox	PROPN	NNP	Number=Sing	3	compound	_	_
+3	Opal	Opal	PROPN	NNP	Number=Sing	1	obj	_	_
+""".lstrip()
+
+def build_pipeline(num_processors):
+    """
+    A stand in for a pipeline whose taggers all use the same pretrain
+    """
+    pt = pretrain.Pretrain(vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.txt', save_to_file=False)
+    args = vars(tagger.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--composite_deep_biaff_hidden_dim", "10",
+                                   "--transformed_dim", "10", "--word_emb_dim", "10", "--char_emb_dim", "10",
+                                   "--tag_emb_dim", "5"]))
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    vocab = DataLoader(doc, 2, args, pt, evaluation=False).vocab
+    processors = [SimpleNamespace(_pretrain=pt, _trainer=Trainer(args=args, vocab=vocab, pretrain=pt))
+                  for _ in range(num_processors)]
+    return SimpleNamespace(loaded_processors=processors), pt
+
+def test_share_pretrain_once():
+    """
+    The pretrained embeddings are in shared memory once, used by the pretrain and by every model
+    """
+    pipeline, pt = build_pipeline(2)
+    assert not isinstance(pt.emb, np.memmap)
+    expected_memory = estimate_pipeline_memory(pipeline)
+
+    share_pipeline_memory(pipeline)
+    for processor in pipeline.loaded_processors:
+        weight = processor._trainer.model.pretrained_emb.weight
+        assert weight.is_shared()
+        assert weight.data_ptr() == pt.emb.ctypes.data
+        assert torch.equal(weight, torch.from_numpy(pt.emb))
+        assert all(param.is_shared() for param in processor._trainer.model.parameters())
+    assert estimate_pipeline_memory(pipeline) == expected_memory
@@ -0,0 +1,54 @@
+"""
+Test the cache of model predictions used by the lemmatizer and MWT expander
+"""
+
+import pytest
+
+from stanza.models.common.prediction_cache import PredictionCache, model_namespace, split_cached
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+def test_lru():
+    cache = PredictionCache("test", max_size=2)
+    cache.update({("a", "NOUN"): "a", ("b", "NOUN"): "b"})
+    assert cache.get_many([("a", "NOUN")]) == {("a", "NOUN"): "a"}
+    # b is now the least recently used
+    cache.update([(("c", "NOUN"), "c")])
+    assert len(cache) == 2
+    assert cache.get_many([("a", "NOUN"), ("b", "NOUN"), ("c", "NOUN")]) == {("a", "NOUN"): "a", ("c", "NOUN"): "c"}
+
+def test_persistent(tmp_path):
+    filename = str(tmp_path / "cache.db")
+    cache = PredictionCache("model1", max_size=10, filename=filename)
+    cache.update({("dogs", "NOUN"): ["dog", 1], "cats": "cat"})
+    cache.close()
+
+    cache = PredictionCache("model1", max_size=0, filename=filename)
+    assert cache.get_many([("dogs", "NOUN"), "cats", "mice"]) == {("dogs", "NOUN"): ["dog", 1], "cats": "cat"}
+    cache.close()
+
+    # a different model does not see the predictions of the first one
+    cache = PredictionCache("model2", max_size=10, filename=filename)
+    assert cache.get_many([("dogs", "NOUN"), "cats"]) == {}
+    cache.close()
+
+def test_model_namespace(tmp_path):
+    model_file = tmp_path / "model.pt"
+    model_file.write_bytes(b"one model")
+    first = model_namespace("lemma", str(model_file), 1)
+    assert first == model_namespace("lemma", str(model_file), 1)
+    assert first != model_namespace("lemma", str(model_file), 4)
+    model_file.write_bytes(b"another model")
+    assert first != model_namespace("lemma", str(model_file), 1)
+
+def test_split_cached():
+    keys = ["a", "b", "a", "c", "d", "b"]
+    known, model_skip = split_cached(None, keys)
+    assert known == {}
+    assert model_skip == [False, False, True, False, False, True]
+
+    cache = PredictionCache("test")
+    cache.update({"c": "C"})
+    known, model_skip = split_cached(cache, keys, skip=[False, True, False, False, False, False])
+    assert known == {"c": "C"}
+    assert model_skip == [False, True, True, True, False, False]
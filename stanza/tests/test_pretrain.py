@@ -5,6 +5,7 @@ import pytest
 import numpy as np
 import torch
 
+from stanza.models.common import convert_pretrain
 from stanza.models.common import pretrain
 from stanza.tests import *
 
@@ -87,3 +88,60 @@ def test_whitespace():
         assert "unban mox" in pt.vocab
     finally:
         os.unlink(test_txt_file.name)
+
+def test_mmap_pretrain():
+    """
+    Test saving a pretrain in the .npy format and then memory mapping it
+    """
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        test_npy_file = os.path.join(tempdir, "tiny_emb.npy")
+        pt = pretrain.Pretrain(filename=test_npy_file,
+                               vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.xz')
+        check_pretrain(pt)
+        assert os.path.exists(test_npy_file)
+        assert os.path.exists(pretrain.mmap_vocab_filename(test_npy_file))
+
+        pt2 = pretrain.Pretrain(filename=test_npy_file,
+                                vec_filename=f'unban_mox_opal')
+        check_pretrain(pt2)
+        assert isinstance(pt2.emb, np.memmap)
+        assert pt2.vocab['opal'] == pt.vocab['opal']
+
+def test_convert_pt_to_mmap():
+    """
+    Test converting an existing .pt pretrain to a float16 .npy pretrain
+    """
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        test_pt_file = os.path.join(tempdir, "tiny_emb.pt")
+        pt = pretrain.Pretrain(filename=test_pt_file,
+                               vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.xz')
+        check_pretrain(pt)
+
+        test_npy_file = os.path.join(tempdir, "tiny_emb.npy")
+        convert_pretrain.main([test_npy_file, test_pt_file, "--dtype", "float16"])
+
+        pt2 = pretrain.Pretrain(filename=test_npy_file, save_to_file=False)
+        check_pretrain(pt2)
+        assert pt2.emb.dtype == np.float16
+
+def test_shared_pretrain():
+    """
+    Test that the same file gives the same Pretrain, and that it is released when no longer used
+    """
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        test_pt_file = os.path.join(tempdir, "tiny_emb.pt")
+        pt = pretrain.Pretrain(filename=test_pt_file,
+                               vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.xz')
+        check_pretrain(pt)
+
+        pt1 = pretrain.get_shared_pretrain(test_pt_file)
+        # a different path to the same file should still find the same pretrain
+        pt2 = pretrain.get_shared_pretrain(os.path.join(tempdir, ".", "tiny_emb.pt"))
+        assert pt1 is pt2
+        check_pretrain(pt1)
+        assert pt1.emb is pt2.emb
+
+        key = pretrain.pretrain_file_key(test_pt_file)
+        assert key in pretrain._SHARED_PRETRAINS
+        del pt1, pt2
+        assert key not in pretrain._SHARED_PRETRAINS
@@ -0,0 +1,101 @@
+"""
+Tests of the dynamic quantization of models and of the quantization comparison tool
+"""
+
+import os
+import tempfile
+
+import pytest
+import torch
+import torch.nn as nn
+
+from stanza.models.common.quantization import quantize_model, DYNAMIC_INT8
+from stanza.models.common.seq2seq_model import Seq2SeqModel
+from stanza.models.langid.model import LangIDBiLSTM
+from stanza.utils import compare_quantization
+
+from stanza.tests import *
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+def build_langid():
+    torch.manual_seed(1234)
+    char_to_idx = {"a": 0, "b": 1, "c": 2, "UNK": 3, "<PAD>": 4}
+    tag_to_idx = {"en": 0, "fr": 1, "de": 2}
+    model = LangIDBiLSTM(char_to_idx, tag_to_idx, num_layers=2, embedding_dim=8, hidden_dim=8)
+    model.eval()
+    return model
+
+def float_layers(model):
+    return [name for name, module in model.named_modules() if type(module) in (nn.LSTM, nn.LSTMCell, nn.Linear)]
+
+def test_quantize_langid():
+    model = build_langid()
+    assert len(float_layers(model)) > 0
+    sequences = torch.tensor([[0, 1, 2, 0, 1], [2, 2, 4, 4, 4]])
+    lengths = torch.tensor([5, 2])
+    with torch.no_grad():
+        expected = model(sequences, lengths)
+        quantize_model(model, DYNAMIC_INT8)
+        result = model(sequences, lengths)
+    assert float_layers(model) == []
+    assert torch.allclose(expected, result, atol=0.05)
+
+def test_quantize_seq2seq():
+    """
+    The seq2seq model has an LSTM encoder and an LSTMCell decoder
+    """
+    torch.manual_seed(1000)
+    args = {'vocab_size': 20, 'emb_dim': 8, 'hidden_dim': 16, 'num_layers': 1, 'dropout': 0.0,
+            'max_dec_len': 10, 'attn_type': 'soft'}
+    model = Seq2SeqModel(args)
+    quantize_model(model)
+    assert float_layers(model) == []
+    src = torch.tensor([[4, 5, 6, 7], [8, 9, 10, 0]])
+    with torch.no_grad():
+        preds, _ = model.predict(src, src.eq(0), beam_size=2)
+    assert len(preds) == 2
+
+def test_quantize_shared():
+    """
+    A module shared by two models is quantized for both, and quantizing again is harmless
+    """
+    shared = build_langid()
+    first = nn.ModuleDict({'langid': shared, 'output': nn.Linear(3, 2)})
+    second = nn.ModuleDict({'langid': shared})
+    quantize_model(first)
+    quantize_model(second)
+    quantize_model(first)
+    assert second['langid'] is shared
+    assert float_layers(first) == []
+    assert float_layers(second) == []
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        quantize_model(build_langid(), "float4")
+
+GOLD = """
+# text = Unban Mox Opal!
+1	Unban	unban	VERB	VB	_	0	root	_	_
+2	Mox	Mox	PROPN	NNP	_	3	compound	_	_
+3	Opal	Opal	PROPN	NNP	_	1	obj	_	SpaceAfter=No
+4	!	!	PUNCT	.	_	1	punct	_	_
+
+# text = It's banned.
+1-2	It's	_	_	_	_	_	_	_	_
+1	It	it	PRON	PRP	_	3	nsubj	_	_
+2	's	be	AUX	VBZ	_	3	aux	_	_
+3	banned	ban	VERB	VBN	_	0	root	_	SpaceAfter=No
+4	.	.	PUNCT	.	_	3	punct	_	_
+""".lstrip()
+
+def test_gold_input():
+    """
+    The comparison tool rebuilds the text or the tokens of the gold file
+    """
+    with tempfile.TemporaryDirectory(dir=f'{TEST_WORKING_DIR}/out') as tempdir:
+        gold_file = os.path.join(tempdir, "gold.conllu")
+        with open(gold_file, "w", encoding="utf-8") as fout:
+            fout.write(GOLD)
+        assert compare_quantization.gold_input(gold_file, pretokenized=False) == "Unban Mox Opal! It's banned."
+        assert compare_quantization.gold_input(gold_file, pretokenized=True) == [["Unban", "Mox", "Opal", "!"], ["It's", "banned", "."]]
@@ -0,0 +1,53 @@
+"""
+Test the decoding of the seq2seq model used by the lemmatizer and MWT expander
+"""
+
+import pytest
+import torch
+
+import stanza.models.common.seq2seq_constant as constant
+from stanza.models.common.seq2seq_model import Seq2SeqModel
+
+pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
+
+def build_model(eos_bias=0.0):
+    torch.manual_seed(1000)
+    args = {'vocab_size': 20, 'emb_dim': 8, 'hidden_dim': 16, 'num_layers': 1, 'dropout': 0.0,
+            'max_dec_len': 10, 'attn_type': 'soft'}
+    model = Seq2SeqModel(args)
+    model.eval()
+    with torch.no_grad():
+        model.dec2vocab.bias[constant.EOS_ID] += eos_bias
+    return model
+
+def build_input():
+    src = torch.tensor([[4, 5, 6, 7],
+                        [8, 9, 10, 0],
+                        [11, 12, 0, 0]])
+    return src, src.eq(constant.PAD_ID)
+
+@pytest.mark.parametrize("beam_size", [1, 3])
+def test_decode_shape(beam_size):
+    """
+    Each sequence is decoded to a list of ints without EOS and at most max_dec_len long
+    """
+    model = build_model()
+    src, src_mask = build_input()
+    with torch.no_grad():
+        preds, _ = model.predict(src, src_mask, beam_size=beam_size)
+    assert len(preds) == 3
+    for pred in preds:
+        assert all(isinstance(x, int) for x in pred)
+        assert constant.EOS_ID not in pred
+        assert len(pred) <= 10
+
+@pytest.mark.parametrize("beam_size", [1, 3])
+def test_decode_eos(beam_size):
+    """
+    If EOS is always the most likely output, every sequence is empty
+    """
+    model = build_model(eos_bias=100.0)
+    src, src_mask = build_input()
+    with torch.no_grad():
+        preds, _ = model.predict(src, src_mask, beam_size=beam_size)
+    assert preds == [[], [], []]
@@ -3,7 +3,14 @@ Basic testing of part of speech tagging
 """
 
 import pytest
+import torch
+
 import stanza
+from stanza.models import tagger
+from stanza.models.common import pretrain
+from stanza.models.pos.data import DataLoader
+from stanza.models.pos.trainer import Trainer, unpack_batch
+from stanza.utils.conll import CoNLL
 
 from stanza.tests import *
 
@@ -26,3 +33,51 @@ def test_part_of_speech():
     nlp = stanza.Pipeline(**{'processors': 'tokenize,pos', 'dir': TEST_MODELS_DIR, 'lang': 'en'})
     doc = nlp(EN_DOC)
     assert EN_DOC_GOLD == '\n\n'.join([sent.tokens_string() for sent in doc.sentences])
+
+TRAIN_DATA = """
+1	This	this	PRON	DT	Number=Sing|PronType=Dem	0	root	_	_
+2	is	be	AUX	VBZ	Mood=Ind|Number=Sing	1	cop	_	_
+3	a	a	DET	DT	Definite=Ind	1	det	_	_
+4	test	test	NOUN	NN	Number=Sing	1	nsubj	_	_
+
+1	Unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	0	root	_	_
+2	Mox	Mox	PROPN	NNP	Number=Sing	1	obj	_	_
+3	Opal	Opal	PROPN	NNP	Number=Sing	2	flat	_	_
+""".strip() + "\n\n"
+
+def build_tiny_trainer():
+    args = vars(tagger.parse_args(["--shorthand", "en_ewt", "--hidden_dim", "10", "--char_hidden_dim", "10",
+                                   "--deep_biaff_hidden_dim", "10", "--composite_deep_biaff_hidden_dim", "10",
+                                   "--transformed_dim", "10", "--word_emb_dim", "10", "--char_emb_dim", "10",
+                                   "--tag_emb_dim", "5"]))
+    pt = pretrain.Pretrain(vec_filename=f'{TEST_WORKING_DIR}/in/tiny_emb.txt', save_to_file=False)
+    doc = CoNLL.conll2doc(input_str=TRAIN_DATA)
+    train_batch = DataLoader(doc, 2, args, pt, evaluation=False)
+    trainer = Trainer(args=args, vocab=train_batch.vocab, pretrain=pt)
+    # the classifiers start at zero, which would make every prediction the same
+    torch.manual_seed(1000)
+    for param in trainer.model.parameters():
+        torch.nn.init.normal_(param)
+    return trainer, DataLoader(doc, 2, args, pt, vocab=train_batch.vocab, evaluation=True)
+
+def test_predict_without_gold():
+    """
+    Predicting skips the loss, but the predictions should be the same as when the gold tags are there
+    """
+    trainer, dev_batch = build_tiny_trainer()
+    model = trainer.model
+    model.eval()
+    for batch in dev_batch:
+        inputs, orig_idx, word_orig_idx, sentlens, wordlens = unpack_batch(batch, False)
+        word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained = inputs
+        with torch.no_grad():
+            loss, gold_preds = model(word, word_mask, wordchars, wordchars_mask, upos, xpos, ufeats, pretrained, word_orig_idx, sentlens, wordlens)
+            no_loss, preds = model(word, word_mask, wordchars, wordchars_mask, None, None, None, pretrained, word_orig_idx, sentlens, wordlens)
+        assert loss is not None
+        assert no_loss is None
+        for gold_pred, pred in zip(gold_preds, preds):
+            assert torch.equal(gold_pred, pred)
+
+        pred_tokens = trainer.predict(batch, unsort=False)
+        expected = [trainer.vocab['upos'].unmap(sent)[:length] for sent, length in zip(gold_preds[0].tolist(), sentlens)]
+        assert [[token[0] for token in sent] for sent in pred_tokens] == expected
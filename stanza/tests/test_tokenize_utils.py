@@ -4,10 +4,14 @@ Very simple test of the sentence slicing by <PAD> tags
 TODO: could add a bunch more simple tests for the tokenization utils
 """
 
+import re
+
+import numpy as np
 import pytest
 import stanza
 
 from stanza.tests import *
+from stanza.models.common.doc import TEXT, START_CHAR, END_CHAR
 from stanza.models.tokenization import utils
 
 pytestmark = [pytest.mark.travis, pytest.mark.pipeline]
@@ -30,3 +34,49 @@ def test_find_spans():
 
     raw = ['<PAD>', 'u', 'n', 'b', 'a', 'n', '<PAD>', 'm', 'o', 'x', ' ', 'o', 'p', 'a', 'l']
     assert utils.find_spans(raw) == [(1, 6), (7, 15)]
+
+def check_skipping_whitespace(text, part, start):
+    """
+    The linear scan should find the same span as the regex it replaces
+    """
+    pattern = re.compile(r'\s*'.join(re.escape(c) for c in part))
+    expected = pattern.search(text, start)
+    expected = expected.span() if expected else None
+    assert utils.find_skipping_whitespace(text, part, start) == expected
+
+def test_find_skipping_whitespace():
+    check_skipping_whitespace("unban mox opal", "mox", 0)
+    check_skipping_whitespace("unban m o x opal", "mox", 0)
+    check_skipping_whitespace("unban m o x opal", " mox", 0)
+    check_skipping_whitespace("unban   m o x opal", "  mox", 3)
+    check_skipping_whitespace("unban m o x opal", "mox", 8)
+    check_skipping_whitespace("unban mo  opal", "  ", 0)
+    check_skipping_whitespace("unban mo  opal", " ", 0)
+    check_skipping_whitespace("mmmox", "mox", 0)
+
+class FakeVocab:
+    lang_replaces_spaces = False
+
+    def unit2id(self, unit):
+        return 1 if unit in ('<UNK>', 'x') else 5
+
+    def normalize_token(self, token):
+        return utils.SPACE_RE.sub(' ', token.lstrip())
+
+def test_decode_predictions():
+    text = "Unban mox.\n\nOpal  x."
+    raw = [list("Unban mox."), list("Opal  x.") + ['<PAD>', '<PAD>']]
+    preds = [np.array([0, 0, 0, 0, 1, 0, 0, 0, 1, 2]),
+             np.array([0, 0, 0, 1, 0, 0, 1, 2])]
+    num_chars, oov_count, doc = utils.decode_predictions(FakeVocab(), None, text, raw, preds)
+    assert num_chars == 18
+    assert oov_count == 2
+    assert [[word[TEXT] for word in sentence] for sentence in doc] == [['Unban', 'mox', '.'], ['Opal', 'x', '.']]
+    assert [(word[START_CHAR], word[END_CHAR]) for word in doc[1]] == [(12, 16), (18, 19), (19, 20)]
+
+    # with skip_newline, the newlines are not part of the raw text, but the offsets are still correct
+    text = "Unban m\nox."
+    raw = [list("Unban mox.")]
+    preds = [np.array([0, 0, 0, 0, 1, 0, 0, 0, 1, 2])]
+    _, _, doc = utils.decode_predictions(FakeVocab(), None, text, raw, preds, skip_newline=True)
+    assert [(word[START_CHAR], word[END_CHAR]) for word in doc[0]] == [(0, 5), (6, 10), (10, 11)]
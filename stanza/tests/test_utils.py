@@ -1,6 +1,7 @@
 import tempfile
 
 import pytest
+import torch
 
 import stanza
 import stanza.models.common.utils as utils
@@ -129,3 +130,15 @@ def test_find_missing_tags():
     assert utils.find_missing_tags(["O", "PER", "LOC"], ["O", "PER", "LOC"]) == []
     assert utils.find_missing_tags(["O", "PER", "LOC"], ["O", "PER", "LOC", "ORG"]) == ['ORG']
     assert utils.find_missing_tags([["O", "PER"], ["O", "LOC"]], [["O", "PER"], ["LOC", "ORG"]]) == ['ORG']
+
+def test_inference_mode():
+    x = torch.ones(3, requires_grad=True)
+    with utils.inference_mode():
+        y = x * 2
+    assert not y.requires_grad
+
+    @utils.inference_mode()
+    def double(z):
+        return z * 2
+    assert not double(x).requires_grad
+    assert (x * 2).requires_grad
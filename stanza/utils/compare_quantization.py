@@ -0,0 +1,100 @@
+"""
+Compare the accuracy and speed of a pipeline with and without quantized models
+
+The text of a gold CoNLL-U file is annotated once with the regular
+models and once with each quantization mode, all on cpu.  Each output
+is scored with the CoNLL 2018 UD scorer against the gold file.
+
+  python3 -m stanza.utils.compare_quantization --lang en --gold_file en_ewt-ud-test.conllu
+
+With --pretokenized, the gold tokens are given to the pipeline, so the
+tagger, lemmatizer and parser scores are not affected by tokenization.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+
+import stanza
+from stanza.models.common.quantization import QUANTIZE_MODES
+from stanza.models.common.utils import ud_scores
+from stanza.resources.common import DEFAULT_MODEL_DIR
+from stanza.utils.conll import CoNLL
+from stanza.utils.helper_func import make_table
+
+METRICS = ["Tokens", "Sentences", "Words", "UPOS", "XPOS", "UFeats", "Lemmas", "UAS", "LAS"]
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Compare a pipeline with and without quantized models")
+    parser.add_argument('--gold_file', required=True, help='CoNLL-U file to annotate and score against')
+    parser.add_argument('--lang', default='en', help='Language of the pipeline')
+    parser.add_argument('--package', default='default', help='Package of the pipeline')
+    parser.add_argument('--processors', default='tokenize,mwt,pos,lemma,depparse', help='Processors of the pipeline')
+    parser.add_argument('--dir', default=DEFAULT_MODEL_DIR, help='Directory of the models')
+    parser.add_argument('--modes', default=",".join(QUANTIZE_MODES), help='Comma separated quantization modes to compare against the regular models')
+    parser.add_argument('--pretokenized', action='store_true', help='Give the gold tokens to the pipeline instead of the raw text')
+    parser.add_argument('--output_dir', default=None, help='Keep the annotated CoNLL-U files in this directory')
+    parser.add_argument('--num_threads', type=int, default=None, help='Number of threads for torch to use')
+    return parser.parse_args(args=args)
+
+def gold_input(gold_file, pretokenized):
+    """
+    The text of the gold file, or its tokens if pretokenized
+    """
+    doc = CoNLL.conll2doc(input_file=gold_file)
+    if pretokenized:
+        return [[token.text for token in sentence.tokens] for sentence in doc.sentences]
+    pieces = []
+    for sentence in doc.sentences:
+        for token in sentence.tokens:
+            pieces.append(token.text)
+            if not token.misc or "SpaceAfter=No" not in token.misc.split("|"):
+                pieces.append(" ")
+    return "".join(pieces).strip()
+
+def run_variant(args, text, quantize, output_file):
+    """
+    Annotate the text, write it to output_file and return the time it took and the number of words
+    """
+    nlp = stanza.Pipeline(lang=args.lang, dir=args.dir, package=args.package, processors=args.processors,
+                          use_gpu=False, quantize=quantize, tokenize_pretokenized=args.pretokenized)
+    start = time.perf_counter()
+    doc = nlp(text)
+    elapsed = time.perf_counter() - start
+    CoNLL.write_doc2conll(doc, output_file)
+    return elapsed, doc.num_words
+
+def compare(args, output_dir):
+    text = gold_input(args.gold_file, args.pretokenized)
+    variants = [None] + [mode for mode in args.modes.split(",") if mode]
+
+    rows = []
+    for quantize in variants:
+        name = quantize if quantize else "float32"
+        output_file = os.path.join(output_dir, "%s.conllu" % name)
+        elapsed, num_words = run_variant(args, text, quantize, output_file)
+        evaluation = ud_scores(args.gold_file, output_file)
+        row = [name, "%.2f" % elapsed, "%.1f" % (num_words / elapsed)]
+        row.extend("%.2f" % (100 * evaluation[metric].f1) for metric in METRICS)
+        rows.append(row)
+    return rows
+
+def main(args=None):
+    args = parse_args(args)
+    if args.num_threads:
+        torch.set_num_threads(args.num_threads)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        rows = compare(args, args.output_dir)
+    else:
+        with tempfile.TemporaryDirectory() as output_dir:
+            rows = compare(args, output_dir)
+
+    print(make_table(["Models", "Seconds", "Words/sec"] + METRICS, rows))
+
+if __name__ == '__main__':
+    main()
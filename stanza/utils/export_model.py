@@ -0,0 +1,132 @@
+"""
+Export the inference graph of a tagger, parser, NER or tokenizer model to TorchScript or ONNX
+
+  python3 -m stanza.utils.export_model --processor pos --model_file saved_models/pos/en_ewt_tagger.pt \
+      --pretrain_file saved_models/pos/en_ewt.pretrain.pt --output en_ewt_tagger.ts
+
+The graph is traced on a few sentences, from --sample_file if given,
+and its predictions on those sentences are checked against the
+original model.  The graph is written to --output, and the vocab and
+the names of the inputs and outputs to --output plus .json.
+
+A pipeline runs an exported graph in place of the original model with
+the exported_path option of the processor, for example
+
+  stanza.Pipeline("en", processors="tokenize,pos", pos_exported_path="en_ewt_tagger.ts", use_gpu=False)
+
+The pipeline still loads the original model for its vocab and settings.
+"""
+
+import argparse
+import logging
+
+from stanza.models.common.export import EXPORT_FORMATS, TORCHSCRIPT, export_model, load_exported, count_differences, predict_calls
+from stanza.models.common.pretrain import Pretrain
+from stanza.utils.conll import CoNLL
+
+logger = logging.getLogger('stanza')
+
+PROCESSORS = ('tokenize', 'pos', 'depparse', 'ner')
+
+# sentences of different lengths, so the packing and sorting in the graph is exercised
+SAMPLE_CONLLU = """
+1	Unban	unban	VERB	VB	Mood=Imp|VerbForm=Fin	0	root	_	_
+2	Mox	Mox	PROPN	NNP	Number=Sing	3	compound	_	_
+3	Opal	Opal	PROPN	NNP	Number=Sing	1	obj	_	SpaceAfter=No
+4	!	!	PUNCT	.	_	1	punct	_	_
+
+1	Chris	Chris	PROPN	NNP	Number=Sing	3	nsubj	_	_
+2	Manning	Manning	PROPN	NNP	Number=Sing	1	flat	_	_
+3	works	work	VERB	VBZ	Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin	0	root	_	_
+4	at	at	ADP	IN	_	6	case	_	_
+5	Stanford	Stanford	PROPN	NNP	Number=Sing	6	compound	_	_
+6	University	University	PROPN	NNP	Number=Sing	3	obl	_	SpaceAfter=No
+7	.	.	PUNCT	.	_	3	punct	_	_
+
+1	It	it	PRON	PRP	Case=Nom|Gender=Neut|Number=Sing|Person=3|PronType=Prs	2	nsubj	_	_
+2	works	work	VERB	VBZ	Mood=Ind|Number=Sing|Person=3|Tense=Pres|VerbForm=Fin	0	root	_	_
+""".lstrip()
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Export a model to TorchScript or ONNX")
+    parser.add_argument('--processor', required=True, choices=PROCESSORS, help='Which kind of model to export')
+    parser.add_argument('--model_file', required=True, help='Model to export')
+    parser.add_argument('--pretrain_file', default=None, help='Pretrained embeddings of a pos or depparse model')
+    parser.add_argument('--charlm_forward_file', default=None, help='Forward charlm of an NER model')
+    parser.add_argument('--charlm_backward_file', default=None, help='Backward charlm of an NER model')
+    parser.add_argument('--format', default=TORCHSCRIPT, choices=EXPORT_FORMATS, help='Format to export to')
+    parser.add_argument('--output', required=True, help='Where to write the exported graph')
+    parser.add_argument('--sample_file', default=None, help='CoNLL-U file of sentences to trace and check the graph with.  A few English sentences are used by default')
+    parser.add_argument('--batch_size', type=int, default=2, help='Batch size for tracing and checking the graph')
+    return parser.parse_args(args=args)
+
+def load_trainer(args):
+    """
+    Returns the trainer and, for pos and depparse, its pretrain
+    """
+    if args.processor == 'tokenize':
+        from stanza.models.tokenization.trainer import Trainer
+        return Trainer(model_file=args.model_file), None
+    if args.processor == 'ner':
+        from stanza.models.ner.trainer import Trainer
+        charlm_args = {'charlm_forward_file': args.charlm_forward_file, 'charlm_backward_file': args.charlm_backward_file}
+        return Trainer(args=charlm_args, model_file=args.model_file), None
+
+    pretrain = Pretrain(args.pretrain_file) if args.pretrain_file else None
+    if args.processor == 'pos':
+        from stanza.models.pos.trainer import Trainer
+    else:
+        from stanza.models.depparse.trainer import Trainer
+    return Trainer(pretrain=pretrain, model_file=args.model_file), pretrain
+
+def tokenize_batches(trainer, doc, batch_size):
+    from stanza.models.tokenization.data import DataLoader
+
+    # each sentence is its own paragraph, as the tokenize processor would see it
+    text = "\n\n".join(sentence.text if sentence.text else " ".join(token.text for token in sentence.tokens)
+                       for sentence in doc.sentences)
+    data = DataLoader(trainer.args, input_text=text, vocab=trainer.vocab, evaluation=True, dictionary=trainer.dictionary)
+    offsets = []
+    start = 0
+    for paragraph in data.sentences:
+        offsets.append(start)
+        start += sum(len(x[0]) for x in paragraph)
+    return [data.next(eval_offsets=offsets[i:i+batch_size]) for i in range(0, len(offsets), batch_size)]
+
+def build_batches(args, trainer, pretrain, doc, batch_size):
+    """
+    The batches the processor would give the trainer for doc
+    """
+    if args.processor == 'tokenize':
+        return tokenize_batches(trainer, doc, batch_size)
+    if args.processor == 'ner':
+        from stanza.models.ner.data import DataLoader
+        return list(DataLoader(doc, batch_size, trainer.args, vocab=trainer.vocab, evaluation=True, preprocess_tags=False, sort_during_eval=True))
+    if args.processor == 'pos':
+        from stanza.models.pos.data import DataLoader
+    else:
+        from stanza.models.depparse.data import DataLoader
+    return list(DataLoader(doc, batch_size, trainer.args, pretrain, vocab=trainer.vocab, evaluation=True, sort_during_eval=True))
+
+def main(args=None):
+    args = parse_args(args)
+    trainer, pretrain = load_trainer(args)
+    if args.sample_file:
+        doc = CoNLL.conll2doc(input_file=args.sample_file)
+    else:
+        doc = CoNLL.conll2doc(input_str=SAMPLE_CONLLU)
+
+    batches = build_batches(args, trainer, pretrain, doc, args.batch_size)
+    export_model(trainer.model, trainer.vocab, predict_calls(trainer, batches[:1])[0], args.output, args.format)
+
+    # check the graph on batches of other shapes than the one it was traced with
+    exported = load_exported(args.output, trainer.vocab)
+    batches = batches + build_batches(args, trainer, pretrain, doc, 1) + build_batches(args, trainer, pretrain, doc, len(doc.sentences))
+    differences = count_differences(trainer, exported, batches)
+    if differences > 0:
+        logger.warning("The exported graph gave different predictions from the original model on %d of %d batches", differences, len(batches))
+    else:
+        logger.info("The exported graph gave the same predictions as the original model on %d batches", len(batches))
+
+if __name__ == '__main__':
+    main()